@@ -0,0 +1,175 @@
+"""
+Inspección de la base de datos SQLite sin cargarla en memoria
+
+Uso:
+  python admin.py summary [--exact]          Archivo, páginas y filas por tabla
+  python admin.py subjects [--cursor ID]     Temas, PDFs y sesiones por materia
+  python admin.py space                      Espacio por tabla e índice (dbstat)
+  python admin.py contents [--subject ID]    PDFs cargados, sin su texto
+  python admin.py show ID [--offset N]       Un tramo del texto de un PDF
+  python admin.py plans [--top N]            Lecturas de la API más lentas y su plan
+
+Abre la base de datos en solo lectura, así que se puede usar con la API en
+marcha. Los listados se paginan: cada página indica el --cursor o --offset
+de la siguiente.
+"""
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src import inspection
+
+
+def human_bytes(value) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def print_table(rows, columns):
+    """Imprimir filas alineadas en columnas"""
+    if not rows:
+        print("(sin filas)")
+        return
+    cells = [[("-" if row.get(column) is None else str(row.get(column))) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    print("  ".join("-" * width for width in widths))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+
+def mark_estimates(rows):
+    """Anteponer ≈ a los conteos de filas estimados"""
+    for row in rows:
+        if row.get("estimated"):
+            row["rows"] = f"≈{row['rows']}"
+    return rows
+
+
+def print_next(option: str, value):
+    if value is not None:
+        print(f"\nSiguiente página: {option} {value}")
+
+
+def cmd_summary(conn, args):
+    summary = inspection.database_summary(conn, args.db, exact=args.exact)
+    print(f"Archivo:      {args.db} ({human_bytes(summary['file_bytes'])}, WAL {human_bytes(summary['wal_bytes'])})")
+    print(f"Páginas:      {summary['page_count']} x {summary['page_size']} B, {summary['freelist_pages']} libres")
+    print(f"Journal:      {summary['journal_mode']} (SQLite {summary['sqlite_version']})")
+    label = "filas" if summary['rows_exact'] else "filas (≈: estimadas por MAX(rowid); --exact para contar)"
+    print(f"\nTablas, {label}:")
+    print_table(mark_estimates(summary['tables']), ["table", "rows"])
+
+
+def cmd_subjects(conn, args):
+    page, next_cursor = inspection.subject_summary(conn, limit=args.limit, cursor=args.cursor)
+    print_table(page, ["id", "name", "topics", "pdfs", "sessions", "last_session"])
+    print_next("--cursor", next_cursor)
+
+
+def cmd_space(conn, args):
+    usage = inspection.space_usage(conn)
+    for row in usage:
+        row["size"] = human_bytes(row["bytes"])
+        row["used"] = (
+            f"{100 * row['payload'] / row['bytes']:.0f}%" if row.get("payload") is not None and row["bytes"] else None
+        )
+    columns = ["name", "type", "table", "pages", "size", "used"]
+    if usage and "rows" in usage[-1]:
+        print("dbstat no está disponible en este SQLite: solo el total y las filas estimadas\n")
+        columns = ["name", "type", "pages", "size", "rows"]
+        mark_estimates(usage)
+    print_table(usage[:args.limit], columns)
+
+
+def cmd_contents(conn, args):
+    page, next_cursor = inspection.list_contents(conn, subject_id=args.subject, limit=args.limit, cursor=args.cursor)
+    for row in page:
+        row["size"] = human_bytes(row["bytes"])
+    print_table(page, ["id", "subject_name", "topic_id", "topic_name", "source_file", "size", "created_at"])
+    print_next("--cursor", next_cursor)
+
+
+def cmd_show(conn, args):
+    try:
+        part = inspection.read_content(conn, args.id, offset=args.offset, size=args.bytes)
+    except KeyError:
+        sys.exit(f"No existe el contenido {args.id}")
+    end = part['next_offset'] if part['next_offset'] is not None else part['total_bytes']
+    print(f"Contenido {part['id']}: bytes {part['offset']}-{end} de {part['total_bytes']}")
+    print("-" * 80)
+    print(part['text'])
+    print("-" * 80)
+    if part['next_offset'] is not None:
+        print(f"Siguiente tramo: python admin.py show {args.id} --offset {part['next_offset']}")
+
+
+def cmd_plans(conn, args):
+    for result in inspection.query_plans(args.db, top=args.top, repeat=args.repeat):
+        print(f"{result['method']}: {result['ms']} ms")
+        for sql, plan in zip(result['statements'], result.get('plans', [])):
+            print(f"  {' '.join(sql.split())[:200]}")
+            for detail in plan:
+                print(f"    -> {detail}")
+        print()
+
+
+COMMANDS = {
+    "summary": cmd_summary,
+    "subjects": cmd_subjects,
+    "space": cmd_space,
+    "contents": cmd_contents,
+    "show": cmd_show,
+    "plans": cmd_plans,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspeccionar la base de datos SQLite en solo lectura")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "data/study_agent.db"), help="Archivo SQLite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summary = commands.add_parser("summary", help="Archivo, páginas y filas por tabla")
+    summary.add_argument("--exact", action="store_true", help="Contar las filas con COUNT(*) (recorre las tablas)")
+
+    subjects = commands.add_parser("subjects", help="Temas, PDFs y sesiones por materia")
+    subjects.add_argument("--limit", type=int, default=20)
+    subjects.add_argument("--cursor", type=int)
+
+    space = commands.add_parser("space", help="Espacio por tabla e índice")
+    space.add_argument("--limit", type=int, default=50)
+
+    contents = commands.add_parser("contents", help="PDFs cargados, sin su texto")
+    contents.add_argument("--subject", type=int)
+    contents.add_argument("--limit", type=int, default=20)
+    contents.add_argument("--cursor", type=int)
+
+    show = commands.add_parser("show", help="Un tramo del texto de un PDF")
+    show.add_argument("id", type=int)
+    show.add_argument("--offset", type=int, default=0, help="Byte desde el que leer")
+    show.add_argument("--bytes", type=int, default=4096, help="Bytes por tramo")
+
+    plans = commands.add_parser("plans", help="Lecturas de la API más lentas y su plan")
+    plans.add_argument("--top", type=int, default=10)
+    plans.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+    try:
+        conn = inspection.connect_readonly(args.db)
+    except FileNotFoundError:
+        sys.exit(f"No existe la base de datos {args.db}")
+    try:
+        COMMANDS[args.command](conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
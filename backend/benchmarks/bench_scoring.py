@@ -0,0 +1,69 @@
+"""
+Benchmark de la puntuación de prioridad: ruta escalar vs. columnar (NumPy)
+
+Uso: python benchmarks/bench_scoring.py [num_temas] [limite]
+"""
+import calendar
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src import scoring
+from src.agent import StudyAgent
+
+
+def synthetic_rows(n: int, seed: int = 42):
+    """Generar tuplas con la misma forma que Database.get_topic_stats_columns"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    rows = []
+    for topic_id in range(n, 0, -1):
+        count = rng.choice([0, 0, 1, 2, 5, 12])
+        if count:
+            last = now - timedelta(seconds=rng.randint(0, 60 * 86400))
+            last_epoch = calendar.timegm(last.timetuple())
+            avg = rng.choice([0.0, 1 / 3, 0.5, 2 / 3, 0.75, 1.0, rng.random()])
+        else:
+            last_epoch, avg = -1, -1.0
+        rows.append((topic_id, topic_id % 50, rng.random() < 0.3, count, last_epoch, avg))
+    return rows
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rows = synthetic_rows(n)
+
+    # El puntuador escalar no necesita el cliente del LLM
+    agent = StudyAgent.__new__(StudyAgent)
+
+    start = time.perf_counter()
+    scalar = agent._recommend_scalar(rows, limit)
+    scalar_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    columns = scoring.TopicColumns(rows)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    vectorized = scoring.recommend(columns, limit)
+    score_ms = (time.perf_counter() - start) * 1000
+
+    print(f"temas: {n}, limite: {limit}")
+    print(f"escalar:      {scalar_ms:8.1f} ms")
+    print(f"columnar:     {load_ms:8.1f} ms carga + {score_ms:.1f} ms puntuación")
+    print(f"resultados idénticos: {scalar == vectorized}")
+    if scalar != vectorized:
+        for a, b in zip(scalar, vectorized):
+            if a != b:
+                print("  escalar: ", a)
+                print("  columnar:", b)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
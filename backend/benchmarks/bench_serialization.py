@@ -0,0 +1,110 @@
+"""
+Benchmark de serialización de listados: ruta de FastAPI vs. ruta rápida
+
+La ruta de FastAPI valida cada fila contra el response_model, la vuelve a
+volcar a tipos JSON y la codifica con json; la ruta rápida convierte las filas
+en registros con __slots__ y las codifica con orjson (FAST_JSON=1).
+
+Uso: python benchmarks/bench_serialization.py [num_filas] [repeticiones]
+"""
+import json
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from src import fast_json
+from src.models import Topic
+from src.records import TopicRecord, to_records
+
+
+def synthetic_topics(n: int, seed: int = 42):
+    """Filas con la misma forma que Database.get_topics_by_subject"""
+    rng = random.Random(seed)
+    return [
+        {
+            'id': topic_id,
+            'subject_id': 1,
+            'name': f"Tema {topic_id}",
+            'description': "Descripción del tema " * rng.randint(0, 4) or None,
+            'created_at': f"2025-01-{rng.randint(1, 28):02d} 10:{rng.randint(0, 59):02d}:00",
+            'has_content': rng.randint(0, 1)
+        }
+        for topic_id in range(n, 0, -1)
+    ]
+
+
+def synthetic_history(n: int, seed: int = 7):
+    """Filas con la misma forma que Database.get_study_history"""
+    rng = random.Random(seed)
+    return [
+        {
+            'id': session_id,
+            'topic_id': rng.randint(1, 200),
+            'duration': rng.choice([5, 10, 15]),
+            'score': rng.randint(0, 3),
+            'total_questions': 3,
+            'completed_at': f"2025-02-{rng.randint(1, 28):02d} 18:{rng.randint(0, 59):02d}:00",
+            'subject_id': 1,
+            'topic_name': f"Tema {rng.randint(1, 200)}",
+            'subject_name': "Materia"
+        }
+        for session_id in range(n, 0, -1)
+    ]
+
+
+def cpu_ms(func, repeat: int) -> float:
+    """Tiempo de CPU medio por llamada en milisegundos"""
+    func()
+    start = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - start) * 1000 / repeat
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    topics = synthetic_topics(n)
+    history = synthetic_history(n)
+    topic_adapter = TypeAdapter(List[Topic])
+
+    def fastapi_topics():
+        # Lo que hace FastAPI con response_model=List[Topic]
+        value = topic_adapter.validate_python(topics)
+        return JSONResponse(topic_adapter.dump_python(value, mode="json")).body
+
+    def fast_topics():
+        return fast_json.FastJSONResponse(to_records(TopicRecord, topics)).body
+
+    def fastapi_history():
+        # Sin response_model FastAPI recorre las filas con jsonable_encoder
+        return JSONResponse(jsonable_encoder(history)).body
+
+    def fast_history():
+        return fast_json.FastJSONResponse(history).body
+
+    print(f"filas: {n}, repeticiones: {repeat}, orjson: {fast_json.orjson is not None}")
+    for label, slow, fast in (
+        ("temas", fastapi_topics, fast_topics),
+        ("historial", fastapi_history, fast_history),
+    ):
+        same = json.loads(slow()) == json.loads(fast())
+        slow_ms = cpu_ms(slow, repeat)
+        fast_ms = cpu_ms(fast, repeat)
+        print(f"{label:10} FastAPI: {slow_ms:8.2f} ms  rápida: {fast_ms:8.2f} ms  "
+              f"({slow_ms / fast_ms:.1f}x)  JSON equivalente: {same}")
+        if not same:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
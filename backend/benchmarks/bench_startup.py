@@ -0,0 +1,61 @@
+"""
+Medición del arranque en frío de la API
+
+Lanza procesos nuevos que importan la aplicación y esperan a que /ready
+responda, e indica qué módulos pesados quedaron cargados.
+
+Uso: python benchmarks/bench_startup.py [repeticiones]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Se ejecuta en un proceso nuevo para medir un arranque en frío real
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    status = client.get("/ready").status_code
+    ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+    "ready_status": status,
+    "heavy_modules": [m for m in ("openai", "pypdf", "tenacity", "numpy") if m in sys.modules],
+}))
+"""
+
+
+def run_once(db_path: str) -> dict:
+    env = dict(os.environ, DATABASE_PATH=db_path, LOG_LEVEL="warning")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [run_once(os.path.join(tmp, f"startup_{i}.db")) for i in range(repeat)]
+
+    import_ms = [run["import_ms"] for run in runs]
+    ready_ms = [run["ready_ms"] for run in runs]
+    print(f"repeticiones: {repeat}")
+    print(f"import main:   mediana {statistics.median(import_ms):7.1f} ms  (min {min(import_ms):.1f})")
+    print(f"hasta /ready:  mediana {statistics.median(ready_ms):7.1f} ms  (min {min(ready_ms):.1f})")
+    print(f"estado /ready: {sorted({run['ready_status'] for run in runs})}")
+    print(f"módulos pesados cargados: {runs[-1]['heavy_modules'] or 'ninguno'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Exportar e importar materias, temas, contenido, sesiones y estado de repaso en JSONL
+
+Uso:
+  python dataset.py export [-o datos.jsonl.gz] [--subject ID ...]
+  python dataset.py import datos.jsonl.gz [--remap-ids] [--subject ID ...]
+
+La base de datos es la de la API (DATABASE_PATH o DATABASE_URL). Los archivos
+terminados en .gz se comprimen y descomprimen al vuelo; "-" es la salida o
+entrada estándar.
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.cache import create_database
+from src.transfer import DatasetImporter, export_records
+
+
+def open_output(path: str):
+    if path == "-":
+        return sys.stdout.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, "wb", compresslevel=1)
+    return open(path, "wb", buffering=1024 * 1024)
+
+
+def open_input(path: str):
+    if path == "-":
+        return sys.stdin.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb", buffering=1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar e importar el conjunto de datos en JSONL")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "data/study_agent.db"), help="Archivo SQLite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Escribir los datos en JSONL")
+    export_parser.add_argument("-o", "--output", default="-", help="Archivo de salida (.jsonl o .jsonl.gz)")
+    export_parser.add_argument("--subject", type=int, action="append", help="Exportar solo esta materia (repetible)")
+    export_parser.add_argument("--page-size", type=int, default=5000)
+
+    import_parser = commands.add_parser("import", help="Cargar un JSONL exportado")
+    import_parser.add_argument("input", help="Archivo de entrada (.jsonl o .jsonl.gz)")
+    import_parser.add_argument("--remap-ids", action="store_true", help="Asignar ids nuevos en lugar de conservar los del archivo")
+    import_parser.add_argument("--subject", type=int, action="append", help="Importar solo esta materia (id del archivo, repetible)")
+    import_parser.add_argument("--batch-size", type=int, default=5000, help="Filas por executemany")
+    import_parser.add_argument("--commit-every", type=int, default=100000, help="Filas por transacción")
+
+    args = parser.parse_args()
+    database = create_database(args.db)
+    start = time.perf_counter()
+    try:
+        if args.command == "export":
+            out = open_output(args.output)
+            try:
+                counts = export_records(database, out, args.subject, args.page_size)
+            finally:
+                if out is not sys.stdout.buffer:
+                    out.close()
+            summary = ", ".join(f"{record_type}: {count}" for record_type, count in counts.items())
+        else:
+            importer = DatasetImporter(
+                database,
+                remap_ids=args.remap_ids,
+                subject_ids=args.subject,
+                batch_size=args.batch_size,
+                commit_every=args.commit_every
+            )
+            with open_input(args.input) as lines:
+                counts = importer.run(lines)
+            summary = ", ".join(
+                f"{record_type}: {count['inserted']}/{count['read']}" for record_type, count in counts.items()
+            )
+    finally:
+        database.close()
+    print(f"{args.command} ({time.perf_counter() - start:.1f}s) {summary}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""
+Configuración de gunicorn para servir la API con varios workers (Linux/macOS)
+
+Uso: gunicorn -c gunicorn.conf.py main:app
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Cada worker importa la aplicación después del fork: sin conexiones, hilos ni
+# mapas de memoria heredados del proceso maestro
+preload_app = False
+
+# Las sesiones se generan con el LLM y pueden tardar
+timeout = int(os.getenv("WORKER_TIMEOUT", "180"))
+graceful_timeout = 30
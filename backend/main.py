@@ -1,9 +1,15 @@
 """
 FastAPI backend principal para el agente de estudio
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
 from typing import List, Optional
+import asyncio
+import json
+import math
+import time
 import uvicorn
 from dotenv import load_dotenv
 import os
@@ -13,13 +19,51 @@ load_dotenv()
 
 from src.models import (
     Subject, Topic, StudySession, QuizResult,
-    SubjectCreate, TopicCreate, SessionRequest, SessionResponse
+    SubjectCreate, TopicCreate, SessionRequest, SessionResponse,
+    BatchSessionRequest
 )
-from src.database import Database
-from src.agent import StudyAgent
-from src.pdf_processor import PDFProcessor
+from src.admin_auth import require_admin
+from src.analytics import INTERVALS, build_analytics, resolve_range
+from src.cache import cache_enabled
+from src.completion_buffer import completion_buffer_enabled
+from src.container import Container
+from src.circuit_breaker import CircuitOpenError
+from src.digest import digest_enabled
+from src.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnected, cancel_on_disconnect, cancel_on_disconnect_enabled
+from src.llm_service import LLMNotConfiguredError
+from src import telemetry
+from src.telemetry import span
+from src.usage import load_pricing, summarize_usage
+from src.memory import UPLOADS, MemoryMiddleware, compare_snapshots, describe_snapshot, top_allocations
+from src.pdf_processor import DocumentTooLargeError
+from src.profiling import ProfilingMiddleware
+from src.pagination import clamp_limit, split_page
+from src.http_cache import make_etag, check_not_modified
+from src.fast_json import fast_json_enabled, fast_response, model_response
+from src.session_store import STORED_SESSIONS, unpack_session
+from src.records import SubjectRecord, TopicRecord, to_records
 
-app = FastAPI(title="Study Sprint Agent API", version="1.0.0")
+logger = telemetry.get_logger("api")
+
+# Los componentes se crean al primer uso; importar este módulo no abre la base de datos
+container = Container()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicializar el logging y la base de datos al arrancar y vaciar lo pendiente al detenerse"""
+    # Se configura aquí para que cada arranque tenga su hilo de logs y shutdown_logging lo detenga
+    telemetry.configure_logging()
+    container.startup()
+    try:
+        yield
+    finally:
+        await container.shutdown()
+        telemetry.shutdown_logging()
+
+
+app = FastAPI(title="Study Sprint Agent API", version="1.0.0", lifespan=lifespan)
+app.state.container = container
 
 # Configurar CORS para permitir peticiones desde el frontend
 app.add_middleware(
@@ -30,16 +74,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializar componentes
-db = Database()
-agent = StudyAgent(db)
-pdf_processor = PDFProcessor()
+# Perfilado bajo demanda (X-Profile o PROFILE_SAMPLE_RATE); queda dentro de trace_requests
+app.add_middleware(ProfilingMiddleware, store=lambda: container.profiles)
+# Pico de memoria de una fracción de las peticiones (MEMORY_TRACE_SAMPLE_RATE)
+app.add_middleware(MemoryMiddleware, tracer=lambda: container.heap)
 
+# Tamaño de página por defecto del historial
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+# Segundos de validez del ETag de recomendaciones (los vencimientos dependen de la hora)
+RECOMMENDATIONS_ETAG_SECONDS = int(os.getenv("RECOMMENDATIONS_ETAG_SECONDS", "300"))
+# Ruta rápida de serialización (orjson y sin revalidar con response_model)
+FAST_JSON = fast_json_enabled()
+# Resumen map-reduce de los PDFs al subirlos (DIGEST_ENABLED)
+DIGEST_ENABLED = digest_enabled()
+# Escritura diferida de /session/complete (COMPLETION_BUFFER_ENABLED)
+COMPLETION_BUFFER_ENABLED = completion_buffer_enabled()
+# Cancelar la generación si el cliente se desconecta (CANCEL_ON_DISCONNECT)
+CANCEL_ON_DISCONNECT = cancel_on_disconnect_enabled()
+# Tamaño máximo de un PDF subido a /upload
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# Los PDFs mayores se leen desde el archivo temporal de la subida en vez de cargarse en memoria
+UPLOAD_MEMORY_BUDGET_BYTES = int(os.getenv("UPLOAD_MEMORY_BUDGET_BYTES", str(8 * 1024 * 1024)))
+# Agrupaciones de tracemalloc aceptadas por /admin/memory
+HEAP_GROUPINGS = ("lineno", "filename", "traceback")
 
-@app.on_event("startup")
-async def startup_event():
-    """Inicializar la base de datos al arrancar la aplicación"""
-    db.initialize()
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Asignar un id a cada petición, medir sus fases y exportar métricas"""
+    tokens = telemetry.start_request(request.headers.get("X-Request-ID"))
+    request_id = telemetry.request_id_var.get()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        phases = telemetry.finish_request(tokens)
+        # Usar la plantilla de la ruta para no disparar la cardinalidad de etiquetas
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        telemetry.HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status_code)
+        telemetry.HTTP_LATENCY.observe(elapsed, method=request.method, route=route_path)
+        summary = telemetry.summarize_phases(phases)
+        logger.info("request", extra={"fields": {
+            "request_id": request_id,
+            "method": request.method,
+            "route": route_path,
+            "status": status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "phases": summary
+        }})
+    
+    response.headers["X-Request-ID"] = request_id
+    if summary:
+        response.headers["Server-Timing"] = telemetry.server_timing_header(summary)
+    return response
 
 
 @app.get("/")
@@ -48,22 +139,81 @@ async def root():
     return {"message": "Study Sprint Agent API", "status": "running"}
 
 
+@app.get("/health")
+async def health():
+    """Liveness: el proceso está vivo y atiende peticiones"""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: la base de datos está inicializada y accesible"""
+    status = container.readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Exportar métricas en formato de texto Prometheus"""
+    return PlainTextResponse(
+        telemetry.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/cache/stats", dependencies=[Depends(require_admin)])
+async def cache_stats():
+    """Estadísticas de las caches en memoria (vacío si están desactivadas)"""
+    caches = [getattr(container.db, "cache", None), container.recommendation_cache]
+    return {"enabled": cache_enabled(), "caches": [cache.stats() for cache in caches if cache is not None]}
+
+
 @app.post("/subjects", response_model=Subject)
 async def create_subject(subject: SubjectCreate):
     """Crear una nueva materia"""
-    return db.create_subject(subject.name, subject.description)
+    return container.db.create_subject(subject.name, subject.description)
+
+
+def set_next_page_headers(request: Request, response: Response, next_cursor: Optional[str]):
+    """Publicar el cursor de la página siguiente en X-Next-Cursor y Link"""
+    if next_cursor:
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
 
 
 @app.get("/subjects", response_model=List[Subject])
-async def get_subjects():
-    """Obtener todas las materias"""
-    return db.get_all_subjects()
+async def get_subjects(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """Obtener las materias (paginable con limit/cursor; sin limit se devuelven todas)"""
+    etag = make_etag("subjects", container.db.get_subject_version(0), request.url.query)
+    not_modified = check_not_modified(request, response, "/subjects", etag)
+    if not_modified:
+        return not_modified
+    
+    try:
+        limit = clamp_limit(limit, default=None)
+        rows = container.db.get_all_subjects(limit=limit, cursor_token=cursor, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    page, next_cursor = split_page(rows, limit, "created_at")
+    set_next_page_headers(request, response, next_cursor)
+    if FAST_JSON:
+        return fast_response(to_records(SubjectRecord, page), response)
+    return page
 
 
 @app.get("/subjects/{subject_id}", response_model=Subject)
 async def get_subject(subject_id: int):
     """Obtener una materia específica"""
-    subject = db.get_subject(subject_id)
+    subject = container.db.get_subject(subject_id)
     if not subject:
         raise HTTPException(status_code=404, detail="Subject not found")
     return subject
@@ -72,17 +222,40 @@ async def get_subject(subject_id: int):
 @app.post("/subjects/{subject_id}/topics", response_model=Topic)
 async def create_topic(subject_id: int, topic: TopicCreate):
     """Crear un nuevo tema para una materia"""
-    subject = db.get_subject(subject_id)
+    subject = container.db.get_subject(subject_id)
     if not subject:
         raise HTTPException(status_code=404, detail="Subject not found")
     
-    return db.create_topic(subject_id, topic.name, topic.description)
+    return container.db.create_topic(subject_id, topic.name, topic.description)
 
 
 @app.get("/subjects/{subject_id}/topics", response_model=List[Topic])
-async def get_topics(subject_id: int):
-    """Obtener todos los temas de una materia"""
-    return db.get_topics_by_subject(subject_id)
+async def get_topics(
+    subject_id: int,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """Obtener los temas de una materia (paginable con limit/cursor; sin limit se devuelven todos)"""
+    etag = make_etag("topics", subject_id, container.db.get_subject_version(subject_id), request.url.query)
+    not_modified = check_not_modified(request, response, "/subjects/{subject_id}/topics", etag)
+    if not_modified:
+        return not_modified
+    
+    try:
+        limit = clamp_limit(limit, default=None)
+        rows = container.db.get_topics_by_subject(subject_id, limit=limit, cursor_token=cursor, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    page, next_cursor = split_page(rows, limit, "created_at")
+    set_next_page_headers(request, response, next_cursor)
+    if FAST_JSON:
+        return fast_response(to_records(TopicRecord, page), response)
+    return page
 
 
 @app.post("/subjects/{subject_id}/topics/{topic_id}/upload")
@@ -91,74 +264,354 @@ async def upload_material(subject_id: int, topic_id: int, file: UploadFile = Fil
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Leer y procesar el PDF
-    content = await file.read()
-    extracted_text = pdf_processor.extract_text(content)
+    # Leer y procesar el PDF, dentro del presupuesto de memoria
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+    if size > UPLOAD_MAX_BYTES:
+        UPLOADS.inc(mode="rejected")
+        raise HTTPException(status_code=413, detail=f"PDF exceeds {UPLOAD_MAX_BYTES} bytes")
+    if size > UPLOAD_MEMORY_BUDGET_BYTES:
+        UPLOADS.inc(mode="stream")
+        file.file.seek(0)
+        source = file.file
+    else:
+        UPLOADS.inc(mode="memory")
+        source = await file.read()
+    try:
+        extracted_text = container.pdf_processor.extract_text(source)
+    except DocumentTooLargeError as e:
+        UPLOADS.inc(mode="rejected")
+        raise HTTPException(status_code=413, detail=str(e))
     
     if not extracted_text:
         raise HTTPException(status_code=400, detail="Could not extract text from PDF")
     
     # Guardar el contenido del PDF
-    db.save_topic_content(topic_id, extracted_text, file.filename)
+    container.db.save_topic_content(topic_id, extracted_text, file.filename)
+    
+    # Resumir el documento en segundo plano para las próximas sesiones
+    if DIGEST_ENABLED:
+        topic = container.db.get_topic(topic_id)
+        if topic:
+            container.agent.digests.schedule(topic)
     
     return {"message": "Material uploaded successfully", "filename": file.filename}
 
 
+@app.post("/subjects/{subject_id}/import")
+async def import_materials(subject_id: int, files: List[UploadFile] = File(...), create_topics: bool = True):
+    """Importar varios PDFs o ZIPs de PDFs; cada archivo va al tema con su nombre"""
+    if not container.db.get_subject(subject_id):
+        raise HTTPException(status_code=404, detail="Subject not found")
+    
+    results = await container.importer.import_files(subject_id, files, create_topics=create_topics)
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    if DIGEST_ENABLED:
+        for topic_id in {result["topic_id"] for result in results if result["status"] == "ok"}:
+            topic = container.db.get_topic(topic_id)
+            if topic:
+                container.agent.digests.schedule(topic)
+    return {"results": results, **counts}
+
+
 @app.post("/session/generate", response_model=SessionResponse)
-async def generate_session(request: SessionRequest):
+async def generate_session(request: SessionRequest, http_request: Request):
     """Generar una nueva sesión de estudio"""
+    generation = container.agent.generate_study_session(
+        subject_id=request.subject_id,
+        topic_id=request.topic_id,
+        duration=request.duration
+    )
     try:
-        print(f"\n=== GENERATING SESSION ===")
-        print(f"Subject ID: {request.subject_id}")
-        print(f"Topic ID: {request.topic_id}")
-        print(f"Duration: {request.duration}")
-        
-        session = await agent.generate_study_session(
-            subject_id=request.subject_id,
-            topic_id=request.topic_id,
-            duration=request.duration
+        if CANCEL_ON_DISCONNECT:
+            session = await cancel_on_disconnect(http_request, generation, "/session/generate")
+        else:
+            session = await generation
+    except ClientDisconnected:
+        # Nadie va a leer la respuesta
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except LLMNotConfiguredError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except CircuitOpenError as e:
+        # Sin sesión anterior ni material con que servir en modo degradado
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
         )
-        
-        print(f"\n=== SESSION GENERATED ===")
-        print(f"Topic: {session.topic_name}")
-        print(f"Learning Objective: {session.learning_objective[:100]}...")
-        print(f"Content Length: {len(session.content)} chars")
-        print(f"Key Concepts: {len(session.key_concepts)} items")
-        print(f"Quiz Questions: {len(session.quiz)} questions")
-        
-        return session
     except Exception as e:
-        print(f"\n=== ERROR GENERATING SESSION ===")
-        print(f"Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error generating session", extra={"fields": {
+            "subject_id": request.subject_id,
+            "topic_id": request.topic_id,
+            "duration": request.duration
+        }})
         raise HTTPException(status_code=500, detail=str(e))
+    
+    # Serializar explícitamente para medir el coste como fase propia
+    with span("serialize"):
+        if FAST_JSON:
+            return model_response(session)
+        payload = session.model_dump(mode="json")
+        return JSONResponse(payload)
+
+
+@app.post("/sessions/batch")
+async def generate_session_batch(request: BatchSessionRequest):
+    """Generar varias sesiones en paralelo y devolverlas como NDJSON a medida que terminan"""
+    # Limitar la concurrencia pedida al máximo configurado
+    max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    concurrency = min(
+        request.concurrency or int(os.getenv("BATCH_CONCURRENCY", "4")),
+        max_concurrency
+    )
+    items = [(item.topic_id, item.duration) for item in request.items]
+    
+    async def stream():
+        async for index, session, error in container.agent.generate_study_sessions(
+            subject_id=request.subject_id,
+            items=items,
+            concurrency=concurrency
+        ):
+            topic_id, duration = items[index]
+            line = {"index": index, "topic_id": topic_id, "duration": duration}
+            if error is None:
+                line["status"] = "ok"
+                line["session"] = session.model_dump(mode="json")
+            else:
+                line["status"] = "error"
+                line["error"] = str(error)
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: int, request: Request, response: Response):
+    """Reanudar una sesión generada sin volver a llamar al LLM"""
+    # Las sesiones guardadas no cambian: el id basta como ETag
+    etag = make_etag("session", session_id)
+    not_modified = check_not_modified(request, response, "/sessions/{session_id}", etag)
+    if not_modified:
+        return not_modified
+    
+    stored = container.db.get_generated_session(session_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Session not found")
+    session = unpack_session(stored)
+    STORED_SESSIONS.inc(operation="load")
+    return session
 
 
 @app.post("/session/complete")
 async def complete_session(result: QuizResult):
     """Registrar la finalización de una sesión de estudio"""
-    db.record_session_completion(
+    if result.session_id is not None:
+        stored = container.db.get_generated_session(result.session_id)
+        if not stored or stored['topic_id'] != result.topic_id:
+            raise HTTPException(status_code=404, detail="Session not found")
+    if COMPLETION_BUFFER_ENABLED:
+        # Confirmada en el registro local; se escribe en la base de datos con el siguiente lote
+        await container.completions.submit({
+            "topic_id": result.topic_id,
+            "duration": result.duration,
+            "score": result.score,
+            "total_questions": result.total_questions,
+            "generated_session_id": result.session_id,
+            "answers": [answer.model_dump() for answer in result.answers]
+        })
+        return {"message": "Session recorded successfully"}
+    
+    container.db.record_session_completion(
         topic_id=result.topic_id,
         duration=result.duration,
         score=result.score,
-        total_questions=result.total_questions
+        total_questions=result.total_questions,
+        generated_session_id=result.session_id
     )
+    if result.answers:
+        container.db.record_quiz_answers(result.topic_id, [answer.model_dump() for answer in result.answers])
     return {"message": "Session recorded successfully"}
 
 
 @app.get("/history/{subject_id}")
-async def get_study_history(subject_id: int):
-    """Obtener el historial de estudio de una materia"""
-    return db.get_study_history(subject_id)
+async def get_study_history(
+    subject_id: int,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """Obtener el historial de estudio de una materia, paginado por cursor"""
+    etag = make_etag("history", subject_id, container.db.get_subject_version(subject_id), request.url.query)
+    not_modified = check_not_modified(request, response, "/history/{subject_id}", etag)
+    if not_modified:
+        return not_modified
+    
+    try:
+        limit = clamp_limit(limit, default=HISTORY_PAGE_SIZE)
+        rows = container.db.get_study_history(subject_id, limit=limit, cursor_token=cursor, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    page, next_cursor = split_page(rows, limit, "completed_at")
+    set_next_page_headers(request, response, next_cursor)
+    if FAST_JSON:
+        return fast_response(page, response)
+    return page
+
+
+@app.get("/analytics/{subject_id}")
+async def get_analytics(
+    subject_id: int,
+    request: Request,
+    response: Response,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    interval: str = "day",
+    topic_id: Optional[int] = None
+):
+    """Serie de sesiones, minutos y acierto de una materia (o de un tema) por día, semana o mes"""
+    if not container.db.get_subject(subject_id):
+        raise HTTPException(status_code=404, detail="Subject not found")
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of: {', '.join(INTERVALS)}")
+    try:
+        start, end = resolve_range(since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # El rango por defecto depende del día: entra en el ETag junto con la versión
+    etag = make_etag("analytics", subject_id, container.db.get_subject_version(subject_id), request.url.query, end)
+    not_modified = check_not_modified(request, response, "/analytics/{subject_id}", etag)
+    if not_modified:
+        return not_modified
+    
+    daily = container.db.get_daily_stats(subject_id, start.isoformat(), end.isoformat(), topic_id=topic_id)
+    topics = [] if topic_id is not None else container.db.get_topic_daily_totals(
+        subject_id, start.isoformat(), end.isoformat()
+    )
+    result = build_analytics(daily, topics, start, end, interval)
+    if FAST_JSON:
+        return fast_response(result, response)
+    return result
+
+
+@app.get("/recommendations")
+async def get_recommendations_across_subjects(subject_ids: Optional[str] = None, limit: int = 10):
+    """Obtener recomendaciones entre varias materias (ids separados por comas, o todas)"""
+    try:
+        ids = [int(value) for value in subject_ids.split(",") if value.strip()] if subject_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="subject_ids must be a comma-separated list of integers")
+    
+    recommendations = container.agent.recommend_across_subjects(ids, limit=max(1, min(limit, 500)))
+    return {"recommendations": recommendations}
 
 
 @app.get("/recommendations/{subject_id}")
-async def get_recommendations(subject_id: int):
+async def get_recommendations(subject_id: int, request: Request, response: Response):
     """Obtener recomendaciones de temas para estudiar"""
-    recommendations = agent.recommend_next_topics(subject_id, limit=3)
+    # Los temas vencen con el paso del tiempo: el ETag incluye un intervalo de reloj
+    time_bucket = int(time.time() // RECOMMENDATIONS_ETAG_SECONDS)
+    etag = make_etag("recommendations", subject_id, container.db.get_subject_version(subject_id), time_bucket)
+    not_modified = check_not_modified(request, response, "/recommendations/{subject_id}", etag)
+    if not_modified:
+        return not_modified
+    
+    recommendations = container.agent.recommend_next_topics(subject_id, limit=3)
     return {"recommendations": recommendations}
 
 
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Perfiles de peticiones guardados, del más reciente al más antiguo"""
+    return {"profiles": container.profiles.list()}
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """Descargar un perfil en formato de pilas colapsadas (flamegraph.pl, speedscope)"""
+    collapsed = container.profiles.get(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(collapsed, headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'})
+
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def memory_status():
+    """RSS, recolector de basura, tracemalloc e instantáneas guardadas de este worker"""
+    return container.heap.status()
+
+
+@app.post("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+async def take_heap_snapshot(limit: int = 20, group_by: str = "lineno"):
+    """Tomar una instantánea del heap y devolver las ubicaciones que más memoria retienen"""
+    if group_by not in HEAP_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(HEAP_GROUPINGS)}")
+    entry = await asyncio.to_thread(container.heap.take_snapshot)
+    top = await asyncio.to_thread(top_allocations, entry, group_by, max(1, min(limit, 500)))
+    return {**describe_snapshot(entry), "top": top}
+
+
+@app.get("/admin/memory/snapshots/{snapshot_id}/diff", dependencies=[Depends(require_admin)])
+async def diff_heap_snapshots(snapshot_id: str, base: Optional[str] = None, limit: int = 20, group_by: str = "lineno"):
+    """Comparar una instantánea con otra (por defecto, la anterior)"""
+    if group_by not in HEAP_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(HEAP_GROUPINGS)}")
+    snapshots = container.heap.snapshots
+    ids = list(snapshots)
+    if snapshot_id not in snapshots:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    if base is None:
+        position = ids.index(snapshot_id)
+        if position == 0:
+            raise HTTPException(status_code=400, detail="No earlier snapshot to compare with")
+        base = ids[position - 1]
+    if base not in snapshots:
+        raise HTTPException(status_code=404, detail="Base snapshot not found")
+    entry, base_entry = snapshots[snapshot_id], snapshots[base]
+    diff = await asyncio.to_thread(compare_snapshots, entry, base_entry, group_by, max(1, min(limit, 500)))
+    return {
+        "snapshot": describe_snapshot(entry),
+        "base": describe_snapshot(base_entry),
+        "traced_bytes_diff": entry["traced_bytes"] - base_entry["traced_bytes"],
+        "diff": diff,
+    }
+
+
+@app.delete("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+async def clear_heap_snapshots():
+    """Borrar las instantáneas y detener tracemalloc si no se está midiendo una petición"""
+    container.heap.clear_snapshots()
+    return {"tracing": container.heap.status()["tracing"]}
+
+
+@app.get("/usage", dependencies=[Depends(require_admin)])
+async def get_llm_usage(
+    group_by: str = "day",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    subject_id: Optional[int] = None
+):
+    """Obtener tokens y coste estimado del LLM agregados por materia, tema, duración o día"""
+    try:
+        rows = container.db.get_llm_usage(group_by, since=since, until=until, subject_id=subject_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"group_by": group_by, "usage": summarize_usage(rows, load_pricing())}
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Con WEB_CONCURRENCY > 1 uvicorn lanza varios procesos worker que importan "main:app"
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,28 @@
+"""
+Acceso a los endpoints de administración
+
+Se habilitan definiendo ADMIN_TOKEN; cada petición debe enviarlo en la
+cabecera X-Admin-Token. Sin ADMIN_TOKEN los endpoints responden 404.
+"""
+import hmac
+import os
+from typing import Optional
+from fastapi import HTTPException, Request
+
+ADMIN_HEADER = "x-admin-token"
+
+
+def is_admin_token(value: Optional[str]) -> bool:
+    """Comprobar el token de administración (en tiempo constante)"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected or not value:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), expected.encode("utf-8"))
+
+
+def require_admin(request: Request):
+    """Dependencia de FastAPI para los endpoints de administración"""
+    if not os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_token(request.headers.get(ADMIN_HEADER)):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
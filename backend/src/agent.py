@@ -1,20 +1,56 @@
 """
 Núcleo del agente de estudio inteligente
 """
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+from datetime import datetime, timedelta, timezone
 from src.database import Database
-from src.llm_service import LLMService
+from src.degraded import DEGRADED_SESSIONS, reference_session
+from src.digest import DigestBuilder
+from src.disconnect import GENERATIONS_ABANDONED
+from src.llm_service import LLMNotConfiguredError, LLMService
 from src.models import SessionResponse
+from src.question_bank import QuestionBank
+from src.scheduler import SECONDS_PER_DAY
+from src.session_store import STORED_SESSIONS, pack_session, session_store_enabled, unpack_session
+from src.telemetry import get_logger, span, traced
+from src.usage import usage_context
+
+logger = get_logger("agent")
+
+
+class _Generation:
+    """Generación de sesión en curso, compartida por las peticiones que piden la misma"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # True cuando el contenido ya está generado y se guardará aunque nadie espere la sesión
+        self.fills_cache = False
 
 
 class StudyAgent:
     """Agente inteligente que decide qué estudiar y genera sesiones personalizadas"""
     
-    def __init__(self, database: Database):
-        """Inicializar el agente con acceso a la base de datos"""
+    def __init__(self, database: Database, usage_recorder=None, recommendation_cache=None):
+        """Inicializar el agente con acceso a la base de datos
+        
+        recommendation_cache (opcional) guarda las recomendaciones por materia
+        indexadas por su versión, de modo que cualquier escritura las renueva.
+        """
         self.db = database
-        self.llm = LLMService()
+        self.recommendation_cache = recommendation_cache
+        self.llm = LLMService(usage_recorder=usage_recorder)
+        self.question_bank = QuestionBank(database, self.llm)
+        self.digests = DigestBuilder(database, self.llm)
+        # Guardar cada sesión generada para reanudarla y para el modo degradado
+        self.store_sessions = session_store_enabled()
+        # Compartir la generación entre peticiones simultáneas del mismo tema y duración
+        # (desactivado por defecto: todas recibirían la misma sesión y el mismo session_id)
+        self.coalesce = os.getenv("GENERATION_COALESCE", "0").lower() in ("1", "true", "yes", "on")
+        self._generations: Dict[Tuple[int, int], _Generation] = {}
     
     async def generate_study_session(
         self, 
@@ -22,78 +58,220 @@ class StudyAgent:
         topic_id: Optional[int] = None,
         duration: int = 10
     ) -> SessionResponse:
-        """Generar una sesión de estudio completa"""
+        """Generar una sesión de estudio completa
+        
+        La generación corre en su propia tarea. Si quien espera se cancela (el
+        cliente se desconectó) y nadie más espera la misma sesión, la tarea se
+        cancela con sus llamadas al LLM; si el contenido ya está generado,
+        termina para guardar la sesión.
+        
+        Con GENERATION_COALESCE las peticiones simultáneas del mismo tema y
+        duración esperan la misma tarea: reciben la misma sesión (mismo
+        session_id) y la tarea corre en el contexto de la primera petición
+        (id de petición, perfil y uso de tokens).
+        """
         # Si no se especifica tema, seleccionar el óptimo
         if topic_id is None:
             topic_id = self.select_next_topic(subject_id)
             if topic_id is None:
                 raise ValueError("No topics available for this subject")
         
+        key = (topic_id, duration)
+        generation = self._generations.get(key) if self.coalesce else None
+        if generation is None:
+            generation = _Generation()
+            generation.task = asyncio.ensure_future(self._generate_study_session(generation, topic_id, duration))
+            if self.coalesce:
+                self._generations[key] = generation
+                generation.task.add_done_callback(lambda _: self._forget_generation(key, generation))
+        
+        generation.waiters += 1
+        try:
+            # shield: cancelar a quien espera no cancela la generación compartida
+            return await asyncio.shield(generation.task)
+        finally:
+            generation.waiters -= 1
+            if not generation.task.done():
+                if generation.waiters:
+                    GENERATIONS_ABANDONED.inc(outcome="shared")
+                elif generation.fills_cache:
+                    GENERATIONS_ABANDONED.inc(outcome="cache_fill")
+                else:
+                    GENERATIONS_ABANDONED.inc(outcome="cancelled")
+                    generation.task.cancel()
+                    logger.info("Session generation cancelled", extra={"fields": {
+                        "topic_id": topic_id, "duration": duration
+                    }})
+    
+    def _forget_generation(self, key: Tuple[int, int], generation: _Generation):
+        if self._generations.get(key) is generation:
+            del self._generations[key]
+    
+    async def _generate_study_session(self, generation: _Generation, topic_id: int, duration: int) -> SessionResponse:
+        """Generar la sesión de un tema (tarea compartida de generate_study_session)"""
         # Obtener información del tema
         topic = self.db.get_topic(topic_id)
         if not topic:
             raise ValueError("Topic not found")
         
-        print(f"\n=== AGENT: Generating session for topic: {topic['name']} ===")
+        logger.info("Generating session", extra={"fields": {
+            "topic_id": topic_id, "topic": topic['name'], "duration": duration
+        }})
         
         # Obtener contenido del tema si existe
         topic_content = self.db.get_topic_content(topic_id)
         
-        if topic_content:
-            print(f"Topic has reference material: {len(topic_content)} chars")
-            print(f"First 200 chars: {topic_content[:200]}...")
-        else:
-            print("No reference material found for topic")
-        
-        # Generar contenido de la sesión usando LLM
-        session_content = await self.llm.generate_session_content(
-            topic_name=topic['name'],
-            topic_description=topic.get('description'),
-            duration=duration,
-            reference_material=topic_content
-        )
-        
-        print(f"Session content generated:")
-        print(f"  - Learning objective: {session_content['learning_objective'][:100]}...")
-        print(f"  - Content length: {len(session_content['content'])} chars")
-        print(f"  - Key concepts: {len(session_content['key_concepts'])} items")
-        
-        # Generar quiz
-        quiz = await self.llm.generate_quiz(
-            topic_name=topic['name'],
-            content=session_content['content'],
-            num_questions=3
-        )
-        
-        return SessionResponse(
-            topic_id=topic_id,
-            topic_name=topic['name'],
-            duration=duration,
-            learning_objective=session_content['learning_objective'],
-            content=session_content['content'],
-            key_concepts=session_content['key_concepts'],
-            quiz=quiz
-        )
+        # Resumen del documento completo, si se preparó al subirlo
+        topic_digest = self.digests.current(topic_id, topic_content)
+        
+        logger.debug("Reference material", extra={"fields": {
+            "topic_id": topic_id,
+            "chars": len(topic_content) if topic_content else 0,
+            "digest": topic_digest is not None
+        }})
+        
+        # Asociar el uso de tokens de ambas llamadas a esta materia/tema/duración
+        with usage_context(subject_id=topic['subject_id'], topic_id=topic_id, duration=duration):
+            # Generar contenido de la sesión usando LLM
+            try:
+                session_content = await self.llm.generate_session_content(
+                    topic_name=topic['name'],
+                    topic_description=topic.get('description'),
+                    duration=duration,
+                    reference_material=topic_content,
+                    reference_digest=topic_digest
+                )
+            except LLMNotConfiguredError:
+                raise
+            except Exception as e:
+                # Proveedor caído, lento o circuito abierto: servir lo que haya sin el LLM
+                fallback = self._degraded_session(topic, duration, topic_content, topic_digest)
+                if fallback is None:
+                    raise
+                logger.warning("Serving degraded session", extra={"fields": {
+                    "topic_id": topic_id, "error": f"{type(e).__name__}: {e}"
+                }})
+                return fallback
+            # El contenido ya costó tokens: la sesión se termina y se guarda aunque el cliente se vaya
+            generation.fills_cache = self.store_sessions
+            
+            # Servir el quiz desde el banco; solo se llama al LLM si no hay suficientes preguntas
+            quiz = self.question_bank.draw(topic_id, num_questions=3)
+            if quiz is None:
+                try:
+                    quiz = await self.llm.generate_quiz(
+                        topic_name=topic['name'],
+                        content=session_content['content'],
+                        num_questions=3
+                    )
+                    quiz = self.question_bank.add(topic_id, quiz, source="session")
+                except LLMNotConfiguredError:
+                    raise
+                except Exception as e:
+                    # El contenido ya está generado: mejor una sesión sin quiz que ninguna
+                    logger.warning("Quiz generation failed, serving session without quiz", extra={"fields": {
+                        "topic_id": topic_id, "error": f"{type(e).__name__}: {e}"
+                    }})
+                    quiz = []
+            
+            # Rellenar el banco en segundo plano si está bajo
+            self.question_bank.schedule_refill(topic, topic_content, session_content['content'])
+        
+        with span("agent.build_response"):
+            session = SessionResponse(
+                topic_id=topic_id,
+                topic_name=topic['name'],
+                duration=duration,
+                learning_objective=session_content['learning_objective'],
+                content=session_content['content'],
+                key_concepts=session_content['key_concepts'],
+                quiz=quiz
+            )
+        if self.store_sessions:
+            with span("agent.store_session"):
+                session.session_id = self.db.save_generated_session(
+                    topic_id=topic_id,
+                    subject_id=topic['subject_id'],
+                    duration=duration,
+                    model=self.llm.model,
+                    prompt_hash=session_content.get('prompt_hash'),
+                    payload=pack_session(session)
+                )
+            STORED_SESSIONS.inc(operation="save")
+        return session
     
-    def select_next_topic(self, subject_id: int) -> Optional[int]:
-        """Seleccionar el siguiente tema a estudiar basado en heurísticas"""
-        topics = self.db.get_topics_by_subject(subject_id)
+    def _degraded_session(
+        self,
+        topic: Dict[str, Any],
+        duration: int,
+        topic_content: Optional[str],
+        topic_digest: Optional[Dict[str, Any]]
+    ) -> Optional[SessionResponse]:
+        """La última sesión guardada del tema o una armada con su material"""
+        stored = self.db.get_latest_generated_session(topic['id']) if self.store_sessions else None
+        if stored is not None:
+            DEGRADED_SESSIONS.inc(source="stored")
+            return unpack_session(stored).model_copy(update={"degraded": True})
         
-        if not topics:
-            return None
+        quiz = self.question_bank.draw(topic['id'], num_questions=3) or []
+        session = reference_session(topic, duration, topic_content, topic_digest, quiz)
+        if session is not None:
+            DEGRADED_SESSIONS.inc(source="reference")
+        return session
+    
+    async def generate_study_sessions(
+        self,
+        subject_id: int,
+        items: List[Tuple[int, int]],
+        concurrency: int = 4
+    ) -> AsyncIterator[Tuple[int, Optional[SessionResponse], Optional[Exception]]]:
+        """Generar varias sesiones en paralelo, entregándolas a medida que terminan
         
-        # Calcular prioridad para cada tema
-        topic_priorities = []
+        Produce tuplas (índice, sesión, error); el fallo de un elemento no
+        interrumpe el resto del lote.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
         
-        for topic in topics:
-            stats = self.db.get_topic_statistics(topic['id'])
-            priority = self.calculate_topic_priority(topic, stats)
-            topic_priorities.append((topic['id'], priority))
+        async def run_one(index: int, topic_id: int, duration: int):
+            async with semaphore:
+                try:
+                    topic = self.db.get_topic(topic_id)
+                    if not topic or topic['subject_id'] != subject_id:
+                        raise ValueError("Topic not found")
+                    session = await self.generate_study_session(
+                        subject_id=subject_id,
+                        topic_id=topic_id,
+                        duration=duration
+                    )
+                    return index, session, None
+                except Exception as e:
+                    logger.warning("Batch item failed", extra={"fields": {
+                        "index": index, "topic_id": topic_id, "error": str(e)
+                    }})
+                    return index, None, e
         
-        # Ordenar por prioridad (mayor es mejor)
-        topic_priorities.sort(key=lambda x: x[1], reverse=True)
+        tasks = [
+            asyncio.ensure_future(run_one(index, topic_id, duration))
+            for index, (topic_id, duration) in enumerate(items)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Si el consumidor abandona el lote (p. ej. el cliente se desconecta), cancelar lo pendiente
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    @traced("agent.select_next_topic")
+    def select_next_topic(self, subject_id: int) -> Optional[int]:
+        """Seleccionar el tema que vence primero en la cola de repaso espaciado"""
+        due = self.db.get_due_topics(subject_id, limit=1)
+        
+        if not due:
+            return None
         
-        return topic_priorities[0][0]
+        return due[0]['id']
     
     def calculate_topic_priority(self, topic: Dict[str, Any], stats: Dict[str, Any]) -> float:
         """Calcular la prioridad de un tema basado en múltiples factores"""
@@ -119,33 +297,133 @@ class StudyAgent:
         
         return priority
     
+    @traced("agent.recommend_next_topics")
     def recommend_next_topics(self, subject_id: int, limit: int = 3) -> List[Dict[str, Any]]:
-        """Recomendar los próximos temas a estudiar"""
-        topics = self.db.get_topics_by_subject(subject_id)
+        """Recomendar los próximos temas a estudiar según su vencimiento de repaso"""
+        if self.recommendation_cache is not None:
+            key = (subject_id, limit, self.db.get_subject_version(subject_id))
+            cached = self.recommendation_cache.get(key)
+            if cached is None:
+                cached = self._compute_recommendations(subject_id, limit)
+                self.recommendation_cache.set(key, cached)
+            return [dict(item) for item in cached]
+        
+        return self._compute_recommendations(subject_id, limit)
+    
+    def _compute_recommendations(self, subject_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Calcular las recomendaciones de una materia sin cache
         
-        if not topics:
-            return []
+        La puntuación y la razón salen del estado de repaso que ya trae
+        get_due_topics, así que siguen el mismo orden que la cola.
+        """
+        # Solo se consultan los k temas que vencen primero, no toda la materia
+        topics = self.db.get_due_topics(subject_id, limit=limit)
+        now = time.time()
         
-        # Calcular prioridad y estadísticas para cada tema
         recommendations = []
         
         for topic in topics:
-            stats = self.db.get_topic_statistics(topic['id'])
-            priority = self.calculate_topic_priority(topic, stats)
-            
+            last_reviewed_at = topic['last_reviewed_at']
             recommendations.append({
                 'topic_id': topic['id'],
                 'topic_name': topic['name'],
+                'priority_score': self.calculate_schedule_priority(topic, now),
+                'repetitions': topic['repetitions'],
+                'lapses': topic['lapses'],
+                'stability_days': round(topic['stability'], 1),
+                'last_studied': (
+                    datetime.fromtimestamp(last_reviewed_at, tz=timezone.utc).isoformat()
+                    if last_reviewed_at is not None else None
+                ),
+                'due_at': datetime.fromtimestamp(topic['due_at'], tz=timezone.utc).isoformat(),
+                'reason': self.get_schedule_reason(topic, now)
+            })
+        
+        return recommendations
+    
+    def calculate_schedule_priority(self, topic: Dict[str, Any], now: float) -> float:
+        """Prioridad de un tema de la cola de repaso: días de retraso (negativa si aún no vence)
+        
+        Depende solo de due_at, de modo que decrece en el mismo orden en que
+        get_due_topics devuelve los temas.
+        """
+        return round((now - topic['due_at']) / SECONDS_PER_DAY, 2)
+    
+    def get_schedule_reason(self, topic: Dict[str, Any], now: float) -> str:
+        """Generar una razón legible a partir del estado de repaso del tema"""
+        if topic['last_reviewed_at'] is None:
+            return "Nunca estudiado"
+        
+        reasons = []
+        
+        overdue_days = int((now - topic['due_at']) // SECONDS_PER_DAY)
+        if overdue_days >= 1:
+            reasons.append(f"Repaso vencido hace {overdue_days} dias")
+        elif topic['due_at'] > now:
+            reasons.append(f"Proximo repaso en {-overdue_days} dias")
+        else:
+            reasons.append("Listo para repasar")
+        
+        if topic['lapses']:
+            reasons.append(f"Olvidado {topic['lapses']} veces")
+        elif topic['stability'] >= 1:
+            reasons.append(f"Intervalo de repaso: {round(topic['stability'], 1):g} dias")
+        
+        return ", ".join(reasons)
+    
+    @traced("agent.recommend_across_subjects")
+    def recommend_across_subjects(
+        self,
+        subject_ids: Optional[List[int]] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Recomendar temas por prioridad heurística entre varias materias (vista institucional)
+        
+        Usa la ruta columnar con NumPy cuando está disponible y el puntuador
+        escalar en caso contrario; ambos producen el mismo resultado.
+        """
+        # NumPy se carga solo cuando se usa esta vista
+        from src import scoring
+        
+        rows = self.db.get_topic_stats_columns(subject_ids)
+        
+        if scoring.numpy_available():
+            with span("agent.score_vectorized"):
+                recommendations = scoring.recommend(scoring.TopicColumns(rows), limit)
+        else:
+            with span("agent.score_scalar"):
+                recommendations = self._recommend_scalar(rows, limit)
+        
+        labels = self.db.get_topic_labels([r['topic_id'] for r in recommendations])
+        for recommendation in recommendations:
+            label = labels.get(recommendation['topic_id'], {})
+            recommendation['topic_name'] = label.get('name')
+            recommendation['last_studied'] = label.get('last_studied')
+        
+        return recommendations
+    
+    def _recommend_scalar(self, rows: List[tuple], limit: int) -> List[Dict[str, Any]]:
+        """Puntuar fila a fila con calculate_topic_priority (referencia de la ruta columnar)"""
+        recommendations = []
+        for topic_id, subject_id, has_content, count, last_epoch, avg in rows:
+            last_studied = (
+                datetime.fromtimestamp(last_epoch, tz=timezone.utc).replace(tzinfo=None).isoformat(sep=' ')
+                if last_epoch >= 0 else None
+            )
+            avg = avg if avg >= 0 else None
+            topic = {'id': topic_id, 'has_content': has_content}
+            stats = {'session_count': count, 'last_studied': last_studied, 'avg_performance': avg}
+            priority = self.calculate_topic_priority(topic, stats)
+            recommendations.append({
+                'topic_id': topic_id,
+                'subject_id': subject_id,
                 'priority_score': round(priority, 2),
-                'times_studied': stats['session_count'],
-                'last_studied': stats['last_studied'],
-                'average_performance': round(stats['avg_performance'] * 100, 1) if stats['avg_performance'] else None,
+                'times_studied': count,
+                'average_performance': round(avg * 100, 1) if avg else None,
                 'reason': self.get_recommendation_reason(topic, stats)
             })
         
-        # Ordenar por prioridad
         recommendations.sort(key=lambda x: x['priority_score'], reverse=True)
-        
         return recommendations[:limit]
     
     def get_recommendation_reason(self, topic: Dict[str, Any], stats: Dict[str, Any]) -> str:
@@ -0,0 +1,150 @@
+"""
+Series de desempeño por materia a partir de las estadísticas diarias
+
+Las tablas topic_daily_stats y subject_daily_stats se actualizan al registrar
+cada sesión, así que una serie cuesta tantas filas como días tenga el rango,
+sin importar cuántas sesiones haya en el historial. Los días son UTC.
+"""
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from src.database import DAILY_STATS_COLUMNS
+
+INTERVALS = ("day", "week", "month")
+
+
+def parse_day(value: str, name: str) -> date:
+    """Leer un día YYYY-MM-DD (se aceptan fechas con hora y se toma el día)"""
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def resolve_range(since: Optional[str], until: Optional[str]) -> Tuple[date, date]:
+    """Rango [since, until) pedido; por defecto los últimos ANALYTICS_DEFAULT_DAYS días"""
+    default_days = int(os.getenv("ANALYTICS_DEFAULT_DAYS", "30"))
+    max_days = int(os.getenv("ANALYTICS_MAX_DAYS", "731"))
+    end = parse_day(until, "until") if until else datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = parse_day(since, "since") if since else end - timedelta(days=default_days)
+    if start >= end:
+        raise ValueError("since must be before until")
+    if (end - start).days > max_days:
+        raise ValueError(f"range must not exceed {max_days} days")
+    return start, end
+
+
+def period_start(day: date, interval: str) -> date:
+    """Primer día del periodo (día, semana ISO o mes) que contiene day"""
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start: date, interval: str) -> date:
+    if interval == "week":
+        return start + timedelta(days=7)
+    if interval == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def summarize(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sumar filas de estadísticas y derivar los porcentajes"""
+    totals = dict.fromkeys(DAILY_STATS_COLUMNS, 0)
+    for row in rows:
+        for column in DAILY_STATS_COLUMNS:
+            totals[column] += row[column] or 0
+    # Las sumas de PostgreSQL llegan como NUMERIC (float): los conteos vuelven a ser enteros
+    for column in DAILY_STATS_COLUMNS:
+        if column != "accuracy_sum":
+            totals[column] = int(totals[column])
+    sessions = totals["sessions"]
+    return {
+        "sessions": sessions,
+        "minutes": totals["minutes"],
+        # Media de los porcentajes de cada sesión, como en las estadísticas por tema
+        "accuracy": round(totals["accuracy_sum"] / sessions, 4) if sessions else None,
+        "question_accuracy": round(totals["correct"] / totals["questions"], 4) if totals["questions"] else None,
+        # Sesiones por quintil de acierto: [0-20 %, 20-40 %, 40-60 %, 60-80 %, 80-100 %]
+        "distribution": [totals[f"bucket_{k}"] for k in range(5)],
+    }
+
+
+def _slope(points: List[Tuple[float, float]]) -> Optional[float]:
+    """Pendiente por mínimos cuadrados; None con menos de dos puntos"""
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def _weighted_accuracy(points: List[Dict[str, Any]]) -> Optional[float]:
+    """Acierto medio de varios puntos de la serie, ponderado por sus sesiones"""
+    sessions = sum(point["sessions"] for point in points)
+    if not sessions:
+        return None
+    return sum(point["accuracy"] * point["sessions"] for point in points if point["sessions"]) / sessions
+
+
+def trend(series: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Tendencia del acierto y del volumen de estudio a lo largo de la serie"""
+    accuracy_points = [(index, point["accuracy"]) for index, point in enumerate(series) if point["sessions"]]
+    accuracy_slope = _slope(accuracy_points)
+    sessions_slope = _slope([(index, point["sessions"]) for index, point in enumerate(series)])
+
+    # Acierto de la segunda mitad del rango frente a la primera, ponderado por sesiones
+    half = len(series) // 2
+    first, second = _weighted_accuracy(series[:half]), _weighted_accuracy(series[half:])
+    change = None
+    if first is not None and second is not None:
+        change = round(second - first, 4)
+
+    return {
+        "accuracy_per_period": round(accuracy_slope, 5) if accuracy_slope is not None else None,
+        "sessions_per_period": round(sessions_slope, 4) if sessions_slope is not None else None,
+        "accuracy_change": change,
+    }
+
+
+def build_series(rows: List[Dict[str, Any]], start: date, end: date, interval: str) -> List[Dict[str, Any]]:
+    """Agrupar las filas diarias por periodo, con los periodos sin sesiones incluidos"""
+    grouped: Dict[date, List[Dict[str, Any]]] = {}
+    for row in rows:
+        grouped.setdefault(period_start(parse_day(str(row["day"]), "day"), interval), []).append(row)
+
+    series = []
+    current = period_start(start, interval)
+    while current < end:
+        series.append({"period": current.isoformat(), **summarize(grouped.get(current, ()))})
+        current = _next_period(current, interval)
+    return series
+
+
+def build_analytics(
+    daily: List[Dict[str, Any]],
+    topics: List[Dict[str, Any]],
+    start: date,
+    end: date,
+    interval: str
+) -> Dict[str, Any]:
+    """Respuesta de /analytics: totales, serie, tendencia y desglose por tema"""
+    series = build_series(daily, start, end, interval)
+    return {
+        "since": start.isoformat(),
+        "until": end.isoformat(),
+        "interval": interval,
+        "totals": summarize(daily),
+        "trend": trend(series),
+        "series": series,
+        "topics": [
+            {"topic_id": row["topic_id"], "topic_name": row["topic_name"], **summarize([row])}
+            for row in topics
+        ],
+    }
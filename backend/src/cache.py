@@ -0,0 +1,334 @@
+"""
+Cache de lectura en memoria delante de la base de datos
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from src.database import Database
+from src.postgres import PostgresDatabase, is_postgres_url
+from src.telemetry import REGISTRY
+from src.workers import SharedEpoch
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "studysprint_cache_requests_total",
+    "Lecturas de la cache en memoria, según fueran acierto (hit) o fallo (miss)",
+    ("cache", "result")
+)
+CACHE_REMOVALS = REGISTRY.counter(
+    "studysprint_cache_removals_total",
+    "Entradas retiradas de la cache por tamaño, caducidad o invalidación",
+    ("cache", "reason")
+)
+CACHE_ENTRIES = REGISTRY.gauge(
+    "studysprint_cache_entries",
+    "Entradas almacenadas en la cache",
+    ("cache",)
+)
+
+_MISSING = object()
+
+
+def cache_enabled() -> bool:
+    """Indicar si la cache está activada (DB_CACHE_ENABLED, activada por defecto)"""
+    return os.getenv("DB_CACHE_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+
+def _clone(value: Any) -> Any:
+    """Copiar filas y listas de filas para que quien llama no altere la cache"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+
+class TTLCache:
+    """Cache LRU acotada con caducidad por entrada e invalidación por etiquetas
+
+    Cada entrada se guarda con un conjunto de etiquetas (por ejemplo
+    "topic:3"); invalidate() retira de una vez todas las entradas que
+    comparten una etiqueta.
+    """
+
+    def __init__(self, name: str, max_entries: int = 2048, ttl: float = 60.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.removals: Dict[str, int] = {"size": 0, "expired": 0, "invalidated": 0, "epoch": 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Obtener un valor vigente o default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key, "expired")
+                entry = None
+            if entry is None:
+                self.misses += 1
+                CACHE_REQUESTS.inc(cache=self.name, result="miss")
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result="hit")
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = ()):
+        """Guardar un valor con sus etiquetas de invalidación"""
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest, "size")
+            CACHE_ENTRIES.set(len(self._entries), cache=self.name)
+
+    def invalidate(self, *tags: str):
+        """Retirar todas las entradas asociadas a alguna de las etiquetas"""
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key, "invalidated")
+            CACHE_ENTRIES.set(len(self._entries), cache=self.name)
+
+    def clear(self, reason: Optional[str] = None):
+        """Vaciar la cache (reason cuenta las entradas retiradas con ese motivo)"""
+        with self._lock:
+            if reason is not None and self._entries:
+                self.removals[reason] += len(self._entries)
+                CACHE_REMOVALS.inc(len(self._entries), cache=self.name, reason=reason)
+            self._entries.clear()
+            self._tags.clear()
+            CACHE_ENTRIES.set(0, cache=self.name)
+
+    def _remove(self, key: Hashable, reason: Optional[str]):
+        """Retirar una entrada (con el lock tomado) y sus referencias en las etiquetas"""
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        if reason is not None:
+            self.removals[reason] += 1
+            CACHE_REMOVALS.inc(cache=self.name, reason=reason)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de uso de la cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'removals': dict(self.removals)
+            }
+
+
+class CachedDatabase(Database):
+    """Database con cache de lectura para materias, temas y contenido
+
+    Las lecturas frecuentes se sirven desde memoria; cada método de escritura
+    invalida exactamente las entradas que modifica, así que las lecturas
+    siguen siendo coherentes con las escrituras hechas a través de la API.
+
+    Con varios workers, epoch es un contador compartido: cada escritura lo
+    incrementa y un proceso que lo ve cambiar vacía su propia cache.
+    """
+
+    def __init__(self, db_path: str = "data/study_agent.db", cache: Optional[TTLCache] = None, epoch: Optional[SharedEpoch] = None):
+        super().__init__(db_path)
+        self.epoch = epoch
+        self._epoch_seen = epoch.value() if epoch is not None else 0
+        self.cache = cache or TTLCache(
+            "database",
+            max_entries=int(os.getenv("DB_CACHE_MAX_ENTRIES", "2048")),
+            ttl=float(os.getenv("DB_CACHE_TTL", "60"))
+        )
+        # Los textos de PDF pueden ser enormes; solo se guardan los de tamaño moderado
+        self.max_content_chars = int(os.getenv("DB_CACHE_MAX_CONTENT_CHARS", "200000"))
+
+    def _read_through(self, key: Tuple, tags: Iterable[str], load: Callable[[], Any], cacheable: Callable[[Any], bool] = None) -> Any:
+        """Devolver el valor de la cache o cargarlo y guardarlo"""
+        if self.epoch is not None and self.epoch.value() != self._epoch_seen:
+            self._sync_epoch()
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = load()
+            if cacheable is None or cacheable(value):
+                self.cache.set(key, _clone(value), tags)
+            return value
+        return _clone(value)
+
+    def _sync_epoch(self):
+        """Otro proceso escribió: descartar todo lo guardado en este"""
+        self.cache.clear(reason="epoch")
+        self._epoch_seen = self.epoch.value()
+
+    def _invalidate(self, *tags: str):
+        """Invalidar localmente y avisar al resto de procesos"""
+        self.cache.invalidate(*tags)
+        if self.epoch is not None:
+            previous, current = self.epoch.bump()
+            if previous != self._epoch_seen:
+                # Hubo escrituras de otros procesos que aún no habíamos visto
+                self.cache.clear(reason="epoch")
+            self._epoch_seen = current
+
+    def invalidate_caches(self):
+        # Sin etiquetas: vacía la cache local y el contador avisa al resto de procesos
+        self.cache.clear(reason="invalidated")
+        if self.epoch is not None:
+            _, self._epoch_seen = self.epoch.bump()
+
+    def _subject_of(self, topic_id: int) -> Optional[int]:
+        """Materia de un tema (normalmente ya en cache)"""
+        topic = self.get_topic(topic_id)
+        return topic['subject_id'] if topic else None
+
+    # Lecturas
+
+    def get_subject(self, subject_id: int) -> Optional[Dict[str, Any]]:
+        return self._read_through(
+            ("subject", subject_id), (f"subject:{subject_id}",),
+            lambda: super(CachedDatabase, self).get_subject(subject_id),
+            lambda value: value is not None
+        )
+
+    def get_subject_version(self, subject_id: int) -> int:
+        return self._read_through(
+            ("version", subject_id), (f"version:{subject_id}",),
+            lambda: super(CachedDatabase, self).get_subject_version(subject_id)
+        )
+
+    def get_all_subjects(
+        self,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        return self._read_through(
+            ("subjects", limit, cursor_token, since, until), ("subjects",),
+            lambda: super(CachedDatabase, self).get_all_subjects(limit, cursor_token, since, until)
+        )
+
+    def get_topic(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        return self._read_through(
+            ("topic", topic_id), (f"topic:{topic_id}",),
+            lambda: super(CachedDatabase, self).get_topic(topic_id),
+            lambda value: value is not None
+        )
+
+    def get_topics_by_subject(
+        self,
+        subject_id: int,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        return self._read_through(
+            ("topics", subject_id, limit, cursor_token, since, until), (f"topics:{subject_id}",),
+            lambda: super(CachedDatabase, self).get_topics_by_subject(subject_id, limit, cursor_token, since, until)
+        )
+
+    def get_topic_content(self, topic_id: int) -> Optional[str]:
+        return self._read_through(
+            ("content", topic_id), (f"content:{topic_id}",),
+            lambda: super(CachedDatabase, self).get_topic_content(topic_id),
+            lambda value: value is not None and len(value) <= self.max_content_chars
+        )
+
+    def get_topic_digest(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        return self._read_through(
+            ("digest", topic_id), (f"digest:{topic_id}",),
+            lambda: super(CachedDatabase, self).get_topic_digest(topic_id),
+            lambda value: value is not None
+        )
+
+    # Escrituras: cada una invalida lo que modifica
+
+    def create_subject(self, name: str, description: Optional[str] = None) -> Dict[str, Any]:
+        subject = super().create_subject(name, description)
+        self._invalidate("subjects", "version:0", f"version:{subject['id']}")
+        return subject
+
+    def create_topic(self, subject_id: int, name: str, description: Optional[str] = None) -> Dict[str, Any]:
+        topic = super().create_topic(subject_id, name, description)
+        self._invalidate(f"topics:{subject_id}", f"version:{subject_id}")
+        return topic
+
+    def save_topic_content(self, topic_id: int, content: str, source_file: str):
+        subject_id = self._subject_of(topic_id)
+        super().save_topic_content(topic_id, content, source_file)
+        self._invalidate(
+            f"topic:{topic_id}", f"content:{topic_id}", f"digest:{topic_id}",
+            f"topics:{subject_id}", f"version:{subject_id}"
+        )
+
+    def save_topic_contents(self, items: List[Dict[str, Any]]):
+        topic_ids = {item['topic_id'] for item in items}
+        subject_ids = {self._subject_of(topic_id) for topic_id in topic_ids}
+        super().save_topic_contents(items)
+        self._invalidate(
+            *(f"topic:{topic_id}" for topic_id in topic_ids),
+            *(f"content:{topic_id}" for topic_id in topic_ids),
+            *(f"digest:{topic_id}" for topic_id in topic_ids),
+            *(f"topics:{subject_id}" for subject_id in subject_ids),
+            *(f"version:{subject_id}" for subject_id in subject_ids)
+        )
+
+    def save_topic_digest(self, topic_id: int, content_hash: str, digest: str, outline: str, model: str, chunks: int):
+        super().save_topic_digest(topic_id, content_hash, digest, outline, model, chunks)
+        self._invalidate(f"digest:{topic_id}")
+
+    def record_session_completion(
+        self,
+        topic_id: int,
+        duration: int,
+        score: int,
+        total_questions: int,
+        generated_session_id: Optional[int] = None
+    ):
+        subject_id = self._subject_of(topic_id)
+        super().record_session_completion(topic_id, duration, score, total_questions, generated_session_id)
+        self._invalidate(f"version:{subject_id}")
+
+    def record_session_completions(self, completions: List[Dict[str, Any]]) -> List[int]:
+        subject_ids = super().record_session_completions(completions)
+        if subject_ids:
+            self._invalidate(*(f"version:{subject_id}" for subject_id in subject_ids))
+        return subject_ids
+
+
+def create_database(db_path: str = "data/study_agent.db") -> Database:
+    """Crear la base de datos, con cache de lectura salvo que esté desactivada
+
+    El contador compartido vive junto al archivo de la base de datos, así que
+    todos los workers (y las herramientas que escriban con CachedDatabase)
+    se coordinan a través de él. Con DATABASE_URL=postgresql://... se usa
+    PostgreSQL.
+    """
+    database_url = os.getenv("DATABASE_URL")
+    if is_postgres_url(database_url):
+        # Con varios nodos el contador compartido no cruza máquinas: sin cache de lectura
+        return PostgresDatabase(database_url)
+    if cache_enabled():
+        return CachedDatabase(db_path, epoch=SharedEpoch(db_path + ".epoch"))
+    return Database(db_path)
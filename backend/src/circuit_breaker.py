@@ -0,0 +1,144 @@
+"""
+Cortacircuitos para las llamadas al proveedor del LLM
+
+- Cerrado: las llamadas pasan y se anota su resultado en una ventana móvil
+- Abierto: si en la ventana hay demasiados errores o llamadas lentas, las
+  llamadas fallan de inmediato (CircuitOpenError) durante un tiempo
+- Semiabierto: pasado ese tiempo se deja pasar una llamada de prueba; si
+  sale bien el circuito se cierra y si falla vuelve a abrirse
+"""
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from src.telemetry import REGISTRY, get_logger
+
+logger = get_logger("circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = REGISTRY.gauge(
+    "studysprint_circuit_state",
+    "Estado del cortacircuitos (0 cerrado, 1 semiabierto, 2 abierto)",
+    ("circuit",)
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "studysprint_circuit_transitions_total",
+    "Cambios de estado del cortacircuitos",
+    ("circuit", "state")
+)
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "studysprint_circuit_rejections_total",
+    "Llamadas rechazadas sin intentarlas porque el circuito estaba abierto",
+    ("circuit",)
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito está abierto: la llamada no se intentó"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is temporarily unavailable")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Abre el circuito por tasa de errores o de llamadas lentas en las últimas llamadas"""
+
+    def __init__(self, name: str):
+        """Configurar umbrales a partir de variables de entorno"""
+        self.name = name
+        # Resultados recientes que se evalúan
+        self.window = int(os.getenv("CB_WINDOW", "20"))
+        # Llamadas mínimas en la ventana antes de poder abrir
+        self.min_calls = int(os.getenv("CB_MIN_CALLS", "10"))
+        # Fracción de errores que abre el circuito
+        self.error_rate = float(os.getenv("CB_ERROR_RATE", "0.5"))
+        # Una llamada más lenta que esto cuenta como lenta
+        self.slow_seconds = float(os.getenv("CB_SLOW_SECONDS", "45"))
+        # Fracción de llamadas lentas que abre el circuito
+        self.slow_rate = float(os.getenv("CB_SLOW_RATE", "0.5"))
+        # Segundos que el circuito permanece abierto antes de probar
+        self.open_seconds = float(os.getenv("CB_OPEN_SECONDS", "30"))
+        self.state = CLOSED
+        self._outcomes: Deque[tuple] = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        CIRCUIT_STATE.set(0, circuit=name)
+
+    def before_call(self):
+        """Autorizar una llamada o lanzar CircuitOpenError"""
+        if self.state == OPEN:
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                CIRCUIT_REJECTIONS.inc(circuit=self.name)
+                raise CircuitOpenError(self.name, remaining)
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # Solo una llamada de prueba a la vez
+            if self._probe_in_flight:
+                CIRCUIT_REJECTIONS.inc(circuit=self.name)
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._probe_in_flight = True
+
+    def record_success(self, seconds: float):
+        """Anotar una llamada completada y su duración"""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if seconds > self.slow_seconds:
+                self._open()
+            else:
+                self._outcomes.clear()
+                self._transition(CLOSED)
+            return
+        self._outcomes.append((False, seconds > self.slow_seconds))
+        self._evaluate()
+
+    def record_failure(self):
+        """Anotar una llamada fallida"""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            self._open()
+            return
+        self._outcomes.append((True, False))
+        self._evaluate()
+
+    def release(self):
+        """La llamada autorizada no llegó a completarse (cancelada): liberar la prueba"""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _evaluate(self):
+        if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        total = len(self._outcomes)
+        errors = sum(1 for failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, was_slow in self._outcomes if was_slow)
+        if errors / total >= self.error_rate or slow / total >= self.slow_rate:
+            logger.warning("Circuit opened", extra={"fields": {
+                "circuit": self.name, "calls": total, "errors": errors, "slow": slow
+            }})
+            self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], circuit=self.name)
+        CIRCUIT_TRANSITIONS.inc(circuit=self.name, state=state)
+        logger.info("Circuit state changed", extra={"fields": {"circuit": self.name, "state": state}})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado actual para /ready"""
+        retry_after: Optional[float] = None
+        if self.state == OPEN:
+            retry_after = round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 1)
+        return {"state": self.state, "recent_calls": len(self._outcomes), "retry_after": retry_after}
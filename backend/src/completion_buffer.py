@@ -0,0 +1,287 @@
+"""
+Escritura diferida de las sesiones completadas
+
+/session/complete responde en cuanto la finalización queda en un registro
+local (un archivo de líneas JSON por worker) sincronizado con fsync; las
+peticiones que llegan a la vez comparten el mismo fsync. Un bucle en segundo
+plano escribe las finalizaciones en la base de datos en lotes, en una sola
+transacción por lote, y borra los tramos del registro ya escritos.
+
+Cada worker escribe sus propios tramos (completions-<pid>-<n>.log) y mantiene
+tomado el cerrojo completions-<pid>.lock mientras vive. Al arrancar, los
+tramos cuyo cerrojo está libre son de un worker que terminó sin vaciarlos: se
+reproducen en la base de datos (las claves de finalización evitan duplicar
+las que ya llegaron a escribirse) y se borran.
+"""
+import asyncio
+import glob
+import os
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from src import fast_json
+from src.telemetry import REGISTRY, get_logger
+from src.workers import FileLock
+
+logger = get_logger("completion_buffer")
+
+COMPLETIONS_BUFFERED = REGISTRY.counter(
+    "studysprint_completions_buffered_total",
+    "Finalizaciones de sesión confirmadas al cliente tras guardarse en el registro local"
+)
+COMPLETION_FSYNCS = REGISTRY.counter(
+    "studysprint_completion_fsyncs_total",
+    "fsync del registro local de finalizaciones (cada uno cubre todas las escrituras previas)"
+)
+COMPLETION_FLUSHES = REGISTRY.counter(
+    "studysprint_completion_flushes_total",
+    "Lotes de finalizaciones escritos en la base de datos",
+    ("status",)
+)
+COMPLETION_FLUSH_SIZE = REGISTRY.histogram(
+    "studysprint_completion_flush_size",
+    "Finalizaciones por lote escrito en la base de datos",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+COMPLETIONS_PENDING = REGISTRY.gauge(
+    "studysprint_completions_pending",
+    "Finalizaciones en el registro local aún no escritas en la base de datos"
+)
+COMPLETIONS_RECOVERED = REGISTRY.counter(
+    "studysprint_completions_recovered_total",
+    "Finalizaciones reproducidas desde registros de workers que terminaron sin vaciarlos"
+)
+
+_SEGMENT_NAME = re.compile(r"^completions-(\d+)-(\d+)\.log$")
+
+
+def completion_buffer_enabled() -> bool:
+    """Indicar si las finalizaciones se escriben en diferido (COMPLETION_BUFFER_ENABLED, desactivado por defecto)"""
+    return os.getenv("COMPLETION_BUFFER_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+
+
+def read_segment(path: str) -> List[Dict[str, Any]]:
+    """Leer las finalizaciones de un tramo; una última línea cortada por una caída se descarta"""
+    records = []
+    with open(path, "rb") as handle:
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break
+            records.append(fast_json.loads(line))
+    return records
+
+
+class _Segment:
+    """Tramo del registro: se borra cuando todas sus finalizaciones están en la base de datos"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "ab")
+        self.written = 0
+        self.synced = 0
+        self.flushed = 0
+        self.sealed = False
+        # La entrada del directorio también debe sincronizarse una vez
+        self.created = True
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class CompletionBuffer:
+    """Confirma finalizaciones tras fsync al registro local y las escribe en lotes"""
+
+    def __init__(self, database, directory: str):
+        """Configurar el tamaño de lote y el intervalo máximo entre escrituras"""
+        self.db = database
+        self.directory = directory
+        # Finalizaciones por transacción
+        self.batch_size = int(os.getenv("COMPLETION_BATCH_SIZE", "200"))
+        # Segundos máximos que una finalización espera en el registro
+        self.flush_interval = float(os.getenv("COMPLETION_FLUSH_SECONDS", "1.0"))
+        self.pid = os.getpid()
+        self._lock = FileLock(os.path.join(directory, f"completions-{self.pid}.lock"))
+        self._sequence = 0
+        self._segment: Optional[_Segment] = None
+        self._segments: List[_Segment] = []
+        self._pending: Deque[Tuple[_Segment, Dict[str, Any]]] = deque()
+        self._sync_task: Optional[asyncio.Future] = None
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self):
+        """Recuperar registros huérfanos y arrancar el bucle de escritura"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock.acquire()
+        # Con el cerrojo propio tomado, los tramos con este pid son de un proceso anterior
+        self.recover()
+        self._segment = self._open_segment()
+        self._task = asyncio.ensure_future(self._run())
+
+    def recover(self) -> int:
+        """Reproducir los tramos de workers que ya no tienen su cerrojo; devuelve las finalizaciones leídas"""
+        owners: Dict[int, List[str]] = {}
+        for path in glob.glob(os.path.join(self.directory, "completions-*-*.log")):
+            match = _SEGMENT_NAME.match(os.path.basename(path))
+            if match:
+                owners.setdefault(int(match.group(1)), []).append(path)
+
+        recovered = 0
+        for pid, paths in owners.items():
+            lock = None
+            if pid != self.pid:
+                lock = FileLock(os.path.join(self.directory, f"completions-{pid}.lock"))
+                if not lock.acquire(blocking=False):
+                    continue  # El worker sigue vivo
+            try:
+                # Volver a listar con el cerrojo tomado: otro worker pudo recuperarlos antes
+                paths = [path for path in paths if os.path.exists(path)]
+                paths.sort(key=lambda path: int(_SEGMENT_NAME.match(os.path.basename(path)).group(2)))
+                records = [record for path in paths for record in read_segment(path)]
+                for start in range(0, len(records), self.batch_size):
+                    self.db.record_session_completions(records[start:start + self.batch_size])
+                for path in paths:
+                    os.remove(path)
+                recovered += len(records)
+                if records:
+                    COMPLETIONS_RECOVERED.inc(len(records))
+                    logger.warning("Recovered buffered completions", extra={"fields": {
+                        "pid": pid, "segments": len(paths), "completions": len(records)
+                    }})
+            finally:
+                if lock is not None:
+                    # El archivo del cerrojo se deja: borrarlo mientras otro lo abre rompería la exclusión
+                    lock.release()
+        return recovered
+
+    def _open_segment(self) -> _Segment:
+        self._sequence += 1
+        segment = _Segment(os.path.join(self.directory, f"completions-{self.pid}-{self._sequence}.log"))
+        self._segments.append(segment)
+        return segment
+
+    async def submit(self, completion: Dict[str, Any]):
+        """Guardar una finalización en el registro; vuelve cuando es durable"""
+        record = {
+            **completion,
+            "completion_key": uuid.uuid4().hex,
+            "completed_at": time.time(),
+        }
+        segment = self._segment
+        segment.file.write(fast_json.dumps(record) + b"\n")
+        segment.file.flush()
+        segment.written += 1
+        try:
+            await self._sync(segment, segment.written)
+        finally:
+            # La línea ya está en el tramo: aunque se cancele la espera del fsync
+            # tiene que escribirse, o el tramo no se borra y se reproduciría dos veces
+            self._pending.append((segment, record))
+            COMPLETIONS_BUFFERED.inc()
+            COMPLETIONS_PENDING.set(len(self._pending))
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    async def _sync(self, segment: _Segment, target: int):
+        """Esperar a que un fsync cubra las escrituras del tramo hasta target"""
+        while segment.synced < target:
+            if self._sync_task is None:
+                self._sync_task = asyncio.ensure_future(self._fsync())
+            # shield: si el cliente se va, el fsync sigue para los demás que lo esperan
+            await asyncio.shield(self._sync_task)
+
+    async def _fsync(self):
+        """Un fsync por tramo con escrituras nuevas, compartido por todos los que esperan"""
+        try:
+            targets = [(segment, segment.written) for segment in self._segments if segment.synced < segment.written]
+            await asyncio.to_thread(self._fsync_files, [segment for segment, _ in targets])
+            for segment, written in targets:
+                segment.synced = max(segment.synced, written)
+                segment.created = False
+            COMPLETION_FSYNCS.inc()
+        finally:
+            self._sync_task = None
+
+    def _fsync_files(self, segments: List[_Segment]):
+        for segment in segments:
+            os.fsync(segment.file.fileno())
+        if os.name == "posix" and any(segment.created for segment in segments):
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    async def _run(self):
+        """Escribir un lote al llenarse o al vencer el intervalo"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Las finalizaciones siguen en el registro y en memoria: se reintenta en la próxima vuelta
+                logger.exception("Error flushing completions", extra={"fields": {"pending": len(self._pending)}})
+
+    async def flush(self):
+        """Escribir en la base de datos todas las finalizaciones confirmadas"""
+        async with self._flush_lock:
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                # Las finalizaciones nuevas van a otro tramo para poder borrar este cuando se vacíe
+                if self._segment.written and not self._closing:
+                    self._segment.sealed = True
+                    self._segment = self._open_segment()
+                try:
+                    await asyncio.to_thread(self.db.record_session_completions, [record for _, record in batch])
+                except Exception:
+                    COMPLETION_FLUSHES.inc(status="error")
+                    self._pending.extendleft(reversed(batch))
+                    raise
+                COMPLETION_FLUSHES.inc(status="ok")
+                COMPLETION_FLUSH_SIZE.observe(len(batch))
+                for segment, _ in batch:
+                    segment.flushed += 1
+                self._collect()
+                COMPLETIONS_PENDING.set(len(self._pending))
+
+    def _collect(self):
+        """Borrar los tramos cerrados cuyas finalizaciones ya están todas escritas"""
+        for segment in list(self._segments):
+            if segment.sealed and segment.flushed >= segment.written:
+                segment.close()
+                os.remove(segment.path)
+                self._segments.remove(segment)
+
+    async def drain(self):
+        """Escribir lo pendiente y cerrar el registro (al apagar)"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Completions left in the log for recovery", extra={"fields": {"pending": len(self._pending)}})
+            for segment in self._segments:
+                segment.close()
+            self._lock.release()
+            return
+        for segment in self._segments:
+            segment.sealed = True
+        self._collect()
+        self._lock.release()
+        try:
+            os.remove(self._lock.path)
+        except OSError:
+            pass
@@ -0,0 +1,145 @@
+"""
+Contenedor de componentes de la aplicación, creados bajo demanda
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from typing import Any, Dict, Optional
+from src.agent import StudyAgent
+from src.cache import TTLCache, cache_enabled, create_database
+from src.completion_buffer import CompletionBuffer, completion_buffer_enabled
+from src.database import Database
+from src.importer import MaterialImporter
+from src.memory import HeapTracer
+from src.pdf_processor import PDFProcessor
+from src.profiling import ProfileStore
+from src.telemetry import get_logger
+from src.usage import UsageRecorder
+from src.workers import FileLock, LeaderScheduler
+
+logger = get_logger("container")
+
+
+class Container:
+    """Crea cada componente la primera vez que se usa
+
+    Importar la aplicación no abre la base de datos ni crea el cliente del
+    LLM; el ciclo de vida (lifespan) llama a startup() y shutdown().
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("DATABASE_PATH", "data/study_agent.db")
+        self.started = False
+
+    @cached_property
+    def db(self) -> Database:
+        return create_database(self.db_path)
+
+    @cached_property
+    def usage_recorder(self) -> UsageRecorder:
+        return UsageRecorder(self.db)
+
+    @cached_property
+    def recommendation_cache(self) -> Optional[TTLCache]:
+        if not cache_enabled():
+            return None
+        return TTLCache(
+            "recommendations",
+            max_entries=int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "512")),
+            ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", "60"))
+        )
+
+    @cached_property
+    def agent(self) -> StudyAgent:
+        return StudyAgent(
+            self.db,
+            usage_recorder=self.usage_recorder,
+            recommendation_cache=self.recommendation_cache
+        )
+
+    @cached_property
+    def pdf_processor(self) -> PDFProcessor:
+        return PDFProcessor()
+
+    @cached_property
+    def import_executor(self) -> ProcessPoolExecutor:
+        """Procesos para extraer el texto de PDFs en la importación masiva"""
+        workers = int(os.getenv("IMPORT_WORKERS", "0")) or None
+        # Sin fork: al crear el pool ya corren hilos (logging, uso del LLM, planificador) y un
+        # hijo copiado con uno de sus cerrojos tomado se bloquearía
+        context = multiprocessing.get_context(os.getenv("IMPORT_START_METHOD", "spawn"))
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+    @cached_property
+    def importer(self) -> MaterialImporter:
+        return MaterialImporter(self.db, self.import_executor)
+
+    @cached_property
+    def completions(self) -> CompletionBuffer:
+        """Finalizaciones de sesión confirmadas desde el registro local y escritas en lotes"""
+        directory = os.getenv("COMPLETION_LOG_DIR") or os.path.join(os.path.dirname(self.db_path) or ".", "completions")
+        return CompletionBuffer(self.db, directory)
+
+    @cached_property
+    def profiles(self) -> ProfileStore:
+        """Perfiles de peticiones guardados para descargarlos desde /admin/profiles"""
+        directory = os.getenv("PROFILE_DIR") or os.path.join(os.path.dirname(self.db_path) or ".", "profiles")
+        return ProfileStore(directory)
+
+    @cached_property
+    def heap(self) -> HeapTracer:
+        """tracemalloc bajo demanda e instantáneas del heap de este worker"""
+        return HeapTracer()
+
+    @cached_property
+    def scheduler(self) -> LeaderScheduler:
+        """Mantenimiento periódico, ejecutado por un solo worker"""
+        scheduler = LeaderScheduler(self.db_path + ".leader.lock")
+        scheduler.add_job("wal_checkpoint", float(os.getenv("SQLITE_CHECKPOINT_SECONDS", "300")), self.db.checkpoint)
+        scheduler.add_job("optimize", float(os.getenv("SQLITE_OPTIMIZE_SECONDS", "3600")), self.db.optimize)
+        return scheduler
+
+    def startup(self):
+        """Preparar la base de datos y los procesos en segundo plano"""
+        # Con varios workers, solo uno a la vez crea tablas y migra
+        with FileLock(self.db_path + ".init.lock"):
+            self.db.initialize()
+        self.usage_recorder.start()
+        if completion_buffer_enabled():
+            self.completions.start()
+        self.scheduler.start()
+        self.started = True
+        logger.info("ready", extra={"fields": {"database": self.db_path, "pid": os.getpid()}})
+
+    async def shutdown(self):
+        """Vaciar el trabajo pendiente de los componentes que llegaron a crearse"""
+        self.started = False
+        if "scheduler" in self.__dict__:
+            self.scheduler.stop()
+        if "completions" in self.__dict__:
+            await self.completions.drain()
+        if "agent" in self.__dict__:
+            await self.agent.question_bank.drain()
+            await self.agent.digests.drain()
+        if "usage_recorder" in self.__dict__:
+            self.usage_recorder.stop()
+        if "import_executor" in self.__dict__:
+            self.import_executor.shutdown(cancel_futures=True)
+        if "db" in self.__dict__:
+            self.db.close()
+
+    def readiness(self) -> Dict[str, Any]:
+        """Comprobar si el proceso puede atender peticiones"""
+        checks = {"started": self.started, "database": False}
+        if self.started:
+            try:
+                checks["database"] = self.db.ping()
+            except Exception as e:
+                logger.warning("Database not ready", extra={"fields": {"error": str(e)}})
+        # El LLM no bloquea la preparación: sin clave solo falla la generación
+        checks["llm_configured"] = bool(os.getenv("OPENAI_API_KEY"))
+        checks["scheduler_leader"] = "scheduler" in self.__dict__ and self.scheduler.is_leader
+        if "agent" in self.__dict__:
+            checks["llm_circuit"] = self.agent.llm.breaker.snapshot()
+        return {"ready": checks["started"] and checks["database"], "checks": checks}
@@ -3,30 +3,154 @@ Capa de persistencia usando SQLite
 """
 import sqlite3
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 import os
+import time
+from src import scheduler
+from src.pagination import decode_cursor, parse_timestamp
+from src.storage import Storage
+from src.telemetry import traced
 
 
-class Database:
-    """Clase para gestionar la persistencia de datos"""
+def timestamp_to_epoch(value: Optional[str]) -> Optional[float]:
+    """Convertir un TIMESTAMP de SQLite (UTC) a segundos epoch"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+# Máximo de parámetros por cláusula IN (SQLite admite 999 en versiones antiguas)
+_IN_CHUNK = 500
+
+_BUMP_VERSION_SQL = """
+    INSERT INTO subject_versions (subject_id, version) VALUES (?, 1)
+    ON CONFLICT (subject_id) DO UPDATE SET version = subject_versions.version + 1
+"""
+
+_SAVE_SCHEDULE_SQL = """
+    INSERT INTO topic_schedule
+        (topic_id, subject_id, stability, ease, repetitions, lapses, due_at, last_reviewed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (topic_id) DO UPDATE SET
+        stability = excluded.stability,
+        ease = excluded.ease,
+        repetitions = excluded.repetitions,
+        lapses = excluded.lapses,
+        due_at = excluded.due_at,
+        last_reviewed_at = excluded.last_reviewed_at
+"""
+
+_QUIZ_ANSWER_SQL = """
+    UPDATE quiz_questions
+    SET times_correct = times_correct + ?,
+        times_wrong = times_wrong + ?
+    WHERE id = ? AND topic_id = ?
+"""
+
+
+# Estadísticas diarias: sesiones, minutos, preguntas, aciertos, suma de aciertos por sesión
+# (para la media de porcentajes) y sesiones por quintil de acierto
+DAILY_STATS_COLUMNS = (
+    "sessions", "minutes", "questions", "correct", "accuracy_sum",
+    "bucket_0", "bucket_1", "bucket_2", "bucket_3", "bucket_4"
+)
+_ACCURACY_BUCKETS = 5
+
+
+def _daily_upsert_sql(table: str, keys: tuple) -> str:
+    """Sumar un incremento a la fila diaria, creándola si no existe"""
+    columns = (*keys, "day", *DAILY_STATS_COLUMNS)
+    conflict = (keys[0], "day")
+    updates = ",\n        ".join(f"{column} = {table}.{column} + excluded.{column}" for column in DAILY_STATS_COLUMNS)
+    return f"""
+    INSERT INTO {table} ({', '.join(columns)})
+    VALUES ({', '.join('?' for _ in columns)})
+    ON CONFLICT ({', '.join(conflict)}) DO UPDATE SET
+        {updates}
+"""
+
+
+_TOPIC_DAILY_SQL = _daily_upsert_sql("topic_daily_stats", ("topic_id", "subject_id"))
+_SUBJECT_DAILY_SQL = _daily_upsert_sql("subject_daily_stats", ("subject_id",))
+
+
+def accuracy_bucket(score: int, total_questions: int) -> int:
+    """Quintil de acierto de una sesión (0: menos del 20 %, 4: 80 % o más)"""
+    if total_questions <= 0:
+        return 0
+    return min(score * _ACCURACY_BUCKETS // total_questions, _ACCURACY_BUCKETS - 1)
+
+
+def _daily_stats_params(sessions: List[tuple]) -> tuple:
+    """Incrementos por (tema, día) y (materia, día) de unas sesiones
+
+    Cada sesión es (topic_id, subject_id, day, duration, score, total_questions).
+    """
+    topics: Dict[tuple, List[float]] = {}
+    subjects: Dict[tuple, List[float]] = {}
+    for topic_id, subject_id, day, duration, score, total_questions in sessions:
+        if subject_id is None:
+            continue
+        delta = [1, duration, total_questions, score, score / total_questions if total_questions > 0 else 0.0]
+        delta += [0] * _ACCURACY_BUCKETS
+        delta[5 + accuracy_bucket(score, total_questions)] = 1
+        for totals, key in ((topics, (topic_id, subject_id, day)), (subjects, (subject_id, day))):
+            current = totals.get(key)
+            totals[key] = delta if current is None else [a + b for a, b in zip(current, delta)]
+    return (
+        [(*key, *values) for key, values in topics.items()],
+        [(*key, *values) for key, values in subjects.items()]
+    )
+
+
+def _utc_timestamp(epoch: float) -> str:
+    """Segundos epoch en el formato de CURRENT_TIMESTAMP (UTC)"""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _schedule_params(topic_id: int, subject_id: int, state: Dict[str, Any]) -> tuple:
+    return (
+        topic_id, subject_id, state['stability'], state['ease'], state['repetitions'],
+        state['lapses'], state['due_at'], state['last_reviewed_at']
+    )
+
+
+def _quiz_answer_params(topic_id: int, answers: List[Dict[str, Any]]) -> List[tuple]:
+    # Las respuestas a preguntas de otro tema no coinciden con ninguna fila y se ignoran
+    return [(1 if a['correct'] else 0, 0 if a['correct'] else 1, a['question_id'], topic_id) for a in answers]
+
+
+class Database(Storage):
+    """Clase para gestionar la persistencia de datos (SQLite)"""
     
     def __init__(self, db_path: str = "data/study_agent.db"):
         """Inicializar la conexión a la base de datos"""
         self.db_path = db_path
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Con varios workers las escrituras se serializan: esperar el cerrojo en vez de fallar
+        self.busy_timeout = float(os.getenv("SQLITE_BUSY_TIMEOUT", "10"))
     
     def get_connection(self):
         """Obtener una conexión a la base de datos"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
         conn.row_factory = sqlite3.Row
+        # En modo WAL, NORMAL es seguro ante caídas del proceso y evita un fsync por commit
+        conn.execute("PRAGMA synchronous=NORMAL")
         return conn
     
+    @traced("db.initialize")
     def initialize(self):
         """Crear las tablas necesarias en la base de datos"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        # WAL permite lectores concurrentes con un escritor; el modo queda guardado en el archivo
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
         # Tabla de materias
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS subjects (
@@ -74,9 +198,274 @@ class Database:
             )
         """)
         
+        # Tabla de uso del LLM (tokens y latencia por llamada)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                model TEXT NOT NULL,
+                subject_id INTEGER,
+                topic_id INTEGER,
+                duration INTEGER,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                latency_ms REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls(created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_subject ON llm_calls(subject_id, created_at)")
+        
+        # Banco de preguntas por tema (deduplicadas por hash del enunciado)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS quiz_questions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic_id INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                options TEXT NOT NULL,
+                correct_answer INTEGER NOT NULL,
+                question_hash TEXT NOT NULL,
+                source TEXT,
+                times_served INTEGER NOT NULL DEFAULT 0,
+                times_correct INTEGER NOT NULL DEFAULT 0,
+                times_wrong INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (topic_id, question_hash),
+                FOREIGN KEY (topic_id) REFERENCES topics(id)
+            )
+        """)
+        
+        # Estado de repaso espaciado por tema, con índice por fecha de vencimiento
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS topic_schedule (
+                topic_id INTEGER PRIMARY KEY,
+                subject_id INTEGER NOT NULL,
+                stability REAL NOT NULL DEFAULT 0,
+                ease REAL NOT NULL,
+                repetitions INTEGER NOT NULL DEFAULT 0,
+                lapses INTEGER NOT NULL DEFAULT 0,
+                due_at REAL NOT NULL,
+                last_reviewed_at REAL,
+                FOREIGN KEY (topic_id) REFERENCES topics(id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_schedule_due ON topic_schedule(subject_id, due_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_content_topic ON topic_content(topic_id, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_study_sessions_topic ON study_sessions(topic_id, completed_at)")
+        
+        # Materia desnormalizada en el historial para paginarlo por (completed_at, id) con índice
+        if self._ensure_column(cursor, "study_sessions", "subject_id", "INTEGER"):
+            cursor.execute("""
+                UPDATE study_sessions
+                SET subject_id = (SELECT t.subject_id FROM topics t WHERE t.id = study_sessions.topic_id)
+            """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_study_sessions_subject_completed ON study_sessions(subject_id, completed_at, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_subjects_created ON subjects(created_at, id)")
+        
+        # Contador de versión por materia (subject_id 0 = listado de materias) para ETags
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS subject_versions (
+                subject_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_topics_subject_created ON topics(subject_id, created_at, id)")
+        
+        # Resumen y esquema del material de cada tema, ligados al hash del contenido resumido
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS topic_digest (
+                topic_id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                outline TEXT NOT NULL,
+                model TEXT,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (topic_id) REFERENCES topics(id)
+            )
+        """)
+        
+        # Sesiones generadas (contenido y quiz en JSON comprimido) para reanudarlas sin el LLM
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS generated_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic_id INTEGER NOT NULL,
+                subject_id INTEGER NOT NULL,
+                duration INTEGER NOT NULL,
+                model TEXT,
+                prompt_hash TEXT,
+                payload BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (topic_id) REFERENCES topics(id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_generated_sessions_topic ON generated_sessions(topic_id, id)")
+        self._ensure_column(cursor, "study_sessions", "generated_session_id", "INTEGER")
+        
+        # Clave de cada finalización encolada: reproducir el registro tras una caída no duplica sesiones
+        self._ensure_column(cursor, "study_sessions", "completion_key", "TEXT")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_study_sessions_completion_key ON study_sessions(completion_key)")
+        
+        # Estadísticas diarias por tema y por materia, mantenidas al registrar cada sesión
+        daily_columns = ",\n                ".join(
+            f"{column} {'REAL' if column == 'accuracy_sum' else 'INTEGER'} NOT NULL DEFAULT 0"
+            for column in DAILY_STATS_COLUMNS
+        )
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS topic_daily_stats (
+                topic_id INTEGER NOT NULL,
+                subject_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                {daily_columns},
+                PRIMARY KEY (topic_id, day)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_daily_stats_subject ON topic_daily_stats(subject_id, day)")
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS subject_daily_stats (
+                subject_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                {daily_columns},
+                PRIMARY KEY (subject_id, day)
+            )
+        """)
+        
+        self._backfill_topic_schedule(cursor)
+        self._backfill_daily_stats(cursor)
+        
+        conn.commit()
+        conn.close()
+    
+    def _ensure_column(self, cursor, table: str, column: str, definition: str) -> bool:
+        """Agregar una columna si no existe; devuelve True si se agregó"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if any(row['name'] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    
+    def _keyset_conditions(
+        self,
+        column: str,
+        id_column: str,
+        cursor_token: Optional[str],
+        since: Optional[str],
+        until: Optional[str]
+    ):
+        """Construir condiciones de rango de fechas y de posición (orden descendente)"""
+        conditions = []
+        params: List[Any] = []
+        if since:
+            conditions.append(f"{column} >= ?")
+            params.append(parse_timestamp(since, "since"))
+        if until:
+            conditions.append(f"{column} < ?")
+            params.append(parse_timestamp(until, "until"))
+        if cursor_token:
+            sort_value, row_id = decode_cursor(cursor_token)
+            conditions.append(f"({column}, {id_column}) < (?, ?)")
+            params.extend([sort_value, row_id])
+        return conditions, params
+    
+    def _bump_version(self, cursor, subject_id: int):
+        """Incrementar la versión de una materia dentro de la transacción en curso"""
+        cursor.execute(_BUMP_VERSION_SQL, (subject_id,))
+    
+    def _backfill_topic_schedule(self, cursor):
+        """Crear el estado de repaso de los temas que aún no lo tienen, reproduciendo su historial"""
+        cursor.execute("""
+            SELECT t.id, t.subject_id, t.created_at
+            FROM topics t
+            LEFT JOIN topic_schedule ts ON ts.topic_id = t.id
+            WHERE ts.topic_id IS NULL
+        """)
+        missing = cursor.fetchall()
+        
+        for topic in missing:
+            state = scheduler.initial_state(timestamp_to_epoch(topic['created_at']) or time.time())
+            cursor.execute(
+                "SELECT score, total_questions, completed_at FROM study_sessions WHERE topic_id = ? ORDER BY completed_at",
+                (topic['id'],)
+            )
+            for session in cursor.fetchall():
+                state = scheduler.review(
+                    state,
+                    session['score'],
+                    session['total_questions'],
+                    timestamp_to_epoch(session['completed_at'])
+                )
+            self._save_topic_schedule(cursor, topic['id'], topic['subject_id'], state)
+    
+    # Expresión que extrae el día (UTC) de una columna TIMESTAMP
+    _DAY_EXPRESSION = "date({})"
+    
+    def _backfill_daily_stats(self, cursor):
+        """Construir las estadísticas diarias si aún no existen pero hay historial"""
+        cursor.execute("SELECT 1 FROM subject_daily_stats LIMIT 1")
+        if cursor.fetchone():
+            return
+        cursor.execute("SELECT 1 FROM study_sessions LIMIT 1")
+        if cursor.fetchone():
+            self._rebuild_daily_stats(cursor)
+    
+    def _rebuild_daily_stats(self, cursor, subject_ids: Optional[List[int]] = None):
+        """Recalcular desde study_sessions las estadísticas diarias de unas materias (o de todas)"""
+        where, params = "", []
+        if subject_ids is not None:
+            if not subject_ids:
+                return
+            where = f"AND subject_id IN ({', '.join('?' for _ in subject_ids)})"
+            params = list(subject_ids)
+        day = self._DAY_EXPRESSION.format("completed_at")
+        # Quintil k: k/5 <= score/total < (k+1)/5 (como accuracy_bucket), sin divisiones
+        # para que el resultado sea el mismo en SQLite y en PostgreSQL
+        buckets = []
+        for k in range(_ACCURACY_BUCKETS):
+            if k == 0:
+                condition = f"total_questions <= 0 OR score * {_ACCURACY_BUCKETS} < total_questions"
+            else:
+                condition = f"total_questions > 0 AND score * {_ACCURACY_BUCKETS} >= {k} * total_questions"
+                if k < _ACCURACY_BUCKETS - 1:
+                    condition += f" AND score * {_ACCURACY_BUCKETS} < {k + 1} * total_questions"
+            buckets.append(f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END)")
+        aggregates = f"""
+            COUNT(*), SUM(duration), SUM(total_questions), SUM(score),
+            SUM(CASE WHEN total_questions > 0 THEN CAST(score AS FLOAT) / total_questions ELSE 0 END),
+            {', '.join(buckets)}
+        """
+        columns = ", ".join(DAILY_STATS_COLUMNS)
+        for table, keys in (("topic_daily_stats", "topic_id, subject_id"), ("subject_daily_stats", "subject_id")):
+            cursor.execute(f"DELETE FROM {table} WHERE 1 = 1 {where}", params)
+            cursor.execute(f"""
+                INSERT INTO {table} ({keys}, day, {columns})
+                SELECT {keys}, {day}, {aggregates}
+                FROM study_sessions
+                WHERE subject_id IS NOT NULL {where}
+                GROUP BY {keys}, {day}
+            """, params)
+    
+    @traced("db.rebuild_daily_stats")
+    def rebuild_daily_stats(self, subject_ids: Optional[List[int]] = None):
+        """Recalcular las estadísticas diarias (tras escribir study_sessions por fuera, p. ej. al importar)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        self._rebuild_daily_stats(cursor, subject_ids)
         conn.commit()
         conn.close()
     
+    def _save_daily_stats(self, cursor, sessions: List[tuple]):
+        """Sumar unas sesiones a las estadísticas diarias dentro de la transacción en curso"""
+        topic_rows, subject_rows = _daily_stats_params(sessions)
+        if topic_rows:
+            cursor.executemany(_TOPIC_DAILY_SQL, topic_rows)
+            cursor.executemany(_SUBJECT_DAILY_SQL, subject_rows)
+    
+    def _save_topic_schedule(self, cursor, topic_id: int, subject_id: int, state: Dict[str, Any]):
+        """Insertar o actualizar el estado de repaso de un tema"""
+        cursor.execute(_SAVE_SCHEDULE_SQL, _schedule_params(topic_id, subject_id, state))
+    
+    @traced("db.create_subject")
     def create_subject(self, name: str, description: Optional[str] = None) -> Dict[str, Any]:
         """Crear una nueva materia"""
         conn = self.get_connection()
@@ -87,12 +476,15 @@ class Database:
             (name, description)
         )
         subject_id = cursor.lastrowid
+        self._bump_version(cursor, 0)
+        self._bump_version(cursor, subject_id)
         
         conn.commit()
         conn.close()
         
         return self.get_subject(subject_id)
     
+    @traced("db.get_subject")
     def get_subject(self, subject_id: int) -> Optional[Dict[str, Any]]:
         """Obtener una materia por ID"""
         conn = self.get_connection()
@@ -106,17 +498,48 @@ class Database:
             return dict(row)
         return None
     
-    def get_all_subjects(self) -> List[Dict[str, Any]]:
-        """Obtener todas las materias"""
+    @traced("db.get_subject_version")
+    def get_subject_version(self, subject_id: int) -> int:
+        """Obtener la versión actual de una materia (0 = listado de materias)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT * FROM subjects ORDER BY created_at DESC")
+        cursor.execute("SELECT version FROM subject_versions WHERE subject_id = ?", (subject_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        return row['version'] if row else 0
+    
+    @traced("db.get_all_subjects")
+    def get_all_subjects(
+        self,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Obtener las materias, más recientes primero
+        
+        Con limit se devuelve hasta limit + 1 filas para que quien llama sepa si
+        hay página siguiente; cursor_token continúa tras la última fila vista.
+        """
+        conditions, params = self._keyset_conditions("created_at", "id", cursor_token, since, until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT ?"
+            params.append(limit + 1)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f"SELECT * FROM subjects {where} ORDER BY created_at DESC, id DESC {limit_clause}", params)
         rows = cursor.fetchall()
         conn.close()
         
         return [dict(row) for row in rows]
     
+    @traced("db.create_topic")
     def create_topic(self, subject_id: int, name: str, description: Optional[str] = None) -> Dict[str, Any]:
         """Crear un nuevo tema"""
         conn = self.get_connection()
@@ -128,11 +551,16 @@ class Database:
         )
         topic_id = cursor.lastrowid
         
+        # Un tema nuevo vence de inmediato en la cola de repaso
+        self._save_topic_schedule(cursor, topic_id, subject_id, scheduler.initial_state(time.time()))
+        self._bump_version(cursor, subject_id)
+        
         conn.commit()
         conn.close()
         
         return self.get_topic(topic_id)
     
+    @traced("db.get_topic")
     def get_topic(self, topic_id: int) -> Optional[Dict[str, Any]]:
         """Obtener un tema por ID"""
         conn = self.get_connection()
@@ -140,9 +568,8 @@ class Database:
         
         cursor.execute("""
             SELECT t.*, 
-                   CASE WHEN tc.id IS NOT NULL THEN 1 ELSE 0 END as has_content
+                   EXISTS (SELECT 1 FROM topic_content tc WHERE tc.topic_id = t.id) as has_content
             FROM topics t
-            LEFT JOIN topic_content tc ON t.id = tc.topic_id
             WHERE t.id = ?
         """, (topic_id,))
         row = cursor.fetchone()
@@ -152,24 +579,42 @@ class Database:
             return dict(row)
         return None
     
-    def get_topics_by_subject(self, subject_id: int) -> List[Dict[str, Any]]:
-        """Obtener todos los temas de una materia"""
+    @traced("db.get_topics_by_subject")
+    def get_topics_by_subject(
+        self,
+        subject_id: int,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Obtener los temas de una materia, más recientes primero (paginable como get_all_subjects)"""
+        conditions, params = self._keyset_conditions("t.created_at", "t.id", cursor_token, since, until)
+        where = " AND ".join(["t.subject_id = ?", *conditions])
+        params.insert(0, subject_id)
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT ?"
+            params.append(limit + 1)
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
+        # EXISTS evita duplicar el tema cuando tiene varios PDFs cargados
+        cursor.execute(f"""
             SELECT t.*,
-                   CASE WHEN tc.id IS NOT NULL THEN 1 ELSE 0 END as has_content
+                   EXISTS (SELECT 1 FROM topic_content tc WHERE tc.topic_id = t.id) as has_content
             FROM topics t
-            LEFT JOIN topic_content tc ON t.id = tc.topic_id
-            WHERE t.subject_id = ?
-            ORDER BY t.created_at DESC
-        """, (subject_id,))
+            WHERE {where}
+            ORDER BY t.created_at DESC, t.id DESC
+            {limit_clause}
+        """, params)
         rows = cursor.fetchall()
         conn.close()
         
         return [dict(row) for row in rows]
     
+    @traced("db.save_topic_content")
     def save_topic_content(self, topic_id: int, content: str, source_file: str):
         """Guardar el contenido extraído de un PDF"""
         conn = self.get_connection()
@@ -179,10 +624,47 @@ class Database:
             "INSERT INTO topic_content (topic_id, content, source_file) VALUES (?, ?, ?)",
             (topic_id, content, source_file)
         )
+        # El resumen del material anterior ya no corresponde
+        cursor.execute("DELETE FROM topic_digest WHERE topic_id = ?", (topic_id,))
+        
+        cursor.execute("SELECT subject_id FROM topics WHERE id = ?", (topic_id,))
+        topic = cursor.fetchone()
+        if topic:
+            self._bump_version(cursor, topic['subject_id'])
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.save_topic_contents")
+    def save_topic_contents(self, items: List[Dict[str, Any]]):
+        """Guardar el contenido de varios PDFs en una sola transacción
+        
+        Cada elemento lleva topic_id, content y source_file.
+        """
+        if not items:
+            return
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany(
+            "INSERT INTO topic_content (topic_id, content, source_file) VALUES (:topic_id, :content, :source_file)",
+            items
+        )
+        
+        topic_ids = sorted({item['topic_id'] for item in items})
+        cursor.executemany("DELETE FROM topic_digest WHERE topic_id = ?", [(topic_id,) for topic_id in topic_ids])
+        cursor.execute(
+            f"SELECT DISTINCT subject_id FROM topics WHERE id IN ({','.join('?' for _ in topic_ids)})",
+            topic_ids
+        )
+        for row in cursor.fetchall():
+            self._bump_version(cursor, row['subject_id'])
         
         conn.commit()
         conn.close()
     
+    @traced("db.get_topic_content")
     def get_topic_content(self, topic_id: int) -> Optional[str]:
         """Obtener el contenido de un tema"""
         conn = self.get_connection()
@@ -199,37 +681,385 @@ class Database:
             return row['content']
         return None
     
-    def record_session_completion(self, topic_id: int, duration: int, score: int, total_questions: int):
-        """Registrar la finalización de una sesión de estudio"""
+    @traced("db.get_topic_digest")
+    def get_topic_digest(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        """Obtener el resumen del material de un tema (con el hash del contenido resumido)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT * FROM topic_digest WHERE topic_id = ?", (topic_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        return dict(row) if row else None
+    
+    @traced("db.save_topic_digest")
+    def save_topic_digest(self, topic_id: int, content_hash: str, digest: str, outline: str, model: str, chunks: int):
+        """Guardar el resumen del material de un tema, reemplazando el anterior"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Borrar e insertar en la misma transacción: created_at toma el valor por defecto del backend
+        cursor.execute("DELETE FROM topic_digest WHERE topic_id = ?", (topic_id,))
+        cursor.execute(
+            "INSERT INTO topic_digest (topic_id, content_hash, digest, outline, model, chunks) VALUES (?, ?, ?, ?, ?, ?)",
+            (topic_id, content_hash, digest, outline, model, chunks)
+        )
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.save_generated_session")
+    def save_generated_session(
+        self,
+        topic_id: int,
+        subject_id: int,
+        duration: int,
+        model: Optional[str],
+        prompt_hash: Optional[str],
+        payload: bytes
+    ) -> int:
+        """Guardar una sesión generada (payload comprimido); devuelve su id"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            INSERT INTO generated_sessions (topic_id, subject_id, duration, model, prompt_hash, payload)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (topic_id, subject_id, duration, model, prompt_hash, payload))
+        session_id = cursor.lastrowid
+        
+        conn.commit()
+        conn.close()
+        
+        return session_id
+    
+    @traced("db.get_generated_session")
+    def get_generated_session(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """Obtener una sesión generada por id"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        cursor.execute("SELECT * FROM generated_sessions WHERE id = ?", (session_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        return dict(row) if row else None
+    
+    @traced("db.get_latest_generated_session")
+    def get_latest_generated_session(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        """Obtener la última sesión generada de un tema (usa idx_generated_sessions_topic)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "SELECT * FROM generated_sessions WHERE topic_id = ? ORDER BY id DESC LIMIT 1",
+            (topic_id,)
+        )
+        row = cursor.fetchone()
+        conn.close()
+        
+        return dict(row) if row else None
+    
+    @traced("db.record_session_completion")
+    def record_session_completion(
+        self,
+        topic_id: int,
+        duration: int,
+        score: int,
+        total_questions: int,
+        generated_session_id: Optional[int] = None
+    ):
+        """Registrar la finalización de una sesión de estudio y reprogramar su repaso"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT * FROM topic_schedule WHERE topic_id = ?", (topic_id,))
+        row = cursor.fetchone()
+        if row:
+            subject_id = row['subject_id']
+            state = dict(row)
+        else:
+            cursor.execute("SELECT subject_id FROM topics WHERE id = ?", (topic_id,))
+            topic = cursor.fetchone()
+            subject_id = topic['subject_id'] if topic else None
+            state = None
+        
+        now = time.time()
+        completed_at = _utc_timestamp(now)
         cursor.execute(
-            "INSERT INTO study_sessions (topic_id, duration, score, total_questions) VALUES (?, ?, ?, ?)",
-            (topic_id, duration, score, total_questions)
+            """
+            INSERT INTO study_sessions
+                (topic_id, subject_id, duration, score, total_questions, generated_session_id, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (topic_id, subject_id, duration, score, total_questions, generated_session_id, completed_at)
         )
         
+        if subject_id is not None:
+            state = scheduler.review(state, score, total_questions, now)
+            self._save_topic_schedule(cursor, topic_id, subject_id, state)
+            self._save_daily_stats(cursor, [(topic_id, subject_id, completed_at[:10], duration, score, total_questions)])
+            self._bump_version(cursor, subject_id)
+        
         conn.commit()
         conn.close()
     
-    def get_study_history(self, subject_id: int) -> List[Dict[str, Any]]:
-        """Obtener el historial de estudio de una materia"""
+    @traced("db.record_session_completions")
+    def record_session_completions(self, completions: List[Dict[str, Any]]) -> List[int]:
+        """Registrar un lote de sesiones completadas en una sola transacción
+        
+        Cada elemento lleva completion_key, topic_id, duration, score,
+        total_questions, completed_at (epoch), generated_session_id y answers.
+        El repaso, las versiones y las estadísticas del banco se actualizan en
+        la misma transacción. Las claves ya registradas se ignoran, así que
+        reproducir un lote no duplica sesiones. Devuelve las materias afectadas.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        keys = list({c['completion_key'] for c in completions})
+        existing = set()
+        for start in range(0, len(keys), _IN_CHUNK):
+            chunk = keys[start:start + _IN_CHUNK]
+            cursor.execute(
+                f"SELECT completion_key FROM study_sessions WHERE completion_key IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            existing.update(row[0] for row in cursor.fetchall())
+        
+        pending = []
+        for completion in sorted(completions, key=lambda c: c['completed_at']):
+            if completion['completion_key'] not in existing:
+                existing.add(completion['completion_key'])
+                pending.append(completion)
+        
+        # Estado de repaso y materia de los temas del lote, en dos consultas
+        topic_ids = list({c['topic_id'] for c in pending})
+        states: Dict[int, Optional[Dict[str, Any]]] = {}
+        subjects: Dict[int, int] = {}
+        for start in range(0, len(topic_ids), _IN_CHUNK):
+            chunk = topic_ids[start:start + _IN_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f"SELECT * FROM topic_schedule WHERE topic_id IN ({placeholders})", chunk)
+            for row in cursor.fetchall():
+                states[row['topic_id']] = dict(row)
+                subjects[row['topic_id']] = row['subject_id']
+            cursor.execute(f"SELECT id, subject_id FROM topics WHERE id IN ({placeholders})", chunk)
+            for row in cursor.fetchall():
+                subjects.setdefault(row['id'], row['subject_id'])
+        
+        sessions, daily, answers = [], [], []
+        for completion in pending:
+            topic_id = completion['topic_id']
+            subject_id = subjects.get(topic_id)
+            completed_at = _utc_timestamp(completion['completed_at'])
+            sessions.append((
+                topic_id, subject_id, completion['duration'], completion['score'], completion['total_questions'],
+                completion.get('generated_session_id'), completion['completion_key'], completed_at
+            ))
+            daily.append((
+                topic_id, subject_id, completed_at[:10],
+                completion['duration'], completion['score'], completion['total_questions']
+            ))
+            if subject_id is not None:
+                states[topic_id] = scheduler.review(
+                    states.get(topic_id), completion['score'], completion['total_questions'], completion['completed_at']
+                )
+            answers.extend(_quiz_answer_params(topic_id, completion.get('answers') or []))
+        
+        cursor.executemany("""
+            INSERT INTO study_sessions
+                (topic_id, subject_id, duration, score, total_questions, generated_session_id, completion_key, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, sessions)
+        cursor.executemany(_SAVE_SCHEDULE_SQL, [
+            _schedule_params(topic_id, subjects[topic_id], state) for topic_id, state in states.items()
+        ])
+        self._save_daily_stats(cursor, daily)
+        subject_ids = sorted({subjects[c['topic_id']] for c in pending if c['topic_id'] in subjects})
+        cursor.executemany(_BUMP_VERSION_SQL, [(subject_id,) for subject_id in subject_ids])
+        if answers:
+            cursor.executemany(_QUIZ_ANSWER_SQL, answers)
+        
+        conn.commit()
+        conn.close()
+        
+        return subject_ids
+    
+    @traced("db.get_due_topics")
+    def get_due_topics(self, subject_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Obtener los temas que vencen primero en la cola de repaso (usa el índice por vencimiento)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
-            SELECT ss.*, t.name as topic_name, s.name as subject_name
+            SELECT t.*,
+                   EXISTS (SELECT 1 FROM topic_content tc WHERE tc.topic_id = t.id) as has_content,
+                   ts.stability, ts.ease, ts.repetitions, ts.lapses, ts.due_at, ts.last_reviewed_at
+            FROM (
+                SELECT * FROM topic_schedule
+                WHERE subject_id = ?
+                ORDER BY due_at
+                LIMIT ?
+            ) ts
+            JOIN topics t ON t.id = ts.topic_id
+            ORDER BY ts.due_at
+        """, (subject_id, limit))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @traced("db.get_topic_stats_columns")
+    def get_topic_stats_columns(self, subject_ids: Optional[List[int]] = None) -> List[tuple]:
+        """Obtener estadísticas numéricas de todos los temas en una sola consulta agregada
+        
+        Devuelve tuplas (topic_id, subject_id, has_content, session_count,
+        last_studied_epoch, avg_performance) para la ruta columnar. Los valores
+        ausentes se codifican como -1 para poder cargarlos en arreglos numéricos.
+        """
+        where = ""
+        params: List[Any] = []
+        if subject_ids:
+            where = f"WHERE t.subject_id IN ({','.join('?' for _ in subject_ids)})"
+            params = list(subject_ids)
+        
+        # Sin row_factory: las tuplas se cargan directamente en columnas
+        conn = self.get_connection()
+        conn.row_factory = None
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            SELECT 
+                t.id,
+                t.subject_id,
+                EXISTS (SELECT 1 FROM topic_content tc WHERE tc.topic_id = t.id),
+                COUNT(ss.id),
+                COALESCE(CAST(strftime('%s', MAX(ss.completed_at)) AS INTEGER), -1),
+                COALESCE(AVG(CAST(ss.score AS FLOAT) / NULLIF(ss.total_questions, 0)), -1.0)
+            FROM topics t
+            LEFT JOIN study_sessions ss ON ss.topic_id = t.id
+            {where}
+            GROUP BY t.id
+            ORDER BY t.created_at DESC, t.id DESC
+        """, params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return rows
+    
+    @traced("db.get_topic_labels")
+    def get_topic_labels(self, topic_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Obtener nombre y fecha del último estudio de unos pocos temas"""
+        if not topic_ids:
+            return {}
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            SELECT t.id, t.name,
+                   (SELECT MAX(completed_at) FROM study_sessions ss WHERE ss.topic_id = t.id) as last_studied
+            FROM topics t
+            WHERE t.id IN ({','.join('?' for _ in topic_ids)})
+        """, list(topic_ids))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return {row['id']: dict(row) for row in rows}
+    
+    @traced("db.get_study_history")
+    def get_study_history(
+        self,
+        subject_id: int,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Obtener el historial de estudio de una materia, más reciente primero
+        
+        Pagina por (completed_at, id) sobre idx_study_sessions_subject_completed,
+        de modo que cada página cuesta lo mismo sin importar la profundidad.
+        """
+        conditions, params = self._keyset_conditions("ss.completed_at", "ss.id", cursor_token, since, until)
+        where = " AND ".join(["ss.subject_id = ?", *conditions])
+        params.insert(0, subject_id)
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT ?"
+            params.append(limit + 1)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            SELECT ss.id, ss.topic_id, ss.subject_id, ss.duration, ss.score, ss.total_questions,
+                   ss.completed_at, ss.generated_session_id,
+                   t.name as topic_name, s.name as subject_name
             FROM study_sessions ss
             JOIN topics t ON ss.topic_id = t.id
-            JOIN subjects s ON t.subject_id = s.id
-            WHERE s.id = ?
-            ORDER BY ss.completed_at DESC
-        """, (subject_id,))
+            JOIN subjects s ON ss.subject_id = s.id
+            WHERE {where}
+            ORDER BY ss.completed_at DESC, ss.id DESC
+            {limit_clause}
+        """, params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @traced("db.get_daily_stats")
+    def get_daily_stats(
+        self,
+        subject_id: int,
+        since: str,
+        until: str,
+        topic_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Estadísticas diarias de una materia (o de uno de sus temas) en [since, until)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        if topic_id is None:
+            cursor.execute("""
+                SELECT * FROM subject_daily_stats
+                WHERE subject_id = ? AND day >= ? AND day < ?
+                ORDER BY day
+            """, (subject_id, since, until))
+        else:
+            cursor.execute("""
+                SELECT * FROM topic_daily_stats
+                WHERE topic_id = ? AND subject_id = ? AND day >= ? AND day < ?
+                ORDER BY day
+            """, (topic_id, subject_id, since, until))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @traced("db.get_topic_daily_totals")
+    def get_topic_daily_totals(self, subject_id: int, since: str, until: str) -> List[Dict[str, Any]]:
+        """Estadísticas de cada tema de una materia sumadas en [since, until)"""
+        sums = ", ".join(f"SUM(tds.{column}) AS {column}" for column in DAILY_STATS_COLUMNS)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            SELECT tds.topic_id, t.name AS topic_name, {sums}
+            FROM topic_daily_stats tds
+            JOIN topics t ON t.id = tds.topic_id
+            WHERE tds.subject_id = ? AND tds.day >= ? AND tds.day < ?
+            GROUP BY tds.topic_id, t.name
+            ORDER BY sessions DESC, tds.topic_id
+        """, (subject_id, since, until))
         rows = cursor.fetchall()
         conn.close()
         
         return [dict(row) for row in rows]
     
+    @traced("db.get_topic_statistics")
     def get_topic_statistics(self, topic_id: int) -> Dict[str, Any]:
         """Obtener estadísticas de un tema"""
         conn = self.get_connection()
@@ -240,7 +1070,7 @@ class Database:
             SELECT 
                 COUNT(*) as session_count,
                 MAX(completed_at) as last_studied,
-                AVG(CAST(score AS FLOAT) / CAST(total_questions AS FLOAT)) as avg_performance
+                AVG(CAST(score AS FLOAT) / NULLIF(total_questions, 0)) as avg_performance
             FROM study_sessions
             WHERE topic_id = ?
         """, (topic_id,))
@@ -248,3 +1078,204 @@ class Database:
         conn.close()
         
         return dict(row) if row else {"session_count": 0, "last_studied": None, "avg_performance": 0}
+    
+    @traced("db.record_llm_calls")
+    def record_llm_calls(self, calls: List[Dict[str, Any]]):
+        """Registrar un lote de llamadas al LLM en una sola transacción"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany("""
+            INSERT INTO llm_calls
+                (kind, model, subject_id, topic_id, duration,
+                 prompt_tokens, completion_tokens, cached_tokens, latency_ms)
+            VALUES
+                (:kind, :model, :subject_id, :topic_id, :duration,
+                 :prompt_tokens, :completion_tokens, :cached_tokens, :latency_ms)
+        """, calls)
+        
+        conn.commit()
+        conn.close()
+    
+    @traced("db.get_llm_usage")
+    def get_llm_usage(
+        self,
+        group_by: str,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        subject_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Agregar el uso del LLM por materia, tema, duración, día o modelo"""
+        group_columns = {
+            "subject": "subject_id",
+            "topic": "topic_id",
+            "duration": "duration",
+            "day": "date(created_at)",
+            "model": "model",
+        }
+        if group_by not in group_columns:
+            raise ValueError(f"group_by must be one of: {', '.join(group_columns)}")
+        
+        conditions = []
+        params: List[Any] = []
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(parse_timestamp(since, "since"))
+        if until:
+            conditions.append("created_at < ?")
+            params.append(parse_timestamp(until, "until"))
+        if subject_id is not None:
+            conditions.append("subject_id = ?")
+            params.append(subject_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Se agrupa también por modelo para poder estimar el coste con su precio
+        cursor.execute(f"""
+            SELECT 
+                {group_columns[group_by]} as key,
+                model,
+                COUNT(*) as calls,
+                SUM(prompt_tokens) as prompt_tokens,
+                SUM(completion_tokens) as completion_tokens,
+                SUM(cached_tokens) as cached_tokens,
+                SUM(latency_ms) as latency_ms
+            FROM llm_calls
+            {where}
+            GROUP BY key, model
+            ORDER BY key
+        """, params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @traced("db.add_quiz_questions")
+    def add_quiz_questions(self, topic_id: int, questions: List[Dict[str, Any]], source: str) -> int:
+        """Agregar preguntas al banco del tema, ignorando duplicados; devuelve cuántas se insertaron"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        before = conn.total_changes
+        cursor.executemany("""
+            INSERT INTO quiz_questions
+                (topic_id, question, options, correct_answer, question_hash, source)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (topic_id, question_hash) DO NOTHING
+        """, [
+            (
+                topic_id,
+                q['question'],
+                json.dumps(q['options'], ensure_ascii=False),
+                q['correct_answer'],
+                q['question_hash'],
+                source
+            )
+            for q in questions
+        ])
+        inserted = conn.total_changes - before
+        
+        conn.commit()
+        conn.close()
+        
+        return inserted
+    
+    @traced("db.get_quiz_question_ids")
+    def get_quiz_question_ids(self, topic_id: int, hashes: List[str]) -> Dict[str, int]:
+        """Obtener los ids del banco para un conjunto de hashes de preguntas"""
+        if not hashes:
+            return {}
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        placeholders = ",".join("?" for _ in hashes)
+        cursor.execute(
+            f"SELECT id, question_hash FROM quiz_questions WHERE topic_id = ? AND question_hash IN ({placeholders})",
+            [topic_id, *hashes]
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return {row['question_hash']: row['id'] for row in rows}
+    
+    @traced("db.count_quiz_questions")
+    def count_quiz_questions(self, topic_id: int) -> int:
+        """Contar las preguntas disponibles en el banco del tema"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT COUNT(*) FROM quiz_questions WHERE topic_id = ?", (topic_id,))
+        count = cursor.fetchone()[0]
+        conn.close()
+        
+        return count
+    
+    @traced("db.sample_quiz_questions")
+    def sample_quiz_questions(self, topic_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Tomar preguntas del banco priorizando las menos vistas o falladas, y marcarlas como servidas"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Cada fallo cuenta como dos servidas menos; el azar desempata
+        cursor.execute("""
+            SELECT id, question, options, correct_answer
+            FROM quiz_questions
+            WHERE topic_id = ?
+            ORDER BY times_served - 2 * times_wrong ASC, RANDOM()
+            LIMIT ?
+        """, (topic_id, limit))
+        rows = cursor.fetchall()
+        
+        # Solo se marcan como servidas si el banco pudo cubrir el quiz completo
+        if len(rows) == limit:
+            cursor.executemany(
+                "UPDATE quiz_questions SET times_served = times_served + 1 WHERE id = ?",
+                [(row['id'],) for row in rows]
+            )
+            conn.commit()
+        conn.close()
+        
+        return [
+            {
+                'id': row['id'],
+                'question': row['question'],
+                'options': json.loads(row['options']),
+                'correct_answer': row['correct_answer']
+            }
+            for row in rows
+        ]
+    
+    @traced("db.record_quiz_answers")
+    def record_quiz_answers(self, topic_id: int, answers: List[Dict[str, Any]]):
+        """Actualizar aciertos y fallos de las preguntas del banco del tema"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany(_QUIZ_ANSWER_SQL, _quiz_answer_params(topic_id, answers))
+        
+        conn.commit()
+        conn.close()
+    
+    def ping(self) -> bool:
+        """Comprobar que la base de datos responde"""
+        conn = self.get_connection()
+        conn.execute("SELECT 1")
+        conn.close()
+        return True
+    
+    @traced("db.checkpoint")
+    def checkpoint(self):
+        """Volcar el WAL al archivo principal y truncarlo"""
+        conn = self.get_connection()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+    
+    @traced("db.optimize")
+    def optimize(self):
+        """Actualizar las estadísticas del planificador de consultas si hace falta"""
+        conn = self.get_connection()
+        conn.execute("PRAGMA optimize")
+        conn.close()
@@ -0,0 +1,71 @@
+"""
+Sesiones en modo degradado, cuando el LLM no está disponible
+
+Se sirve la última sesión generada para el tema o, si no hay, una sesión
+armada solo con el material guardado (el resumen del documento o sus
+primeros fragmentos) y un quiz del banco de preguntas.
+"""
+import re
+from typing import Any, Dict, List, Optional
+from src.models import QuizQuestion, SessionResponse
+from src.pdf_processor import PDFProcessor
+from src.telemetry import REGISTRY
+
+DEGRADED_SESSIONS = REGISTRY.counter(
+    "studysprint_degraded_sessions_total",
+    "Sesiones servidas sin el LLM, por origen",
+    ("source",)
+)
+
+# Caracteres aproximados por palabra en español, para dimensionar el material
+_CHARS_PER_WORD = 6
+
+
+def outline_concepts(outline: str, limit: int = 5) -> List[str]:
+    """Secciones de primer nivel del esquema como conceptos clave"""
+    concepts = []
+    for line in outline.splitlines():
+        match = re.match(r"^[-*]\s+(.+)", line)
+        if match:
+            concepts.append(match.group(1).strip())
+        if len(concepts) >= limit:
+            break
+    return concepts
+
+
+def reference_session(
+    topic: Dict[str, Any],
+    duration: int,
+    content: Optional[str],
+    digest: Optional[Dict[str, Any]],
+    quiz: List[QuizQuestion]
+) -> Optional[SessionResponse]:
+    """Armar una sesión con el material del tema; None si el tema no tiene material"""
+    if digest:
+        body = f"## Esquema\n\n{digest['outline']}\n\n## Resumen del material\n\n{digest['digest']}"
+        key_concepts = outline_concepts(digest['outline'])
+    elif content:
+        # Tantos fragmentos como quepan en la lectura de la duración pedida
+        budget = 200 * duration * _CHARS_PER_WORD
+        chunks = PDFProcessor().segment_content(content, max_chars=min(budget, 5000))
+        selected, size = [], 0
+        for chunk in chunks:
+            if selected and size + len(chunk) > budget:
+                break
+            selected.append(chunk)
+            size += len(chunk)
+        body = "## Material de referencia\n\n" + "\n\n".join(selected)[:budget]
+        key_concepts = []
+    else:
+        return None
+
+    return SessionResponse(
+        topic_id=topic['id'],
+        topic_name=topic['name'],
+        duration=duration,
+        learning_objective=f"Repasar el material de referencia de {topic['name']}.",
+        content=body,
+        key_concepts=key_concepts,
+        quiz=quiz,
+        degraded=True
+    )
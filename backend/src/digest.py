@@ -0,0 +1,154 @@
+"""
+Resumen del material de cada tema, preparado al subir el PDF
+
+El texto se divide en fragmentos que se resumen en paralelo (map) y los
+resúmenes se combinan en un resumen y un esquema del documento (reduce).
+Cada resumen guarda el hash del contenido del que salió: si el tema recibe
+otro PDF, el resumen anterior deja de usarse y se vuelve a construir.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Any, Dict, List, Optional, Set
+from src.pdf_processor import PDFProcessor
+from src.telemetry import REGISTRY, get_logger, span
+from src.usage import usage_context
+
+logger = get_logger("digest")
+
+DIGEST_BUILDS = REGISTRY.counter(
+    "studysprint_digest_builds_total",
+    "Resúmenes de material construidos al subir PDFs",
+    ("status",)
+)
+DIGEST_CHUNKS = REGISTRY.counter(
+    "studysprint_digest_chunks_total",
+    "Fragmentos de material resumidos en la fase map"
+)
+
+
+def digest_enabled() -> bool:
+    """Indicar si se resumen los PDFs al subirlos (DIGEST_ENABLED, desactivado por defecto)"""
+    return os.getenv("DIGEST_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+
+
+def content_hash(content: str) -> str:
+    """Hash del contenido resumido, para saber si el resumen sigue vigente"""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class DigestBuilder:
+    """Construye en segundo plano el resumen del material de los temas"""
+
+    def __init__(self, database, llm):
+        """Configurar tamaños y paralelismo a partir de variables de entorno"""
+        self.db = database
+        self.llm = llm
+        self.processor = PDFProcessor()
+        # Material más corto que esto cabe entero en el prompt: no se resume
+        self.min_chars = int(os.getenv("DIGEST_MIN_CHARS", "3000"))
+        # Caracteres por fragmento de la fase map
+        self.chunk_chars = int(os.getenv("DIGEST_CHUNK_CHARS", "6000"))
+        # Llamadas map simultáneas por documento
+        self.concurrency = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+        # Caracteres máximos de resúmenes por llamada reduce (si hay más se combinan por grupos)
+        self.reduce_chars = int(os.getenv("DIGEST_REDUCE_CHARS", "12000"))
+        # Palabras del resumen final
+        self.digest_words = int(os.getenv("DIGEST_WORDS", "600"))
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def current(self, topic_id: int, content: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Resumen del tema si corresponde al contenido actual"""
+        if not content or len(content) <= self.min_chars:
+            return None
+        digest = self.db.get_topic_digest(topic_id)
+        if digest is None or digest['content_hash'] != content_hash(content):
+            return None
+        return digest
+
+    def schedule(self, topic: Dict[str, Any]):
+        """Lanzar la construcción del resumen en segundo plano"""
+        if topic['id'] in self._running:
+            # La tarea en curso vuelve a leer el contenido al terminar
+            return
+        self._running.add(topic['id'])
+        task = asyncio.ensure_future(self._run(topic))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, topic: Dict[str, Any]):
+        """Resumir el contenido más reciente hasta que no cambie durante la construcción"""
+        topic_id = topic['id']
+        try:
+            while True:
+                content = self.db.get_topic_content(topic_id)
+                if not content or len(content) <= self.min_chars:
+                    return
+                current_hash = content_hash(content)
+                existing = self.db.get_topic_digest(topic_id)
+                if existing is not None and existing['content_hash'] == current_hash:
+                    return
+                with usage_context(subject_id=topic['subject_id'], topic_id=topic_id):
+                    await self.build(topic, content, current_hash)
+                latest = self.db.get_topic_content(topic_id)
+                if latest is None or content_hash(latest) == current_hash:
+                    return
+        except Exception:
+            DIGEST_BUILDS.inc(status="error")
+            logger.exception("Digest build failed", extra={"fields": {"topic_id": topic_id}})
+        finally:
+            self._running.discard(topic_id)
+
+    async def build(self, topic: Dict[str, Any], content: str, current_hash: str):
+        """Resumir un documento con map-reduce y guardar el resultado"""
+        with span("digest.build"):
+            chunks = self.processor.segment_content(content, max_chars=self.chunk_chars)
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def summarize(index: int, chunk: str) -> str:
+                async with semaphore:
+                    summary = await self.llm.summarize_chunk(topic['name'], chunk, index, len(chunks))
+                    DIGEST_CHUNKS.inc()
+                    return summary
+
+            summaries = await asyncio.gather(*(
+                summarize(index, chunk) for index, chunk in enumerate(chunks, 1)
+            ))
+            result = await self._reduce(topic['name'], list(summaries))
+
+        self.db.save_topic_digest(
+            topic['id'], current_hash, result['digest'], result['outline'], self.llm.model, len(chunks)
+        )
+        DIGEST_BUILDS.inc(status="ok")
+        logger.info("Digest built", extra={"fields": {
+            "topic_id": topic['id'],
+            "content_chars": len(content),
+            "chunks": len(chunks),
+            "digest_chars": len(result['digest'])
+        }})
+
+    async def _reduce(self, topic_name: str, summaries: List[str]) -> Dict[str, str]:
+        """Combinar los resúmenes, por grupos si no caben en una sola llamada"""
+        while len(summaries) > 1 and sum(len(summary) for summary in summaries) > self.reduce_chars:
+            groups: List[List[str]] = [[]]
+            size = 0
+            for summary in summaries:
+                if groups[-1] and size + len(summary) > self.reduce_chars:
+                    groups.append([])
+                    size = 0
+                groups[-1].append(summary)
+                size += len(summary)
+            if len(groups) == len(summaries):
+                # Cada resumen ocupa un grupo: combinar de a pares para avanzar
+                groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+            partial = await asyncio.gather(*(
+                self.llm.reduce_summaries(topic_name, group, self.digest_words) for group in groups
+            ))
+            summaries = [result['digest'] for result in partial]
+        return await self.llm.reduce_summaries(topic_name, summaries, self.digest_words)
+
+    async def drain(self):
+        """Esperar a que terminen los resúmenes en curso (al apagar)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
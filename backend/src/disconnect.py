@@ -0,0 +1,67 @@
+"""
+Cancelar el trabajo de una petición cuando el cliente se desconecta
+
+uvicorn no cancela el endpoint si el cliente cierra la conexión: la única
+señal es el mensaje http.disconnect que devuelve receive() una vez leído el
+cuerpo. cancel_on_disconnect espera ese mensaje en paralelo con el trabajo y
+lo cancela si llega primero.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable
+from fastapi import Request
+from src.telemetry import REGISTRY, get_logger
+
+logger = get_logger("disconnect")
+
+CLIENT_DISCONNECTS = REGISTRY.counter(
+    "studysprint_client_disconnects_total",
+    "Peticiones cuyo cliente se desconectó antes de recibir la respuesta",
+    ("route",)
+)
+GENERATIONS_ABANDONED = REGISTRY.counter(
+    "studysprint_generations_abandoned_total",
+    "Esperas de una generación abandonadas por su petición: la generación se canceló, "
+    "siguió para otras peticiones que la esperan o siguió para guardar su resultado",
+    ("outcome",)
+)
+
+# Código de nginx para "el cliente cerró la petición"; solo llega a los logs y métricas
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """El cliente se desconectó antes de que terminara el trabajo"""
+
+
+def cancel_on_disconnect_enabled() -> bool:
+    """Indicar si se cancela la generación al desconectarse el cliente (CANCEL_ON_DISCONNECT, activado por defecto)"""
+    return os.getenv("CANCEL_ON_DISCONNECT", "1").lower() in ("1", "true", "yes", "on")
+
+
+async def _wait_disconnect(request: Request):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[Any], route: str) -> Any:
+    """Esperar work; si el cliente se desconecta antes, cancelarlo y lanzar ClientDisconnected"""
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        watcher.cancel()
+        raise
+    watcher.cancel()
+    if task.done():
+        return task.result()
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    CLIENT_DISCONNECTS.inc(route=route)
+    logger.info("Client disconnected, work cancelled", extra={"fields": {"route": route}})
+    raise ClientDisconnected()
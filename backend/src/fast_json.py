@@ -0,0 +1,72 @@
+"""
+Ruta rápida de serialización JSON para los endpoints de lectura
+"""
+import json
+import os
+from typing import Any, Optional
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa json de la biblioteca estándar
+    orjson = None
+
+# Cabeceras que calcula la respuesta final y no deben copiarse de la respuesta temporal
+_SKIPPED_HEADERS = ("content-length", "content-type")
+
+
+def fast_json_enabled() -> bool:
+    """Indicar si la ruta rápida está activada (FAST_JSON, desactivada por defecto)"""
+    return os.getenv("FAST_JSON", "0").lower() in ("1", "true", "yes", "on")
+
+
+def _slots_to_dict(obj: Any) -> dict:
+    """Convertir registros con __slots__ para el json estándar (orjson los serializa solo)"""
+    slots = getattr(type(obj), "__slots__", None)
+    if slots is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return {name: getattr(obj, name) for name in slots}
+
+
+def dumps(content: Any) -> bytes:
+    """Serializar a JSON compacto en UTF-8, con orjson si está disponible"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_slots_to_dict).encode("utf-8")
+
+
+def loads(data) -> Any:
+    """Deserializar JSON, con orjson si está disponible"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """Respuesta JSON que serializa las filas tal cual, sin pasar por response_model"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """Construir la respuesta rápida conservando las cabeceras ya fijadas (ETag, cursor)
+
+    Al devolver una Response directamente FastAPI omite la validación contra
+    response_model; los datos salen de la base de datos, cuyas filas ya
+    cumplen el esquema porque se validaron al escribirse.
+    """
+    headers = None
+    if response is not None:
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key not in _SKIPPED_HEADERS
+        }
+    return FastJSONResponse(content, headers=headers)
+
+
+def model_response(model) -> Response:
+    """Serializar un modelo Pydantic directamente a bytes, sin pasar por un dict intermedio"""
+    return Response(model.model_dump_json(), media_type="application/json")
@@ -0,0 +1,155 @@
+"""
+Peticiones de respaldo (hedging) para recortar la cola de latencia del LLM
+
+Si una llamada no termina antes de un percentil de la latencia observada
+recientemente para ese tipo de llamada, se lanza una copia y se usa la que
+responda primero; la otra se cancela. Un presupuesto limita la fracción de
+llamadas que pueden duplicarse.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+from src.telemetry import REGISTRY, get_logger
+
+logger = get_logger("hedging")
+
+LLM_HEDGES = REGISTRY.counter(
+    "studysprint_llm_hedges_total",
+    "Peticiones de respaldo al LLM: ganadas, perdidas o no lanzadas por falta de presupuesto",
+    ("kind", "result")
+)
+
+
+def hedging_enabled() -> bool:
+    """Indicar si se lanzan peticiones de respaldo (LLM_HEDGE_ENABLED, desactivado por defecto)"""
+    return os.getenv("LLM_HEDGE_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+
+
+class LatencyTracker:
+    """Latencias recientes por tipo de llamada, para estimar percentiles"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[Hashable, Deque[float]] = {}
+
+    def observe(self, key: Hashable, seconds: float):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, key: Hashable, q: float, min_samples: int = 1) -> Optional[float]:
+        """Percentil q (0-100) de las últimas latencias; None si hay menos de min_samples"""
+        samples = self._samples.get(key)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """Limita las peticiones de respaldo a una fracción de las llamadas del último intervalo"""
+
+    def __init__(self, max_rate: float, interval: float = 60.0):
+        self.max_rate = max_rate
+        self.interval = interval
+        self._calls: Deque[float] = deque()
+        self._hedges: Deque[float] = deque()
+
+    def _trim(self, now: float):
+        for events in (self._calls, self._hedges):
+            while events and now - events[0] > self.interval:
+                events.popleft()
+
+    def record_call(self):
+        now = time.monotonic()
+        self._trim(now)
+        self._calls.append(now)
+
+    def try_acquire(self) -> bool:
+        """Reservar una petición de respaldo si no supera la fracción permitida"""
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._hedges) + 1 > self.max_rate * len(self._calls):
+            return False
+        self._hedges.append(now)
+        return True
+
+
+class HedgePolicy:
+    """Decide cuándo duplicar una llamada y se queda con la primera respuesta válida"""
+
+    def __init__(self):
+        """Configurar la política a partir de variables de entorno"""
+        self.enabled = hedging_enabled()
+        # Percentil de la latencia reciente tras el cual se lanza la copia
+        self.percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        # Latencias observadas necesarias antes de empezar a duplicar
+        self.min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        # Espera mínima antes de duplicar, aunque el percentil sea menor
+        self.min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+        self.latencies = LatencyTracker(int(os.getenv("LLM_HEDGE_WINDOW", "200")))
+        self.budget = HedgeBudget(float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1")))
+
+    def delay(self, key: Hashable) -> Optional[float]:
+        """Segundos a esperar antes de duplicar; None si aún no hay datos suficientes"""
+        threshold = self.latencies.percentile(key, self.percentile, self.min_samples)
+        if threshold is None:
+            return None
+        return max(threshold, self.min_delay)
+
+    async def run(self, kind: str, key: Hashable, request: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecutar request() con una copia de respaldo si tarda más de lo habitual
+
+        key agrupa las llamadas comparables (tipo y tamaño de respuesta); kind
+        es la etiqueta de las métricas.
+        """
+        if not self.enabled:
+            return await request()
+
+        self.budget.record_call()
+        delay = self.delay(key)
+        primary = asyncio.ensure_future(self._timed(key, request))
+        tasks = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    if self.budget.try_acquire():
+                        tasks.add(asyncio.ensure_future(self._timed(key, request)))
+                        logger.debug("Hedging LLM call", extra={"fields": {"kind": kind, "delay": round(delay, 3)}})
+                    else:
+                        LLM_HEDGES.inc(kind=kind, result="budget_exhausted")
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if len(tasks) > 1:
+                        LLM_HEDGES.inc(kind=kind, result="lost" if task is primary else "won")
+                    return task.result()
+            raise error
+        finally:
+            # La copia que no ganó (o ambas, si el llamador se canceló) no se espera
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _timed(self, key: Hashable, request: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await request()
+        except asyncio.CancelledError:
+            # La latencia real fue al menos esta; sin anotarla la cola lenta desaparecería de la ventana
+            self.latencies.observe(key, time.perf_counter() - start)
+            raise
+        self.latencies.observe(key, time.perf_counter() - start)
+        return result
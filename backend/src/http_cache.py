@@ -0,0 +1,41 @@
+"""
+ETags y GET condicional a partir de los contadores de versión por materia
+"""
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+from src.telemetry import REGISTRY
+
+CONDITIONAL_GETS = REGISTRY.counter(
+    "studysprint_conditional_get_total",
+    "Peticiones GET con ETag, según se respondieran con 304 o con cuerpo completo",
+    ("route", "result")
+)
+
+# Permite a navegadores y proxies guardar la respuesta pero obliga a revalidarla
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Construir un ETag fuerte a partir de la versión y de los parámetros de la vista"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:24]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comprobar si la cabecera If-None-Match incluye el ETag actual"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def check_not_modified(request: Request, response: Response, route: str, etag: str) -> Optional[Response]:
+    """Devolver un 304 si el cliente ya tiene esta versión; si no, fijar ETag en la respuesta"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        CONDITIONAL_GETS.inc(route=route, result="not_modified")
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    CONDITIONAL_GETS.inc(route=route, result="full")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return None
@@ -0,0 +1,202 @@
+"""
+Importación masiva de material: varios PDFs o un ZIP en una sola petición
+
+Los archivos se leen de uno en uno desde el archivo temporal de la subida
+(los ZIP miembro a miembro), el texto se extrae en paralelo en un pool de
+procesos y el contenido se guarda en lotes, una transacción por lote.
+"""
+import asyncio
+import os
+import re
+import zipfile
+import zlib
+from concurrent.futures import Executor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from src.pdf_processor import extract_text_from_bytes
+from src.telemetry import REGISTRY, get_logger, span
+
+logger = get_logger("importer")
+
+IMPORTED_FILES = REGISTRY.counter(
+    "studysprint_import_files_total",
+    "Archivos procesados por la importación masiva",
+    ("status",)
+)
+
+
+def topic_name_from_filename(filename: str) -> str:
+    """Nombre de tema a partir del archivo: '03_Derivadas-parciales.pdf' -> 'Derivadas parciales'"""
+    stem = os.path.splitext(os.path.basename(filename.replace("\\", "/")))[0]
+    stem = re.sub(r"^\d+[\s._-]*", "", stem)
+    name = re.sub(r"[_\-\s]+", " ", stem).strip()
+    return name or stem or filename
+
+
+class MaterialImporter:
+    """Importa varios PDFs en los temas de una materia"""
+
+    def __init__(self, database, executor: Optional[Executor] = None):
+        """Configurar límites y paralelismo a partir de variables de entorno"""
+        self.db = database
+        self.executor = executor
+        self.batch_size = int(os.getenv("IMPORT_BATCH_SIZE", "20"))
+        self.parallelism = int(os.getenv("IMPORT_PARALLELISM", str(os.cpu_count() or 2)))
+        self.max_files = int(os.getenv("IMPORT_MAX_FILES", "500"))
+        self.max_file_bytes = int(os.getenv("IMPORT_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+
+    async def import_files(self, subject_id: int, uploads: List[Any], create_topics: bool = True) -> List[Dict[str, Any]]:
+        """Importar los archivos subidos y devolver el resultado de cada uno
+
+        Cada PDF se asigna al tema de la materia con el mismo nombre (sin
+        distinguir mayúsculas); si no existe se crea cuando create_topics es
+        True y, si no, el archivo se marca como error.
+        """
+        loop = asyncio.get_running_loop()
+        topics = {topic['name'].casefold(): topic for topic in self.db.get_topics_by_subject(subject_id)}
+        results: List[Dict[str, Any]] = []
+        pending: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+
+        with span("import.files"):
+            sources = self._iter_sources(uploads, results)
+            while True:
+                # Leer una tanda del tamaño del paralelismo: la memoria queda acotada
+                wave = await loop.run_in_executor(None, self._read_wave, sources)
+                if not wave:
+                    break
+                texts = await asyncio.gather(
+                    *(self._extract(loop, data) for _, data in wave),
+                    return_exceptions=True
+                )
+                for (filename, _), text in zip(wave, texts):
+                    result = {"filename": filename}
+                    results.append(result)
+                    if isinstance(text, BaseException):
+                        self._fail(result, f"Could not read PDF: {text}")
+                        continue
+                    if not text:
+                        self._fail(result, "Could not extract text from PDF")
+                        continue
+                    topic = self._resolve_topic(subject_id, filename, topics, create_topics, result)
+                    if topic is None:
+                        continue
+                    pending.append((result, {"topic_id": topic['id'], "content": text, "source_file": filename}))
+                    if len(pending) >= self.batch_size:
+                        self._flush(pending)
+            self._flush(pending)
+
+        logger.info("import finished", extra={"fields": {
+            "subject_id": subject_id,
+            "files": len(results),
+            "ok": sum(1 for result in results if result["status"] == "ok")
+        }})
+        return results
+
+    def _iter_sources(self, uploads: List[Any], results: List[Dict[str, Any]]) -> Iterator[Tuple[str, bytes]]:
+        """Recorrer los PDFs de las subidas, abriendo los ZIP miembro a miembro"""
+        count = 0
+        for upload in uploads:
+            filename = upload.filename or "upload"
+            lower = filename.lower()
+            if lower.endswith(".zip"):
+                try:
+                    archive = zipfile.ZipFile(upload.file)
+                except zipfile.BadZipFile:
+                    self._reject(results, filename, "error", "Invalid ZIP file")
+                    continue
+                with archive:
+                    for info in archive.infolist():
+                        name = info.filename
+                        if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                            continue
+                        if not name.lower().endswith(".pdf"):
+                            self._reject(results, name, "skipped", "Not a PDF file")
+                            continue
+                        count += 1
+                        if count > self.max_files:
+                            self._reject(results, name, "skipped", "Too many files")
+                            continue
+                        if info.file_size > self.max_file_bytes:
+                            self._reject(results, name, "error", "File too large")
+                            continue
+                        try:
+                            data = archive.read(info)
+                        except (zipfile.BadZipFile, zlib.error, EOFError, OSError) as e:
+                            # Miembro dañado o con una cabecera que no cuadra: se sigue con el resto
+                            self._reject(results, name, "error", f"Could not read ZIP member: {e}")
+                            continue
+                        yield name, data
+            elif lower.endswith(".pdf"):
+                count += 1
+                if count > self.max_files:
+                    self._reject(results, filename, "skipped", "Too many files")
+                    continue
+                data = upload.file.read(self.max_file_bytes + 1)
+                if len(data) > self.max_file_bytes:
+                    self._reject(results, filename, "error", "File too large")
+                    continue
+                yield filename, data
+            else:
+                self._reject(results, filename, "skipped", "Only PDF and ZIP files are allowed")
+
+    def _read_wave(self, sources: Iterator[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+        """Leer hasta parallelism archivos (en un hilo: la lectura del disco bloquea)"""
+        wave = []
+        for source in sources:
+            wave.append(source)
+            if len(wave) >= self.parallelism:
+                break
+        return wave
+
+    async def _extract(self, loop, data: bytes) -> str:
+        return await loop.run_in_executor(self.executor, extract_text_from_bytes, data)
+
+    def _resolve_topic(
+        self,
+        subject_id: int,
+        filename: str,
+        topics: Dict[str, Dict[str, Any]],
+        create_topics: bool,
+        result: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Buscar el tema por nombre o crearlo"""
+        name = topic_name_from_filename(filename)
+        topic = topics.get(name.casefold())
+        result["topic_name"] = name
+        result["created_topic"] = False
+        if topic is None:
+            if not create_topics:
+                self._fail(result, "No topic matches this file")
+                return None
+            topic = self.db.create_topic(subject_id, name)
+            topics[name.casefold()] = topic
+            result["created_topic"] = True
+        result["topic_id"] = topic['id']
+        return topic
+
+    def _flush(self, pending: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        """Guardar un lote de contenidos en una transacción"""
+        if not pending:
+            return
+        try:
+            with span("import.flush"):
+                self.db.save_topic_contents([item for _, item in pending])
+        except Exception as e:
+            logger.exception("Import batch failed", extra={"fields": {"files": len(pending)}})
+            for result, _ in pending:
+                self._fail(result, f"Could not save content: {e}")
+        else:
+            for result, item in pending:
+                result["status"] = "ok"
+                result["chars"] = len(item["content"])
+                IMPORTED_FILES.inc(status="ok")
+        pending.clear()
+
+    def _fail(self, result: Dict[str, Any], error: str):
+        result["status"] = "error"
+        result["error"] = error
+        IMPORTED_FILES.inc(status="error")
+
+    def _reject(self, results: List[Dict[str, Any]], filename: str, status: str, error: str):
+        """Anotar un archivo descartado antes de extraer su texto"""
+        results.append({"filename": filename, "status": status, "error": error})
+        IMPORTED_FILES.inc(status=status)
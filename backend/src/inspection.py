@@ -0,0 +1,305 @@
+"""
+Inspección de la base de datos SQLite para operadores (la usa admin.py)
+
+Todo se lee con una conexión de solo lectura, que en modo WAL no bloquea a
+la API. Los tamaños salen de dbstat y de los contadores de páginas. Las
+filas de las tablas principales se estiman con MAX(rowid), una cota superior
+si se borraron filas, salvo que se pida el conteo exacto; las tablas
+derivadas que se borran y reconstruyen (resúmenes y estadísticas diarias) se
+cuentan siempre. El contenido de los PDFs se lee por tramos con E/S
+incremental de blobs en lugar de cargar la columna entera.
+"""
+import codecs
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.database import Database
+
+# octet_length() no lee el texto para medirlo; existe desde SQLite 3.43
+_HAS_OCTET_LENGTH = sqlite3.sqlite_version_info >= (3, 43, 0)
+_SIZE_EXPR = "octet_length(tc.content)" if _HAS_OCTET_LENGTH else "length(CAST(tc.content AS BLOB))"
+
+
+def connect_readonly(db_path: str) -> sqlite3.Connection:
+    """Abrir la base de datos en solo lectura"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(db_path)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+# Tablas derivadas: se borran y reconstruyen, así que MAX(rowid) no las estima bien
+_DERIVED_TABLES = ("topic_digest", "topic_daily_stats", "subject_daily_stats")
+
+
+def _pragma(conn: sqlite3.Connection, name: str) -> Any:
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _tables(conn: sqlite3.Connection) -> List[str]:
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()
+    return [row['name'] for row in rows]
+
+
+def _row_count(conn: sqlite3.Connection, name: str, exact: bool) -> Tuple[int, bool]:
+    """Filas de una tabla y si el número es una estimación"""
+    if exact or name in _DERIVED_TABLES:
+        return conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0], False
+    # Recorre solo el borde derecho del árbol: O(log n) en vez de leer la tabla
+    return conn.execute(f"SELECT MAX(rowid) FROM {name}").fetchone()[0] or 0, True
+
+
+def database_summary(conn: sqlite3.Connection, db_path: str, exact: bool = False) -> Dict[str, Any]:
+    """Tamaño del archivo, páginas y filas por tabla"""
+    page_size = _pragma(conn, "page_size")
+    wal_path = db_path + "-wal"
+    tables = []
+    for name in _tables(conn):
+        rows, estimated = _row_count(conn, name, exact)
+        tables.append({"table": name, "rows": rows, "estimated": estimated})
+    return {
+        "file_bytes": os.path.getsize(db_path),
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        "page_size": page_size,
+        "page_count": _pragma(conn, "page_count"),
+        "freelist_pages": _pragma(conn, "freelist_count"),
+        "journal_mode": _pragma(conn, "journal_mode"),
+        "sqlite_version": sqlite3.sqlite_version,
+        "rows_exact": exact,
+        "tables": tables,
+    }
+
+
+def subject_summary(conn: sqlite3.Connection, limit: int = 20, cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Temas, PDFs y sesiones por materia, una página de materias a la vez
+
+    Cada conteo es un rango sobre un índice por materia, no un recorrido
+    de la tabla completa.
+    """
+    params: List[Any] = []
+    where = ""
+    if cursor is not None:
+        where = "WHERE id < ?"
+        params.append(cursor)
+    subjects = conn.execute(
+        f"SELECT id, name FROM subjects {where} ORDER BY id DESC LIMIT ?", (*params, limit + 1)
+    ).fetchall()
+    next_cursor = subjects[limit - 1]['id'] if len(subjects) > limit else None
+
+    page = []
+    for subject in subjects[:limit]:
+        topics = conn.execute("SELECT COUNT(*) FROM topics WHERE subject_id = ?", (subject['id'],)).fetchone()[0]
+        contents = conn.execute("""
+            SELECT COUNT(*) FROM topic_content
+            WHERE topic_id IN (SELECT id FROM topics WHERE subject_id = ?)
+        """, (subject['id'],)).fetchone()[0]
+        sessions = conn.execute(
+            "SELECT COUNT(*), MAX(completed_at) FROM study_sessions WHERE subject_id = ?", (subject['id'],)
+        ).fetchone()
+        page.append({
+            "id": subject['id'],
+            "name": subject['name'],
+            "topics": topics,
+            "pdfs": contents,
+            "sessions": sessions[0],
+            "last_session": sessions[1],
+        })
+    return page, next_cursor
+
+
+def space_usage(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Espacio en disco por tabla e índice, de mayor a menor
+
+    Usa la tabla virtual dbstat; si SQLite se compiló sin ella se devuelve
+    solo el total del archivo y las filas estimadas de cada tabla.
+    """
+    kinds = {
+        row['name']: (row['type'], row['tbl_name'])
+        for row in conn.execute("SELECT name, type, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')")
+    }
+    try:
+        rows = conn.execute("""
+            SELECT name, pageno AS pages, pgsize AS bytes, payload, unused
+            FROM dbstat WHERE aggregate = TRUE
+            ORDER BY pgsize DESC
+        """).fetchall()
+    except sqlite3.OperationalError:
+        page_size = _pragma(conn, "page_size")
+        total = {"name": "(total)", "type": "file", "table": None, "pages": _pragma(conn, "page_count")}
+        total["bytes"] = total["pages"] * page_size
+        tables = []
+        for name in _tables(conn):
+            rows, estimated = _row_count(conn, name, exact=False)
+            tables.append({"name": name, "type": "table", "table": name, "pages": None, "bytes": None,
+                           "rows": rows, "estimated": estimated})
+        return [total] + tables
+    usage = []
+    for row in rows:
+        kind, table = kinds.get(row['name'], ("internal", row['name']))
+        usage.append({
+            "name": row['name'],
+            "type": kind,
+            "table": table,
+            "pages": row['pages'],
+            "bytes": row['bytes'],
+            "payload": row['payload'],
+            "unused": row['unused'],
+        })
+    return usage
+
+
+def list_contents(
+    conn: sqlite3.Connection,
+    subject_id: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Una página de PDFs cargados (sin el texto), del más reciente al más antiguo"""
+    conditions, params = [], []
+    if subject_id is not None:
+        conditions.append("t.subject_id = ?")
+        params.append(subject_id)
+    if cursor is not None:
+        conditions.append("tc.id < ?")
+        params.append(cursor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = conn.execute(f"""
+        SELECT tc.id, tc.topic_id, t.name AS topic_name, s.name AS subject_name,
+               tc.source_file, {_SIZE_EXPR} AS bytes, tc.created_at
+        FROM topic_content tc
+        JOIN topics t ON t.id = tc.topic_id
+        JOIN subjects s ON s.id = t.subject_id
+        {where}
+        ORDER BY tc.id DESC
+        LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return [dict(row) for row in rows[:limit]], next_cursor
+
+
+def read_content(conn: sqlite3.Connection, content_id: int, offset: int = 0, size: int = 4096) -> Dict[str, Any]:
+    """Leer un tramo del texto de un PDF a partir de un desplazamiento en bytes
+
+    Con blobopen (Python 3.11+) solo se leen las páginas del tramo. El corte
+    se ajusta a un límite de carácter UTF-8 y next_offset indica dónde sigue.
+    """
+    if hasattr(conn, "blobopen"):
+        try:
+            blob = conn.blobopen("topic_content", "content", content_id, readonly=True)
+        except sqlite3.OperationalError:
+            raise KeyError(content_id)
+        with blob:
+            total = len(blob)
+            blob.seek(min(offset, total))
+            chunk = blob.read(size)
+    else:
+        row = conn.execute(
+            "SELECT length(CAST(content AS BLOB)), substr(CAST(content AS BLOB), ?, ?) FROM topic_content WHERE id = ?",
+            (offset + 1, size, content_id)
+        ).fetchone()
+        if row is None:
+            raise KeyError(content_id)
+        total, chunk = row[0], bytes(row[1] or b"")
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = decoder.decode(chunk, final=offset + len(chunk) >= total)
+    # Bytes de un carácter partido al final del tramo: se leen en el siguiente
+    pending = len(decoder.getstate()[0])
+    end = offset + len(chunk) - pending
+    return {
+        "id": content_id,
+        "total_bytes": total,
+        "offset": offset,
+        "text": text,
+        "next_offset": end if end < total else None,
+    }
+
+
+class _TracingDatabase(Database):
+    """Database de solo lectura que anota cada consulta ejecutada"""
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        self.statements: List[str] = []
+
+    def get_connection(self):
+        conn = connect_readonly(self.db_path)
+        conn.set_trace_callback(self.statements.append)
+        return conn
+
+
+def _sample_ids(conn: sqlite3.Connection) -> Tuple[Optional[int], Optional[int]]:
+    """Materia y tema con actividad reciente para parametrizar las consultas"""
+    row = conn.execute("SELECT subject_id, topic_id FROM study_sessions ORDER BY id DESC LIMIT 1").fetchone()
+    if row is not None and row['subject_id'] is not None:
+        return row['subject_id'], row['topic_id']
+    row = conn.execute("SELECT subject_id, id FROM topics ORDER BY id DESC LIMIT 1").fetchone()
+    if row is not None:
+        return row[0], row[1]
+    subject = conn.execute("SELECT MAX(id) FROM subjects").fetchone()[0]
+    return subject, None
+
+
+def query_plans(db_path: str, top: int = 10, repeat: int = 3) -> List[Dict[str, Any]]:
+    """Ejecutar las lecturas de la API, medirlas y devolver las más lentas con su plan
+
+    Las consultas son las que genera Database (capturadas con el callback
+    de trazas, con los parámetros ya sustituidos), así que el plan es el que
+    ve la API en producción.
+    """
+    conn = connect_readonly(db_path)
+    try:
+        subject_id, topic_id = _sample_ids(conn)
+    finally:
+        conn.close()
+
+    database = _TracingDatabase(db_path)
+    calls: List[Tuple[str, Callable[[], Any]]] = [
+        ("get_all_subjects", lambda: database.get_all_subjects(limit=50)),
+        ("get_topic_stats_columns", lambda: database.get_topic_stats_columns()),
+        ("get_llm_usage", lambda: database.get_llm_usage("day")),
+    ]
+    if subject_id is not None:
+        calls += [
+            ("get_subject_version", lambda: database.get_subject_version(subject_id)),
+            ("get_topics_by_subject", lambda: database.get_topics_by_subject(subject_id, limit=50)),
+            ("get_study_history", lambda: database.get_study_history(subject_id, limit=50)),
+            ("get_due_topics", lambda: database.get_due_topics(subject_id, 10)),
+        ]
+    if topic_id is not None:
+        calls += [
+            ("get_topic_labels", lambda: database.get_topic_labels([topic_id])),
+            ("get_topic_statistics", lambda: database.get_topic_statistics(topic_id)),
+            ("get_topic_content", lambda: database.get_topic_content(topic_id)),
+            ("count_quiz_questions", lambda: database.count_quiz_questions(topic_id)),
+        ]
+
+    results = []
+    for name, call in calls:
+        # El mejor de varios intentos: descarta el costo de la primera lectura del disco
+        best = None
+        for _ in range(repeat):
+            database.statements.clear()
+            start = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        statements = [sql for sql in database.statements if not sql.lstrip().upper().startswith("PRAGMA")]
+        results.append({"method": name, "ms": round(best * 1000, 3), "statements": statements})
+    results.sort(key=lambda result: result["ms"], reverse=True)
+
+    conn = connect_readonly(db_path)
+    try:
+        for result in results[:top]:
+            result["plans"] = [
+                [row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                for sql in result["statements"]
+            ]
+    finally:
+        conn.close()
+    return results[:top]
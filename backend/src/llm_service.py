@@ -1,57 +1,173 @@
 """
 Servicio de integración con OpenAI API para generación de contenido
 """
+import asyncio
+import functools
+import logging
 import os
-from typing import List, Dict, Any
-from openai import AsyncOpenAI
-from tenacity import retry, stop_after_attempt, wait_exponential
+import time
+from typing import List, Dict, Any, Optional
+from src.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.hedging import HedgePolicy
 from src.models import QuizQuestion
+from src.session_store import prompt_hash
+from src.telemetry import get_logger, span
+
+logger = get_logger("llm")
+
+SESSION_SYSTEM_PROMPT = """Eres un asistente educativo experto en crear contenido de aprendizaje conciso y efectivo.
+
+Para CONTENIDO MATEMÁTICO Y TÉCNICO:
+- USA LaTeX libremente para fórmulas, ecuaciones y notación matemática
+- Usa delimitadores: $...$ para inline, $$...$$ para display
+- Ejemplos: $f(x) = x^2 + 2x + 1$, $\\sum_{i=1}^{n} i$, $\\forall x \\in \\mathbb{R}$
+- Para símbolos de conjuntos: $\\subseteq$, $\\in$, $\\cup$, $\\cap$
+- Para lógica: $\\forall$, $\\exists$, $\\rightarrow$
+
+Para TEXTO NARRATIVO:
+- Usa español claro y directo
+- Explica conceptos con ejemplos prácticos
+- Mantén estructura clara con párrafos bien definidos
+
+REQUISITO FUNDAMENTAL:
+- SIEMPRE genera el número EXACTO de palabras solicitado
+- Verifica el conteo antes de finalizar tu respuesta"""
+
+
+class LLMNotConfiguredError(ValueError):
+    """Falta la configuración del LLM (OPENAI_API_KEY); no tiene sentido reintentar"""
+
+
+def with_retries(reraise: bool = False):
+    """Reintentar con espera exponencial (3 intentos; no con el circuito abierto ni al cancelar)
+    
+    tenacity se importa en la primera llamada para no pagar su carga al
+    importar el módulo.
+    """
+    def decorator(func):
+        retrying = None
+        
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            nonlocal retrying
+            if retrying is None:
+                from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+                retrying = retry(
+                    # Una llamada cancelada (el cliente se fue) no se reintenta
+                    retry=retry_if_not_exception_type((LLMNotConfiguredError, CircuitOpenError, asyncio.CancelledError)),
+                    stop=stop_after_attempt(3),
+                    wait=wait_exponential(multiplier=1, min=2, max=10),
+                    reraise=reraise
+                )(func)
+            return await retrying(*args, **kwargs)
+        
+        return wrapper
+    return decorator
 
 
 class LLMService:
     """Servicio para interactuar con la API de OpenAI"""
     
-    def __init__(self):
-        """Inicializar el cliente de OpenAI"""
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        
-        self.client = AsyncOpenAI(api_key=api_key)
+    def __init__(self, usage_recorder=None):
+        """Configurar el servicio; el cliente de OpenAI se crea en la primera llamada"""
+        self._client = None
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        self.usage_recorder = usage_recorder
+        # Copias de respaldo de las llamadas lentas (LLM_HEDGE_ENABLED)
+        self.hedging = HedgePolicy()
+        # Deja de llamar al proveedor mientras falla o está lento
+        self.breaker = CircuitBreaker("llm")
+    
+    @property
+    def client(self):
+        """Cliente de OpenAI, creado (e importado) al primer uso"""
+        if self._client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise LLMNotConfiguredError("OPENAI_API_KEY environment variable is required")
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=api_key)
+        return self._client
     
-    @retry(
-        stop=stop_after_attempt(3), 
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        reraise=True
-    )
+    @client.setter
+    def client(self, value):
+        self._client = value
+    
+    async def create_completion(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ):
+        """Ejecutar una llamada al LLM midiendo su latencia y registrando el uso de tokens"""
+        client = self.client
+        # Con el circuito abierto se falla aquí mismo, sin esperar al proveedor
+        self.breaker.before_call()
+        start = time.perf_counter()
+        try:
+            with span(f"llm.{kind}"):
+                # Las llamadas del mismo tipo y tamaño de respuesta comparten la latencia de referencia
+                response = await self.hedging.run(
+                    kind,
+                    (kind, max_tokens),
+                    lambda: client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+                )
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.breaker.record_success(latency_ms / 1000)
+        
+        if self.usage_recorder is not None:
+            self.usage_recorder.record(
+                kind=kind,
+                model=getattr(response, "model", None) or self.model,
+                usage=getattr(response, "usage", None),
+                latency_ms=latency_ms
+            )
+        
+        return response
+    
+    @with_retries(reraise=True)
     async def generate_session_content(
         self,
         topic_name: str,
         topic_description: str,
         duration: int,
-        reference_material: str = None
+        reference_material: str = None,
+        reference_digest: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Generar contenido estructurado para una sesión de estudio
         
         IMPORTANTE: Esta función tiene retry automático en caso de errores de API.
         Solo reintenta si hay excepciones, NO duplica llamadas exitosas.
-        """
         
-        print(f"\n🚀 Iniciando generación de contenido para: {topic_name}")
-        print(f"⏱️  Duración solicitada: {duration} minutos")
+        Si hay un resumen del material (reference_digest) se usa en lugar del
+        texto completo.
+        """
         
         # Calcular palabras aproximadas según duración
         words_per_minute = 200
         target_words = words_per_minute * duration
         
         # Construir prompt
-        prompt = self.build_content_prompt(
-            topic_name, 
-            topic_description,
-            target_words,
-            reference_material
-        )
+        with span("llm.build_prompt"):
+            prompt = self.build_content_prompt(
+                topic_name, 
+                topic_description,
+                target_words,
+                reference_material,
+                reference_digest
+            )
         
         # Calcular max_tokens según duración
         # Regla: ~1.3 tokens por palabra en español + 20% buffer
@@ -59,68 +175,45 @@ class LLMService:
         # Limitar a 16,000 tokens (máximo de gpt-4o-mini output)
         max_tokens_to_use = min(max_tokens_needed, 16000)
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Eres un asistente educativo experto en crear contenido de aprendizaje conciso y efectivo.
-
-Para CONTENIDO MATEMÁTICO Y TÉCNICO:
-- USA LaTeX libremente para fórmulas, ecuaciones y notación matemática
-- Usa delimitadores: $...$ para inline, $$...$$ para display
-- Ejemplos: $f(x) = x^2 + 2x + 1$, $\\sum_{i=1}^{n} i$, $\\forall x \\in \\mathbb{R}$
-- Para símbolos de conjuntos: $\\subseteq$, $\\in$, $\\cup$, $\\cap$
-- Para lógica: $\\forall$, $\\exists$, $\\rightarrow$
-
-Para TEXTO NARRATIVO:
-- Usa español claro y directo
-- Explica conceptos con ejemplos prácticos
-- Mantén estructura clara con párrafos bien definidos
-
-REQUISITO FUNDAMENTAL:
-- SIEMPRE genera el número EXACTO de palabras solicitado
-- Verifica el conteo antes de finalizar tu respuesta"""
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+        messages = [
+            {
+                "role": "system",
+                "content": SESSION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        response = await self.create_completion(
+            kind="session_content",
+            messages=messages,
             temperature=0.7,
             max_tokens=max_tokens_to_use
         )
         
         content_text = response.choices[0].message.content
         
-        # Detectar si hay LaTeX en la respuesta
-        import re
-        has_latex = bool(re.search(r'[\$\\]', content_text))
-        
-        print(f"\n{'='*70}")
-        print(f"🤖 LLM RESPONSE - Content Generation")
-        print(f"{'='*70}")
-        print(f"Model: {self.model}")
-        print(f"Target words: {target_words}")
-        print(f"Max tokens used: {max_tokens_to_use}")
-        print(f"Raw response length: {len(content_text)} chars")
-        if has_latex:
-            print(f"🧮 LaTeX detected - will clean after preview")
-        print(f"\nFirst 300 chars of raw response:")
-        print(f"{content_text[:300]}...\n")
-        
-        # Limpiar cualquier LaTeX que se haya escapado
-        content_text = self.clean_latex_formatting(content_text)
-        
-        if has_latex:
-            print(f"✅ LaTeX cleaned successfully\n")
-        
-        # Limpiar meta-información del LLM (conteos, verificaciones)
-        content_text = self.clean_llm_metadata(content_text)
-        
-        # Parsear la respuesta estructurada
-        parsed_content = self.parse_session_content(content_text, target_words)
+        logger.debug("LLM response", extra={"fields": {
+            "kind": "session_content",
+            "model": self.model,
+            "target_words": target_words,
+            "max_tokens": max_tokens_to_use,
+            "chars": len(content_text)
+        }})
+        
+        with span("llm.parse_content"):
+            # Limpiar cualquier LaTeX que se haya escapado
+            content_text = self.clean_latex_formatting(content_text)
+            
+            # Limpiar meta-información del LLM (conteos, verificaciones)
+            content_text = self.clean_llm_metadata(content_text)
+            
+            # Parsear la respuesta estructurada
+            parsed_content = self.parse_session_content(content_text, target_words)
         
+        # Se guarda con la sesión para reconocer las generadas con el mismo prompt
+        parsed_content['prompt_hash'] = prompt_hash(self.model, messages, max_tokens_to_use)
         return parsed_content
     
     def build_content_prompt(
@@ -128,7 +221,8 @@ REQUISITO FUNDAMENTAL:
         topic_name: str,
         topic_description: str,
         target_words: int,
-        reference_material: str = None
+        reference_material: str = None,
+        reference_digest: Optional[Dict[str, Any]] = None
     ) -> str:
         """Construir el prompt para generar contenido"""
         
@@ -181,7 +275,20 @@ El contenido debe seguir esta estructura:
 
 """
         
-        if reference_material:
+        if reference_digest:
+            # Resumen de todo el documento, preparado al subirlo
+            base_prompt += f"""
+Utiliza como base el siguiente resumen del material de referencia completo:
+
+ESQUEMA DEL MATERIAL:
+{reference_digest['outline']}
+
+RESUMEN DEL MATERIAL:
+{reference_digest['digest']}
+
+Adapta el contenido del material para que sea conciso y apropiado para la duracion especificada.
+"""
+        elif reference_material:
             # Limitar el material de referencia para no exceder límites de tokens
             material_excerpt = reference_material[:3000]
             base_prompt += f"""
@@ -444,45 +551,23 @@ NOTA: NO incluyas meta-información sobre el conteo de palabras en tu respuesta.
         # Contar palabras en el contenido extraído
         word_count = len(sections['content'].split())
         
-        # Calcular qué porcentaje del objetivo se alcanzó
-        if target_words > 0:
-            percentage = (word_count / target_words) * 100
-            status_emoji = "✅" if percentage >= 90 else "⚠️" if percentage >= 70 else "❌"
-        else:
-            percentage = 0
-            status_emoji = "➖"
-        
-        print(f"\n{'='*70}")
-        print(f"📋 PARSING RESULTS")
-        print(f"{'='*70}")
-        print(f"Raw LLM output: {len(text)} chars")
-        print(f"")
-        print(f"✏️  Objective: {len(sections['learning_objective'])} chars")
-        print(f"   Preview: {sections['learning_objective'][:80]}...")
-        print(f"")
-        print(f"📝 Content: {len(sections['content'])} chars / {word_count} words")
-        if target_words > 0:
-            print(f"   Target: {target_words} words")
-            print(f"   Achievement: {percentage:.1f}% {status_emoji}")
-        print(f"   Preview: {sections['content'][:150]}...")
-        print(f"")
-        print(f"🔑 Key Concepts: {len(sections['key_concepts'])} items")
-        for i, concept in enumerate(sections['key_concepts'][:3], 1):
-            print(f"   {i}. {concept[:60]}..." if len(concept) > 60 else f"   {i}. {concept}")
-        print(f"{'='*70}\n")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Parsed session content", extra={"fields": {
+                "raw_chars": len(text),
+                "objective_chars": len(sections['learning_objective']),
+                "content_chars": len(sections['content']),
+                "words": word_count,
+                "target_words": target_words,
+                "achievement_pct": round(word_count / target_words * 100, 1) if target_words > 0 else None,
+                "key_concepts": len(sections['key_concepts'])
+            }})
         
         return sections
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def generate_quiz(
-        self,
-        topic_name: str,
-        content: str,
-        num_questions: int = 3
-    ) -> List[QuizQuestion]:
-        """Generar preguntas de quiz basadas en el contenido"""
+    def build_quiz_prompt(self, topic_name: str, content: str, num_questions: int) -> str:
+        """Construir el prompt para generar preguntas de opción múltiple"""
         
-        prompt = f"""Genera {num_questions} preguntas de opcion multiple basadas EXCLUSIVAMENTE en el siguiente contenido educativo sobre {topic_name}.
+        return f"""Genera {num_questions} preguntas de opcion multiple basadas EXCLUSIVAMENTE en el siguiente contenido educativo sobre {topic_name}.
 
 IMPORTANTE: Las preguntas deben estar basadas SOLAMENTE en la informacion presentada en el contenido a continuacion. NO uses conocimiento externo que no este en el texto.
 
@@ -514,9 +599,21 @@ C) [opcion 3]
 D) [opcion 4]
 CORRECTA: [A/B/C/D]
 """
+    
+    @with_retries()
+    async def generate_quiz(
+        self,
+        topic_name: str,
+        content: str,
+        num_questions: int = 3
+    ) -> List[QuizQuestion]:
+        """Generar preguntas de quiz basadas en el contenido"""
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
+        with span("llm.build_prompt"):
+            prompt = self.build_quiz_prompt(topic_name, content, num_questions)
+        
+        response = await self.create_completion(
+            kind="quiz",
             messages=[
                 {
                     "role": "system",
@@ -534,7 +631,111 @@ CORRECTA: [A/B/C/D]
         quiz_text = response.choices[0].message.content
         
         # Parsear las preguntas
-        return self.parse_quiz_questions(quiz_text)
+        with span("llm.parse_quiz"):
+            return self.parse_quiz_questions(quiz_text)
+    
+    @with_retries()
+    async def generate_question_bank(
+        self,
+        topic_name: str,
+        source_text: str,
+        num_questions: int = 15
+    ) -> List[QuizQuestion]:
+        """Generar muchas preguntas en una sola llamada para el banco del tema"""
+        
+        with span("llm.build_prompt"):
+            prompt = self.build_quiz_prompt(topic_name, source_text, num_questions)
+            prompt += "\nCubre aspectos distintos del contenido; no repitas preguntas equivalentes.\n"
+        
+        # ~120 tokens por pregunta con sus cuatro opciones, más un margen del 30%
+        max_tokens = min(num_questions * 160 + 200, 8000)
+        
+        response = await self.create_completion(
+            kind="question_bank",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Eres un experto en crear evaluaciones educativas efectivas."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.8,
+            max_tokens=max_tokens
+        )
+        
+        with span("llm.parse_quiz"):
+            return self.parse_quiz_questions(response.choices[0].message.content)
+    
+    @with_retries(reraise=True)
+    async def summarize_chunk(self, topic_name: str, chunk: str, index: int, total: int) -> str:
+        """Resumir un fragmento del material (fase map del resumen del documento)"""
+        
+        prompt = f"""Resume el fragmento {index} de {total} del material de estudio sobre "{topic_name}".
+
+- Conserva definiciones, fórmulas (en LaTeX), teoremas, datos y ejemplos clave
+- Omite repeticiones, índices, encabezados de página y relleno
+- Escribe como máximo 200 palabras, en viñetas breves
+
+FRAGMENTO:
+{chunk}
+"""
+        response = await self.create_completion(
+            kind="digest_map",
+            messages=[
+                {"role": "system", "content": "Eres un experto en sintetizar material educativo sin perder información esencial."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=450
+        )
+        return response.choices[0].message.content.strip()
+    
+    @with_retries(reraise=True)
+    async def reduce_summaries(self, topic_name: str, summaries: List[str], max_words: int = 600) -> Dict[str, str]:
+        """Combinar resúmenes parciales en un resumen y un esquema (fase reduce)"""
+        
+        joined = "\n\n".join(f"[Parte {i}]\n{summary}" for i, summary in enumerate(summaries, 1))
+        prompt = f"""Combina estos resúmenes parciales del material sobre "{topic_name}" en un único resumen.
+
+- Sigue el orden del documento y elimina lo repetido entre partes
+- Conserva definiciones, fórmulas (en LaTeX) y ejemplos clave
+- El resumen debe tener como máximo {max_words} palabras
+
+{joined}
+
+Formato de respuesta:
+
+ESQUEMA:
+- [sección 1]
+  - [subsección]
+- [sección 2]
+
+RESUMEN:
+[resumen integrado]
+"""
+        response = await self.create_completion(
+            kind="digest_reduce",
+            messages=[
+                {"role": "system", "content": "Eres un experto en sintetizar material educativo sin perder información esencial."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=min(int(max_words * 1.3 * 1.5) + 300, 4000)
+        )
+        return self.parse_digest(response.choices[0].message.content)
+    
+    def parse_digest(self, text: str) -> Dict[str, str]:
+        """Separar el esquema y el resumen de la respuesta de la fase reduce"""
+        import re
+        
+        outline, digest = "", text.strip()
+        match = re.search(r'ESQUEMA:\s*(.*?)\s*RESUMEN:\s*(.*)', text, re.DOTALL | re.IGNORECASE)
+        if match:
+            outline, digest = match.group(1).strip(), match.group(2).strip()
+        return {"outline": outline, "digest": digest}
     
     def parse_quiz_questions(self, quiz_text: str) -> List[QuizQuestion]:
         """Parsear las preguntas del quiz desde el texto del LLM"""
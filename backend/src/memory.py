@@ -0,0 +1,281 @@
+"""
+Instrumentación de memoria: RSS y recolector de basura, pico por petición e
+instantáneas del heap
+
+- La RSS del proceso y las estadísticas del recolector se exportan como
+  métricas al momento de leer /metrics; las pausas del recolector se miden
+  con gc.callbacks.
+- Con MEMORY_TRACE_SAMPLE_RATE > 0 se mide con tracemalloc el pico de
+  memoria reservada por una fracción de las peticiones. tracemalloc es global
+  al proceso: se mide una petición a la vez y el pico incluye lo que reserven
+  en paralelo otras peticiones.
+- Las instantáneas del heap (tracemalloc) se toman desde /admin/memory y se
+  comparan entre sí para ver qué líneas retienen memoria.
+"""
+import gc
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from src.telemetry import REGISTRY, get_logger, request_id_var
+
+logger = get_logger("memory")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def resident_memory() -> Optional[int]:
+    """RSS actual del proceso en bytes (None si el sistema no la expone)"""
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def peak_resident_memory() -> Optional[int]:
+    """RSS máxima alcanzada por el proceso en bytes"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux la da en KiB y macOS en bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _gc_stat(field: str) -> Dict[tuple, float]:
+    return {(str(generation),): stats[field] for generation, stats in enumerate(gc.get_stats())}
+
+
+REGISTRY.gauge(
+    "studysprint_process_resident_memory_bytes",
+    "Memoria residente (RSS) del proceso",
+    callback=lambda: resident_memory() or 0
+)
+REGISTRY.gauge(
+    "studysprint_process_peak_resident_memory_bytes",
+    "RSS máxima alcanzada por el proceso desde que arrancó",
+    callback=lambda: peak_resident_memory() or 0
+)
+REGISTRY.gauge(
+    "studysprint_gc_collections",
+    "Recolecciones del recolector de basura por generación desde que arrancó el proceso",
+    ("generation",),
+    callback=lambda: _gc_stat("collections")
+)
+REGISTRY.gauge(
+    "studysprint_gc_collected_objects",
+    "Objetos liberados por el recolector de basura por generación",
+    ("generation",),
+    callback=lambda: _gc_stat("collected")
+)
+REGISTRY.gauge(
+    "studysprint_gc_uncollectable_objects",
+    "Objetos que el recolector de basura no pudo liberar",
+    ("generation",),
+    callback=lambda: _gc_stat("uncollectable")
+)
+REGISTRY.gauge(
+    "studysprint_tracemalloc_traced_bytes",
+    "Memoria seguida por tracemalloc (0 si no está activo)",
+    callback=lambda: tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+)
+GC_PAUSES = REGISTRY.histogram(
+    "studysprint_gc_pause_seconds",
+    "Duración de las pausas del recolector de basura",
+    ("generation",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+REQUEST_PEAK_MEMORY = REGISTRY.histogram(
+    "studysprint_request_peak_memory_bytes",
+    "Pico de memoria reservada durante una petición muestreada (tracemalloc)",
+    ("route",),
+    buckets=tuple(2 ** power for power in range(16, 32, 2))
+)
+UPLOADS = REGISTRY.counter(
+    "studysprint_uploads_total",
+    "PDFs subidos según el presupuesto de memoria: leídos en memoria, leídos desde el disco o rechazados",
+    ("mode",)
+)
+
+_gc_started: Dict[int, float] = {}
+
+
+def _on_gc(phase: str, info: Dict[str, Any]):
+    # El recolector corre en el hilo que reserva memoria: se separa por hilo
+    thread = threading.get_ident()
+    if phase == "start":
+        _gc_started[thread] = time.perf_counter()
+    else:
+        started = _gc_started.pop(thread, None)
+        if started is not None:
+            GC_PAUSES.observe(time.perf_counter() - started, generation=info["generation"])
+
+
+if _on_gc not in gc.callbacks:
+    gc.callbacks.append(_on_gc)
+
+
+class HeapTracer:
+    """Arranca y detiene tracemalloc según quién lo necesita
+
+    tracemalloc ralentiza cada reserva de memoria: solo está activo mientras
+    se mide una petición o se guardan instantáneas. Si ya estaba activo al
+    arrancar (PYTHONTRACEMALLOC) no se detiene nunca.
+    """
+
+    def __init__(self):
+        self.frames = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+        self.keep = int(os.getenv("MEMORY_SNAPSHOT_KEEP", "5"))
+        self._external = tracemalloc.is_tracing()
+        self._holders: set = set()
+        self._lock = threading.Lock()
+        self.snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def hold(self, holder: str):
+        with self._lock:
+            self._holders.add(holder)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+
+    def release(self, holder: str):
+        with self._lock:
+            self._holders.discard(holder)
+            if not self._holders and not self._external and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    def try_hold_request(self) -> bool:
+        """Reservar tracemalloc para medir una petición; False si ya se mide otra"""
+        with self._lock:
+            if "request" in self._holders:
+                return False
+            self._holders.add("request")
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            return True
+
+    def take_snapshot(self) -> Dict[str, Any]:
+        """Tomar una instantánea del heap; la primera activa tracemalloc y sale casi vacía"""
+        started = not tracemalloc.is_tracing()
+        self.hold("snapshots")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        entry = {
+            "id": uuid.uuid4().hex[:12],
+            "taken_at": time.time(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "rss_bytes": resident_memory(),
+            "tracing_started": started,
+            "snapshot": snapshot,
+        }
+        with self._lock:
+            self.snapshots[entry["id"]] = entry
+            while len(self.snapshots) > self.keep:
+                self.snapshots.popitem(last=False)
+        return entry
+
+    def clear_snapshots(self):
+        """Olvidar las instantáneas y dejar de trazar si nadie más lo necesita"""
+        with self._lock:
+            self.snapshots.clear()
+        self.release("snapshots")
+
+    def status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            "rss_bytes": resident_memory(),
+            "peak_rss_bytes": peak_resident_memory(),
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "gc": {
+                "counts": list(gc.get_count()),
+                "thresholds": list(gc.get_threshold()),
+                "stats": gc.get_stats(),
+            },
+            "snapshots": [describe_snapshot(entry) for entry in self.snapshots.values()],
+        }
+
+
+def describe_snapshot(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Datos de una instantánea sin el objeto de tracemalloc"""
+    return {key: value for key, value in entry.items() if key != "snapshot"}
+
+
+def _format_stat(stat) -> Dict[str, Any]:
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    result = {"location": frames[0] if frames else "<unknown>", "size_bytes": stat.size, "count": stat.count}
+    if len(frames) > 1:
+        result["traceback"] = frames
+    if hasattr(stat, "size_diff"):
+        result["size_diff_bytes"] = stat.size_diff
+        result["count_diff"] = stat.count_diff
+    return result
+
+
+def top_allocations(entry: Dict[str, Any], group_by: str, limit: int) -> List[Dict[str, Any]]:
+    """Ubicaciones que más memoria retienen en una instantánea"""
+    return [_format_stat(stat) for stat in entry["snapshot"].statistics(group_by)[:limit]]
+
+
+def compare_snapshots(entry: Dict[str, Any], base: Dict[str, Any], group_by: str, limit: int) -> List[Dict[str, Any]]:
+    """Ubicaciones cuya memoria retenida más cambió desde la instantánea base"""
+    return [_format_stat(stat) for stat in entry["snapshot"].compare_to(base["snapshot"], group_by)[:limit]]
+
+
+class MemoryMiddleware:
+    """Middleware ASGI que mide el pico de memoria de una fracción de las peticiones
+
+    Con MEMORY_TRACE_SAMPLE_RATE en 0 (por defecto) no hace nada más que
+    llamar a la aplicación.
+    """
+
+    def __init__(self, app, tracer: Callable[[], HeapTracer]):
+        self.app = app
+        self.tracer = tracer
+        self.sample_rate = float(os.getenv("MEMORY_TRACE_SAMPLE_RATE", "0"))
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.sample_rate <= 0
+            or random.random() >= self.sample_rate
+            or scope["path"].startswith(("/admin/", "/metrics"))
+        ):
+            await self.app(scope, receive, send)
+            return
+        tracer = self.tracer()
+        if not tracer.try_hold_request():
+            # Ya se está midiendo otra petición
+            await self.app(scope, receive, send)
+            return
+
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+            tracer.release("request")
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_PEAK_MEMORY.observe(peak, route=route)
+            logger.info("memory", extra={"fields": {
+                "request_id": request_id_var.get(),
+                "route": route,
+                "peak_bytes": peak,
+                "rss_bytes": resident_memory(),
+            }})
@@ -43,8 +43,22 @@ class SessionRequest(BaseModel):
     duration: int = Field(..., ge=5, le=15)
 
 
+class BatchSessionItem(BaseModel):
+    """Tema y duración de una sesión dentro de un lote"""
+    topic_id: int
+    duration: int = Field(..., ge=5, le=15)
+
+
+class BatchSessionRequest(BaseModel):
+    """Solicitud para generar varias sesiones de estudio en paralelo"""
+    subject_id: int
+    items: List[BatchSessionItem] = Field(..., min_length=1, max_length=100)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+
 class QuizQuestion(BaseModel):
     """Pregunta de quiz"""
+    id: Optional[int] = None
     question: str
     options: List[str]
     correct_answer: int
@@ -59,6 +73,16 @@ class SessionResponse(BaseModel):
     content: str
     key_concepts: List[str]
     quiz: List[QuizQuestion]
+    # True si se sirvió sin el LLM (sesión anterior o solo material de referencia)
+    degraded: bool = False
+    # Id de la sesión guardada, para reanudarla con GET /sessions/{id}
+    session_id: Optional[int] = None
+
+
+class QuizAnswer(BaseModel):
+    """Respuesta del estudiante a una pregunta del banco"""
+    question_id: int
+    correct: bool
 
 
 class QuizResult(BaseModel):
@@ -67,6 +91,9 @@ class QuizResult(BaseModel):
     duration: int
     score: int
     total_questions: int
+    answers: List[QuizAnswer] = []
+    # Sesión generada a la que corresponde el resultado, si se guardó
+    session_id: Optional[int] = None
 
 
 class StudySession(BaseModel):
@@ -79,3 +106,4 @@ class StudySession(BaseModel):
     score: int
     total_questions: int
     completed_at: str
+    generated_session_id: Optional[int] = None
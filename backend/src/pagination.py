@@ -0,0 +1,62 @@
+"""
+Paginación por cursor (keyset) para los listados
+"""
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Límite máximo de filas por página
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Codificar la posición (valor de orden, id) de la última fila de una página"""
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Decodificar un cursor; lanza ValueError si no es válido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_timestamp(value: str, name: str) -> str:
+    """Normalizar un filtro de fecha ISO 8601 al formato guardado (UTC, 'YYYY-MM-DD HH:MM:SS')
+
+    Acepta fechas sin hora, 'T' o espacio como separador y zona horaria ('Z'
+    u offset); sin zona se toma como UTC. Lanza ValueError si no es una fecha.
+    """
+    text = value.strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def clamp_limit(limit: Optional[int], default: Optional[int]) -> Optional[int]:
+    """Aplicar el valor por defecto y el máximo al tamaño de página"""
+    if limit is None:
+        return default
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def split_page(rows: List[Dict[str, Any]], limit: Optional[int], sort_key: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Separar la fila extra pedida para detectar la página siguiente y construir su cursor"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(last[sort_key], last['id'])
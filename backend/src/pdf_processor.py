@@ -1,35 +1,65 @@
 """
 Procesador de archivos PDF para extracción de texto
 """
-from pypdf import PdfReader
 from io import BytesIO
+import os
 import re
+from typing import BinaryIO, Optional, Union
+from src.telemetry import get_logger, traced
+
+logger = get_logger("pdf")
+
+
+class DocumentTooLargeError(ValueError):
+    """El texto del documento supera el presupuesto de PDF_MAX_TEXT_CHARS"""
 
 
 class PDFProcessor:
     """Clase para procesar y extraer texto de archivos PDF"""
+
+    def __init__(self, max_text_chars: Optional[int] = None):
+        """Configurar el máximo de caracteres extraídos por documento (0 = sin límite)"""
+        if max_text_chars is None:
+            max_text_chars = int(os.getenv("PDF_MAX_TEXT_CHARS", "0"))
+        self.max_text_chars = max_text_chars
     
-    def extract_text(self, pdf_content: bytes) -> str:
-        """Extraer y limpiar texto de un archivo PDF"""
+    @traced("pdf.extract_text")
+    def extract_text(self, pdf_content: Union[bytes, BinaryIO]) -> str:
+        """Extraer y limpiar texto de un archivo PDF
+
+        Acepta los bytes del PDF o un archivo binario abierto; con un archivo
+        el PDF se lee desde el disco sin cargarlo entero en memoria.
+        """
+        # pypdf se importa al primer uso para no cargarlo al arrancar
+        from pypdf import PdfReader
+        
         try:
-            # Crear lector de PDF desde bytes
-            pdf_file = BytesIO(pdf_content)
+            # Crear lector de PDF desde bytes o desde el archivo
+            pdf_file = BytesIO(pdf_content) if isinstance(pdf_content, (bytes, bytearray)) else pdf_content
             reader = PdfReader(pdf_file)
             
-            # Extraer texto de todas las páginas
-            full_text = ""
+            # Extraer texto de todas las páginas (unir al final evita copiar el texto en cada página)
+            pages = []
+            size = 0
             for page in reader.pages:
                 text = page.extract_text()
                 if text:
-                    full_text += text + "\n\n"
+                    pages.append(text)
+                    size += len(text)
+                    if self.max_text_chars and size > self.max_text_chars:
+                        raise DocumentTooLargeError(
+                            f"Document text exceeds {self.max_text_chars} characters"
+                        )
             
             # Limpiar y normalizar el texto
-            cleaned_text = self.clean_text(full_text)
+            cleaned_text = self.clean_text("\n\n".join(pages))
             
             return cleaned_text
             
+        except DocumentTooLargeError:
+            raise
         except Exception as e:
-            print(f"Error extracting text from PDF: {e}")
+            logger.warning("Error extracting text from PDF", extra={"fields": {"error": str(e)}})
             return ""
     
     def clean_text(self, text: str) -> str:
@@ -71,3 +101,8 @@ class PDFProcessor:
             segments.append(current_segment.strip())
         
         return segments
+
+
+def extract_text_from_bytes(pdf_content: bytes) -> str:
+    """Extraer el texto de un PDF en un proceso aparte (función de módulo para poder enviarla al pool)"""
+    return PDFProcessor().extract_text(pdf_content)
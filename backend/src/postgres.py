@@ -0,0 +1,418 @@
+"""
+Implementación de Storage sobre PostgreSQL
+
+Reutiliza las consultas de Database: las conexiones del pool se envuelven en
+un adaptador que acepta los marcadores de sqlite3 (? y :nombre), expone
+lastrowid y total_changes, y devuelve filas accesibles por nombre y por
+posición con las fechas en el mismo formato de texto que SQLite. Solo se
+reescriben el esquema y las consultas con funciones propias de SQLite.
+"""
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+from src.database import DAILY_STATS_COLUMNS, Database
+from src.telemetry import get_logger, traced
+
+logger = get_logger("postgres")
+
+# Tablas con id autoincremental: sus INSERT devuelven el id como lastrowid
+_TABLES_WITH_ID = {
+    "subjects", "topics", "topic_content", "study_sessions", "llm_calls", "quiz_questions", "generated_sessions"
+}
+_INSERT_TABLE = re.compile(r"^\s*INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+_PARAMETER = re.compile(r"\?|(?<![:\w]):([A-Za-z_]\w*)")
+
+# Clave del cerrojo consultivo que serializa la creación del esquema entre nodos
+_SCHEMA_LOCK_KEY = 7_420_031
+
+# Mismo formato que CURRENT_TIMESTAMP en SQLite
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def is_postgres_url(url: Optional[str]) -> bool:
+    """Indicar si una URL de base de datos apunta a PostgreSQL"""
+    return bool(url) and url.split(":", 1)[0] in ("postgres", "postgresql")
+
+
+@lru_cache(maxsize=512)
+def translate_sql(sql: str) -> Tuple[str, bool]:
+    """Traducir los marcadores de sqlite3 a los de psycopg
+
+    Devuelve la consulta y si se le agregó RETURNING id para obtener lastrowid.
+    """
+    translated = _PARAMETER.sub(
+        lambda m: "%s" if m.group(0) == "?" else f"%({m.group(1)})s",
+        sql.replace("%", "%%")
+    )
+    match = _INSERT_TABLE.match(sql)
+    returning = bool(match) and match.group(1).lower() in _TABLES_WITH_ID and "RETURNING" not in sql.upper()
+    if returning:
+        translated = translated.rstrip().rstrip(";") + " RETURNING id"
+    return translated, returning
+
+
+def _convert(value: Any) -> Any:
+    """Llevar los tipos de PostgreSQL a los que devuelve SQLite"""
+    if isinstance(value, datetime):
+        return value.strftime(_TIMESTAMP_FORMAT)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class Row(dict):
+    """Fila accesible por nombre y por posición, como sqlite3.Row"""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+
+
+def _row_factory(cursor):
+    names = [column.name for column in cursor.description or ()]
+
+    def make_row(values):
+        return Row(zip(names, map(_convert, values)))
+
+    return make_row
+
+
+class _Cursor:
+    """Cursor con la interfaz de sqlite3 que usa Database"""
+
+    def __init__(self, connection: "PooledConnection", cursor):
+        self._connection = connection
+        self._cursor = cursor
+        self.lastrowid: Optional[int] = None
+
+    def execute(self, sql: str, params=None):
+        translated, returning = translate_sql(sql)
+        self._cursor.execute(translated, params or None)
+        self.lastrowid = None
+        if returning:
+            row = self._cursor.fetchone()
+            self.lastrowid = row[0] if row else None
+        self._connection.total_changes += max(self._cursor.rowcount, 0)
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        translated, returning = translate_sql(sql)
+        if returning:
+            translated = translated[:-len(" RETURNING id")]
+        self._cursor.executemany(translated, list(seq_of_params))
+        self._connection.total_changes += max(self._cursor.rowcount, 0)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+
+class PooledConnection:
+    """Conexión del pool con la interfaz de sqlite3.Connection que usa Database
+
+    close() la devuelve al pool (deshaciendo lo no confirmado).
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = pool.getconn()
+        self.total_changes = 0
+
+    def cursor(self) -> _Cursor:
+        return _Cursor(self, self._conn.cursor(row_factory=_row_factory))
+
+    def execute(self, sql: str, params=None) -> _Cursor:
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            # Las lecturas dejan una transacción abierta; cerrarla antes de devolver la conexión
+            self._conn.rollback()
+            self._pool.putconn(self._conn)
+            self._conn = None
+
+    def __del__(self):
+        # Si una excepción impidió llamar a close(), no perder la conexión del pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class PostgresDatabase(Database):
+    """Database sobre PostgreSQL con un pool de conexiones (psycopg)"""
+
+    _DAY_EXPRESSION = "CAST({} AS DATE)"
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.db_path = dsn
+        self._pool = None
+
+    @property
+    def pool(self):
+        """Pool de conexiones, abierto al primer uso (y de nuevo tras close())"""
+        if self._pool is None:
+            from psycopg_pool import ConnectionPool
+
+            self._pool = ConnectionPool(
+                self.dsn,
+                min_size=int(os.getenv("PG_POOL_MIN_SIZE", "1")),
+                max_size=int(os.getenv("PG_POOL_MAX_SIZE", "10")),
+                timeout=float(os.getenv("PG_POOL_TIMEOUT", "30")),
+                open=True,
+                name="studysprint"
+            )
+        return self._pool
+
+    def get_connection(self) -> PooledConnection:
+        """Obtener una conexión del pool"""
+        return PooledConnection(self.pool)
+
+    def close(self):
+        """Cerrar el pool de conexiones"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    @traced("db.initialize")
+    def initialize(self):
+        """Crear las tablas e índices (el esquema actual completo)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Varios nodos pueden arrancar a la vez: uno crea el esquema y los demás esperan
+        cursor.execute("SELECT pg_advisory_xact_lock(?)", (_SCHEMA_LOCK_KEY,))
+
+        # Fechas en UTC y a segundos, igual que CURRENT_TIMESTAMP en SQLite, para los cursores
+        now_utc = "date_trunc('second', now() AT TIME ZONE 'utc')"
+        daily_columns = ",\n                ".join(
+            f"{column} {'DOUBLE PRECISION' if column == 'accuracy_sum' else 'BIGINT'} NOT NULL DEFAULT 0"
+            for column in DAILY_STATS_COLUMNS
+        )
+        statements = [
+            f"""
+            CREATE TABLE IF NOT EXISTS subjects (
+                id BIGSERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                description TEXT,
+                created_at TIMESTAMP DEFAULT {now_utc}
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS topics (
+                id BIGSERIAL PRIMARY KEY,
+                subject_id BIGINT NOT NULL REFERENCES subjects(id),
+                name TEXT NOT NULL,
+                description TEXT,
+                created_at TIMESTAMP DEFAULT {now_utc}
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS topic_content (
+                id BIGSERIAL PRIMARY KEY,
+                topic_id BIGINT NOT NULL REFERENCES topics(id),
+                content TEXT NOT NULL,
+                source_file TEXT,
+                created_at TIMESTAMP DEFAULT {now_utc}
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS study_sessions (
+                id BIGSERIAL PRIMARY KEY,
+                topic_id BIGINT NOT NULL REFERENCES topics(id),
+                subject_id BIGINT,
+                duration INTEGER NOT NULL,
+                score INTEGER NOT NULL,
+                total_questions INTEGER NOT NULL,
+                completed_at TIMESTAMP DEFAULT {now_utc},
+                generated_session_id BIGINT,
+                completion_key TEXT
+            )
+            """,
+            "ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS generated_session_id BIGINT",
+            "ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS completion_key TEXT",
+            f"""
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id BIGSERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                model TEXT NOT NULL,
+                subject_id BIGINT,
+                topic_id BIGINT,
+                duration INTEGER,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                latency_ms DOUBLE PRECISION,
+                created_at TIMESTAMP DEFAULT {now_utc}
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS quiz_questions (
+                id BIGSERIAL PRIMARY KEY,
+                topic_id BIGINT NOT NULL REFERENCES topics(id),
+                question TEXT NOT NULL,
+                options TEXT NOT NULL,
+                correct_answer INTEGER NOT NULL,
+                question_hash TEXT NOT NULL,
+                source TEXT,
+                times_served INTEGER NOT NULL DEFAULT 0,
+                times_correct INTEGER NOT NULL DEFAULT 0,
+                times_wrong INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT {now_utc},
+                UNIQUE (topic_id, question_hash)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS topic_schedule (
+                topic_id BIGINT PRIMARY KEY REFERENCES topics(id),
+                subject_id BIGINT NOT NULL,
+                stability DOUBLE PRECISION NOT NULL DEFAULT 0,
+                ease DOUBLE PRECISION NOT NULL,
+                repetitions INTEGER NOT NULL DEFAULT 0,
+                lapses INTEGER NOT NULL DEFAULT 0,
+                due_at DOUBLE PRECISION NOT NULL,
+                last_reviewed_at DOUBLE PRECISION
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS subject_versions (
+                subject_id BIGINT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS topic_digest (
+                topic_id BIGINT PRIMARY KEY REFERENCES topics(id),
+                content_hash TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                outline TEXT NOT NULL,
+                model TEXT,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT {now_utc}
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS generated_sessions (
+                id BIGSERIAL PRIMARY KEY,
+                topic_id BIGINT NOT NULL REFERENCES topics(id),
+                subject_id BIGINT NOT NULL,
+                duration INTEGER NOT NULL,
+                model TEXT,
+                prompt_hash TEXT,
+                payload BYTEA NOT NULL,
+                created_at TIMESTAMP DEFAULT {now_utc}
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_generated_sessions_topic ON generated_sessions(topic_id, id)",
+            f"""
+            CREATE TABLE IF NOT EXISTS topic_daily_stats (
+                topic_id BIGINT NOT NULL,
+                subject_id BIGINT NOT NULL,
+                day DATE NOT NULL,
+                {daily_columns},
+                PRIMARY KEY (topic_id, day)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_topic_daily_stats_subject ON topic_daily_stats(subject_id, day)",
+            f"""
+            CREATE TABLE IF NOT EXISTS subject_daily_stats (
+                subject_id BIGINT NOT NULL,
+                day DATE NOT NULL,
+                {daily_columns},
+                PRIMARY KEY (subject_id, day)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls(created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_llm_calls_subject ON llm_calls(subject_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_topic_schedule_due ON topic_schedule(subject_id, due_at)",
+            "CREATE INDEX IF NOT EXISTS idx_topic_content_topic ON topic_content(topic_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_study_sessions_topic ON study_sessions(topic_id, completed_at)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_study_sessions_completion_key ON study_sessions(completion_key)",
+            "CREATE INDEX IF NOT EXISTS idx_study_sessions_subject_completed ON study_sessions(subject_id, completed_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_subjects_created ON subjects(created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_topics_subject_created ON topics(subject_id, created_at, id)",
+        ]
+        for statement in statements:
+            cursor.execute(statement)
+
+        self._backfill_topic_schedule(cursor)
+        self._backfill_daily_stats(cursor)
+
+        conn.commit()
+        conn.close()
+
+    @traced("db.get_topic_stats_columns")
+    def get_topic_stats_columns(self, subject_ids: Optional[List[int]] = None) -> List[tuple]:
+        """Obtener estadísticas numéricas de todos los temas (ver Database.get_topic_stats_columns)"""
+        where = ""
+        params: List[Any] = []
+        if subject_ids:
+            where = "WHERE t.subject_id = ANY(%s)"
+            params = [list(subject_ids)]
+
+        # Tuplas sin adaptar: se cargan directamente en columnas
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"""
+                SELECT
+                    t.id,
+                    t.subject_id,
+                    EXISTS (SELECT 1 FROM topic_content tc WHERE tc.topic_id = t.id),
+                    COUNT(ss.id),
+                    COALESCE(EXTRACT(EPOCH FROM MAX(ss.completed_at))::BIGINT, -1),
+                    COALESCE(AVG(ss.score::FLOAT / NULLIF(ss.total_questions, 0)), -1.0)
+                FROM topics t
+                LEFT JOIN study_sessions ss ON ss.topic_id = t.id
+                {where}
+                GROUP BY t.id
+                ORDER BY t.created_at DESC, t.id DESC
+            """, params).fetchall()
+
+        return rows
+
+    def ping(self) -> bool:
+        """Comprobar que la base de datos responde"""
+        with self.pool.connection() as conn:
+            conn.execute("SELECT 1")
+        return True
+
+    @traced("db.checkpoint")
+    def checkpoint(self):
+        """PostgreSQL gestiona sus checkpoints; no hay nada que hacer"""
+
+    def sync_id_sequences(self, tables: List[str]):
+        """Avanzar las secuencias BIGSERIAL hasta el mayor id importado"""
+        with self.pool.connection() as conn:
+            for table in tables:
+                if table in _TABLES_WITH_ID:
+                    conn.execute(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+                    )
+
+    @traced("db.optimize")
+    def optimize(self):
+        """Actualizar las estadísticas del planificador"""
+        with self.pool.connection() as conn:
+            conn.execute("ANALYZE")
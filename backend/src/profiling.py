@@ -0,0 +1,327 @@
+"""
+Perfilado bajo demanda de peticiones individuales
+
+Un hilo muestrea cada PROFILE_INTERVAL_MS milisegundos la pila de la petición
+perfilada. Si el bucle de eventos está ejecutando la tarea de la petición, la
+muestra es tiempo de CPU y se toma la pila del hilo; si la tarea está
+suspendida, se reconstruye su cadena de awaits y la hoja es el span activo
+más interno ([await llm.session_content], [await pdf.extract_text]...), así
+que el tiempo esperando al LLM o a un hilo aparece en el perfil con su
+nombre.
+
+El perfil se guarda en formato de pilas colapsadas (una línea por pila con
+su número de muestras), el que leen flamegraph.pl, speedscope o inferno.
+Sin peticiones perfiladas no hay hilo de muestreo y un span solo consulta
+una variable de contexto.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.admin_auth import ADMIN_HEADER, is_admin_token
+from src.telemetry import REGISTRY, get_logger, profile_var, request_id_var
+
+logger = get_logger("profiling")
+
+PROFILES_CAPTURED = REGISTRY.counter(
+    "studysprint_profiles_captured_total",
+    "Peticiones perfiladas, por motivo (cabecera de administración o muestreo)",
+    ("reason",)
+)
+
+PROFILE_HEADER = "x-profile"
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+# Rutas que nunca se perfilan por muestreo
+_EXCLUDED_PATHS = ("/admin/", "/metrics", "/health", "/ready")
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_label(frame) -> str:
+    """Nombre de un marco para el perfil: función (archivo:línea de definición)"""
+    code = frame.f_code
+    filename = code.co_filename
+    if "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[-1]
+    elif filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    else:
+        filename = os.path.basename(filename)
+    name = getattr(code, "co_qualname", code.co_name)
+    # ';' separa marcos en el formato colapsado
+    return f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _thread_stack(frame) -> List[Any]:
+    """Marcos de un hilo, del más externo al más interno"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro) -> Tuple[List[Any], Any]:
+    """Marcos de una corrutina suspendida siguiendo sus awaits, y el objeto que espera al final"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames, coro
+
+
+class RequestProfile:
+    """Muestras de una petición: pilas colapsadas y espera por span"""
+
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = uuid.uuid4().hex
+        self.request_id = request_id_var.get()
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.task = asyncio.current_task()
+        self.thread_id = threading.get_ident()
+        self.max_samples = int(os.getenv("PROFILE_MAX_SAMPLES", "20000"))
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        self.status: Optional[int] = None
+        self.samples = 0
+        self.cpu_samples = 0
+        self.truncated = False
+        self.stacks: Dict[str, int] = {}
+        self.waits: Dict[str, int] = {}
+        # Spans abiertos por la petición (y sus tareas hijas), del más externo al más interno
+        self.spans: List[str] = []
+
+    def enter_span(self, name: str):
+        self.spans.append(name)
+
+    def exit_span(self, name: str):
+        # Las tareas hijas comparten la lista: se quita la última aparición, no la cima
+        for index in range(len(self.spans) - 1, -1, -1):
+            if self.spans[index] == name:
+                del self.spans[index]
+                return
+
+    def sample(self, thread_frame):
+        """Registrar una muestra a partir del marco actual del hilo del bucle"""
+        if self.samples >= self.max_samples:
+            self.truncated = True
+            return
+        coro = self.task.get_coro() if self.task is not None else None
+        root = getattr(coro, "cr_frame", None)
+        if root is None:
+            return
+
+        stack = _thread_stack(thread_frame)
+        position = next((index for index, frame in enumerate(stack) if frame is root), None)
+        if position is not None:
+            labels = [_frame_label(frame) for frame in stack[position:]]
+            self.cpu_samples += 1
+        else:
+            frames, awaited = _await_chain(coro)
+            spans = tuple(self.spans)
+            leaf = f"[await {spans[-1]}]" if spans else f"[await {type(awaited).__name__}]"
+            labels = [_frame_label(frame) for frame in frames]
+            labels.append(leaf)
+            self.waits[leaf] = self.waits.get(leaf, 0) + 1
+
+        key = ";".join(labels)
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def finish(self, status: Optional[int]):
+        self.status = status
+        self.elapsed = time.perf_counter() - self.start
+
+    def collapsed(self) -> str:
+        """Pilas en formato colapsado: 'marco;marco;hoja muestras' por línea"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def summary(self, interval_ms: float) -> Dict[str, Any]:
+        waits = sorted(self.waits.items(), key=lambda item: item[1], reverse=True)
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": round(self.elapsed * 1000, 2),
+            "interval_ms": interval_ms,
+            "samples": self.samples,
+            "cpu_ms": round(self.cpu_samples * interval_ms, 1),
+            "wait_ms": {leaf[len("[await "):-1]: round(count * interval_ms, 1) for leaf, count in waits},
+            "truncated": self.truncated,
+        }
+
+
+class Sampler:
+    """Hilo de muestreo; solo vive mientras hay peticiones perfiladas"""
+
+    def __init__(self):
+        self.interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+        self._profiles: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            if profile in self._profiles:
+                self._profiles.remove(profile)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for profile in self._profiles:
+                    frame = frames.get(profile.thread_id)
+                    if frame is None:
+                        continue
+                    try:
+                        profile.sample(frame)
+                    except Exception:
+                        # Las pilas cambian mientras se leen: una muestra perdida no importa
+                        pass
+
+
+class ProfileStore:
+    """Perfiles guardados en disco: <id>.folded con las pilas y <id>.json con el resumen"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # Perfiles conservados; los más antiguos se borran
+        self.keep = int(os.getenv("PROFILE_KEEP", "50"))
+
+    def save(self, profile: RequestProfile, interval_ms: float):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile.id)
+        with open(base + ".folded", "w", encoding="utf-8") as handle:
+            handle.write(profile.collapsed())
+        with open(base + ".json", "w", encoding="utf-8") as handle:
+            json.dump(profile.summary(interval_ms), handle)
+        self._prune()
+
+    def _prune(self):
+        summaries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in summaries[self.keep:]:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, entry.name[:-len(".json")] + suffix))
+                except OSError:
+                    pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Resúmenes de los perfiles guardados, del más reciente al más antiguo"""
+        if not os.path.isdir(self.directory):
+            return []
+        summaries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    with open(entry.path, encoding="utf-8") as handle:
+                        summaries.append(json.load(handle))
+                except (OSError, ValueError):
+                    continue  # Borrado o a medio escribir
+        summaries.sort(key=lambda summary: summary["started_at"], reverse=True)
+        return summaries
+
+    def get(self, profile_id: str) -> Optional[str]:
+        """Pilas colapsadas de un perfil; None si no existe"""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, profile_id + ".folded"), encoding="utf-8") as handle:
+                return handle.read()
+        except FileNotFoundError:
+            return None
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila las peticiones pedidas o muestreadas
+
+    Se perfila una petición si trae X-Profile: 1 junto con un X-Admin-Token
+    válido, o al azar con probabilidad PROFILE_SAMPLE_RATE entre las rutas que
+    empiezan por algún prefijo de PROFILE_PATHS (todas si está vacío). Debe
+    quedar por dentro del middleware de trazas para correr en la tarea del
+    endpoint y conocer el id de la petición.
+    """
+
+    def __init__(self, app, store: Callable[[], ProfileStore]):
+        self.app = app
+        self.store = store
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.paths = tuple(path.strip() for path in os.getenv("PROFILE_PATHS", "").split(",") if path.strip())
+        self.sampler = Sampler()
+
+    def _reason(self, scope) -> Optional[str]:
+        headers = dict(scope["headers"])
+        requested = headers.get(PROFILE_HEADER.encode("latin-1"))
+        if requested is not None and requested.decode("latin-1").lower() in ("1", "true", "yes", "on"):
+            token = headers.get(ADMIN_HEADER.encode("latin-1"))
+            if is_admin_token(token.decode("latin-1") if token is not None else None):
+                return "header"
+        if self.sample_rate <= 0:
+            return None
+        path = scope["path"]
+        if path.startswith(_EXCLUDED_PATHS) or (self.paths and not path.startswith(self.paths)):
+            return None
+        return "sampled" if random.random() < self.sample_rate else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = self._reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], reason)
+        status: List[int] = []
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile.id.encode("latin-1"))]
+            await send(message)
+
+        token = profile_var.set(profile)
+        self.sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.sampler.remove(profile)
+            profile_var.reset(token)
+            profile.finish(status[0] if status else None)
+            PROFILES_CAPTURED.inc(reason=reason)
+            try:
+                self.store().save(profile, self.sampler.interval * 1000)
+            except OSError:
+                logger.exception("Error saving profile", extra={"fields": {"profile_id": profile.id}})
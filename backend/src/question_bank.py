@@ -0,0 +1,132 @@
+"""
+Banco de preguntas pregeneradas por tema
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Set
+from src.models import QuizQuestion
+from src.telemetry import REGISTRY, get_logger
+
+logger = get_logger("question_bank")
+
+BANK_DRAWS = REGISTRY.counter(
+    "studysprint_question_bank_draws_total",
+    "Quizzes servidos desde el banco (hit) o generados con el LLM (miss)",
+    ("result",)
+)
+BANK_REFILLS = REGISTRY.counter(
+    "studysprint_question_bank_refills_total",
+    "Rellenos del banco de preguntas",
+    ("status",)
+)
+
+
+def question_hash(question: str) -> str:
+    """Hash del enunciado normalizado (sin mayúsculas, puntuación ni espacios extra)"""
+    normalized = re.sub(r"[^\w\s]", "", question.lower())
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class QuestionBank:
+    """Sirve quizzes desde preguntas almacenadas y rellena el banco en segundo plano"""
+
+    def __init__(self, database, llm):
+        """Configurar umbrales del banco a partir de variables de entorno"""
+        self.db = database
+        self.llm = llm
+        # Por debajo de este número de preguntas se dispara un relleno
+        self.low_watermark = int(os.getenv("QUESTION_BANK_MIN", "12"))
+        # Preguntas pedidas al LLM en cada relleno
+        self.batch_size = int(os.getenv("QUESTION_BANK_BATCH", "15"))
+        # Caracteres máximos de material fuente por relleno
+        self.max_source_chars = int(os.getenv("QUESTION_BANK_SOURCE_CHARS", "8000"))
+        # Segundos mínimos entre rellenos del mismo tema (evita insistir si el LLM repite preguntas)
+        self.refill_cooldown = float(os.getenv("QUESTION_BANK_REFILL_COOLDOWN", "600"))
+        self._refilling: Set[int] = set()
+        self._last_refill: Dict[int, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def draw(self, topic_id: int, num_questions: int) -> Optional[List[QuizQuestion]]:
+        """Tomar un quiz del banco; None si el banco no tiene suficientes preguntas"""
+        rows = self.db.sample_quiz_questions(topic_id, num_questions)
+        if len(rows) < num_questions:
+            BANK_DRAWS.inc(result="miss")
+            return None
+        BANK_DRAWS.inc(result="hit")
+        return [QuizQuestion(**row) for row in rows]
+
+    def add(self, topic_id: int, questions: List[QuizQuestion], source: str) -> List[QuizQuestion]:
+        """Guardar preguntas en el banco y devolverlas con su id asignado"""
+        valid = [q for q in questions if len(q.options) >= 2 and 0 <= q.correct_answer < len(q.options)]
+        rows = [
+            {
+                'question': q.question,
+                'options': q.options,
+                'correct_answer': q.correct_answer,
+                'question_hash': question_hash(q.question)
+            }
+            for q in valid
+        ]
+        self.db.add_quiz_questions(topic_id, rows, source)
+        ids = self.db.get_quiz_question_ids(topic_id, [row['question_hash'] for row in rows])
+        return [
+            q.model_copy(update={'id': ids.get(row['question_hash'])})
+            for q, row in zip(valid, rows)
+        ]
+
+    def schedule_refill(self, topic: Dict[str, Any], reference_material: Optional[str], session_content: Optional[str] = None):
+        """Lanzar un relleno en segundo plano si el banco del tema está bajo"""
+        topic_id = topic['id']
+        if topic_id in self._refilling:
+            return
+        if time.monotonic() - self._last_refill.get(topic_id, float("-inf")) < self.refill_cooldown:
+            return
+        if self.db.count_quiz_questions(topic_id) >= self.low_watermark:
+            return
+
+        source_text = self._build_source(reference_material, session_content)
+        if not source_text:
+            return
+
+        self._refilling.add(topic_id)
+        self._last_refill[topic_id] = time.monotonic()
+        task = asyncio.ensure_future(self._refill(topic, source_text))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, topic: Dict[str, Any], source_text: str):
+        """Generar un lote de preguntas y guardarlo en el banco"""
+        try:
+            questions = await self.llm.generate_question_bank(
+                topic_name=topic['name'],
+                source_text=source_text,
+                num_questions=self.batch_size
+            )
+            added = self.add(topic['id'], questions, source="bulk")
+            BANK_REFILLS.inc(status="ok")
+            logger.info("Question bank refilled", extra={"fields": {
+                "topic_id": topic['id'], "generated": len(questions), "stored": len(added)
+            }})
+        except Exception:
+            BANK_REFILLS.inc(status="error")
+            logger.exception("Question bank refill failed", extra={"fields": {"topic_id": topic['id']}})
+        finally:
+            self._refilling.discard(topic['id'])
+
+    def _build_source(self, reference_material: Optional[str], session_content: Optional[str]) -> str:
+        """Combinar material subido y contenido generado dentro del límite de caracteres"""
+        parts = [text for text in (reference_material, session_content) if text]
+        if not parts:
+            return ""
+        # Repartir el presupuesto entre las fuentes disponibles
+        share = self.max_source_chars // len(parts)
+        return "\n\n".join(text[:share] for text in parts)
+
+    async def drain(self):
+        """Esperar a que terminen los rellenos en curso (al apagar)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
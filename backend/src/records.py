@@ -0,0 +1,46 @@
+"""
+Registros compactos de solo lectura para serializar listados grandes
+
+Son dataclasses con __slots__ que orjson serializa de forma nativa. Reflejan
+los modelos Subject y Topic sin el coste de validarlos: las filas ya se
+validaron al escribirse.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+
+@dataclass(slots=True)
+class SubjectRecord:
+    """Materia tal como la devuelve GET /subjects"""
+    id: int
+    name: str
+    description: Optional[str]
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "SubjectRecord":
+        return cls(row['id'], row['name'], row['description'], row['created_at'])
+
+
+@dataclass(slots=True)
+class TopicRecord:
+    """Tema tal como lo devuelve GET /subjects/{id}/topics"""
+    id: int
+    subject_id: int
+    name: str
+    description: Optional[str]
+    has_content: bool
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "TopicRecord":
+        return cls(
+            row['id'], row['subject_id'], row['name'], row['description'],
+            bool(row.get('has_content', False)), row['created_at']
+        )
+
+
+def to_records(record_type, rows: List[Dict[str, Any]]) -> list:
+    """Convertir filas de la base de datos en registros compactos"""
+    from_row = record_type.from_row
+    return [from_row(row) for row in rows]
@@ -0,0 +1,66 @@
+"""
+Planificador de repaso espaciado (variante de SM-2) por tema
+"""
+from typing import Any, Dict, Optional
+
+SECONDS_PER_DAY = 86400.0
+
+# Factor de facilidad inicial y mínimo de SM-2
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+# Calidad mínima (0-5) para considerar el repaso exitoso
+PASSING_QUALITY = 3
+
+
+def initial_state(now: float) -> Dict[str, Any]:
+    """Estado de un tema nunca estudiado: vence de inmediato"""
+    return {
+        'stability': 0.0,
+        'ease': INITIAL_EASE,
+        'repetitions': 0,
+        'lapses': 0,
+        'due_at': now,
+        'last_reviewed_at': None
+    }
+
+
+def quality_from_score(score: int, total_questions: int) -> int:
+    """Convertir el resultado del quiz a la escala de calidad 0-5 de SM-2"""
+    if total_questions <= 0:
+        return 0
+    ratio = max(0.0, min(1.0, score / total_questions))
+    return round(ratio * 5)
+
+
+def review(state: Optional[Dict[str, Any]], score: int, total_questions: int, now: float) -> Dict[str, Any]:
+    """Calcular el nuevo estado del tema tras una sesión completada
+
+    stability es el intervalo en días hasta el próximo repaso y ease el factor
+    de facilidad (cuanto menor, más difícil resulta el tema).
+    """
+    state = dict(state or initial_state(now))
+    quality = quality_from_score(score, total_questions)
+
+    if quality >= PASSING_QUALITY:
+        state['repetitions'] += 1
+        if state['repetitions'] == 1:
+            interval = 1.0
+        elif state['repetitions'] == 2:
+            interval = 6.0
+        else:
+            interval = max(state['stability'], 1.0) * state['ease']
+    else:
+        # Olvido: reiniciar la serie y repasar pronto
+        state['repetitions'] = 0
+        state['lapses'] += 1
+        interval = 1.0
+
+    state['ease'] = max(
+        MIN_EASE,
+        state['ease'] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    )
+    state['stability'] = interval
+    state['last_reviewed_at'] = now
+    state['due_at'] = now + interval * SECONDS_PER_DAY
+    return state
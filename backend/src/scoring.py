@@ -0,0 +1,141 @@
+"""
+Puntuación vectorizada de prioridad de temas para conjuntos grandes
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional; sin él se usa el puntuador escalar
+    np = None
+
+MICROSECONDS_PER_DAY = 86_400_000_000
+
+
+def numpy_available() -> bool:
+    """Indicar si la ruta vectorizada está disponible"""
+    return np is not None
+
+
+def naive_now_us(now: Optional[datetime] = None) -> int:
+    """Hora local actual (naive, como la usa el puntuador escalar) en microsegundos"""
+    now = now or datetime.now()
+    return int(now.replace(tzinfo=timezone.utc).timestamp()) * 1_000_000 + now.microsecond
+
+
+TOPIC_STATS_DTYPE = None if np is None else np.dtype([
+    ('topic_id', np.int64),
+    ('subject_id', np.int64),
+    ('has_content', np.bool_),
+    ('session_count', np.int64),
+    ('last_epoch', np.int64),
+    ('avg_performance', np.float64),
+])
+
+
+class TopicColumns:
+    """Estadísticas de temas en formato columnar
+
+    Se construye a partir de las tuplas de Database.get_topic_stats_columns:
+    (topic_id, subject_id, has_content, session_count, last_studied_epoch,
+    avg_performance), con -1 como marca de valor ausente. last_studied_epoch
+    son los segundos del TIMESTAMP tratado como naive.
+    """
+
+    def __init__(self, rows: Sequence[Sequence[Any]]):
+        data = np.fromiter(rows, dtype=TOPIC_STATS_DTYPE, count=len(rows))
+        self.topic_ids = data['topic_id']
+        self.subject_ids = data['subject_id']
+        self.has_content = data['has_content']
+        self.session_count = data['session_count']
+        self.has_last = data['last_epoch'] >= 0
+        self.last_us = data['last_epoch'] * 1_000_000
+        self.avg_performance = np.where(data['avg_performance'] < 0, np.nan, data['avg_performance'])
+
+    def __len__(self) -> int:
+        return len(self.topic_ids)
+
+
+def score(columns: TopicColumns, now_us: int):
+    """Calcular prioridades y días desde el último estudio para todos los temas
+
+    Reproduce StudyAgent.calculate_topic_priority término a término.
+    """
+    never = columns.session_count == 0
+    # timedelta.days es la división entera (hacia abajo) de la diferencia
+    days_since = (now_us - columns.last_us) // MICROSECONDS_PER_DAY
+    recency = np.where(columns.has_last, np.minimum(days_since * 5, 50), 0).astype(np.float64)
+    performance = np.nan_to_num(columns.avg_performance, nan=0.0)
+    studied = recency + (1.0 - performance) * 30
+    priority = np.where(never, 100.0, studied)
+    priority = priority + np.where(columns.has_content, 10.0, 0.0)
+    return priority, days_since
+
+
+def top_k(priority, k: int):
+    """Índices de las k prioridades más altas, desempatando por orden original
+
+    Equivale a un sort estable descendente seguido de [:k], pero en O(n).
+    """
+    n = len(priority)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        candidates = np.arange(n)
+    else:
+        threshold = np.partition(priority, n - k)[n - k]
+        above = np.flatnonzero(priority > threshold)
+        ties = np.flatnonzero(priority == threshold)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    order = np.lexsort((candidates, -priority[candidates]))
+    return candidates[order][:k]
+
+
+def reasons(columns: TopicColumns, days_since, indices) -> List[str]:
+    """Generar las razones legibles de los temas seleccionados
+
+    Las máscaras se calculan vectorizadas; solo se formatean las cadenas de
+    los temas devueltos. Reproduce StudyAgent.get_recommendation_reason.
+    """
+    never = columns.session_count == 0
+    show_days = columns.has_last & (days_since > 1)
+    performance = columns.avg_performance
+    low_performance = ~np.isnan(performance) & (performance > 0) & (performance < 0.7)
+
+    result = []
+    for i in indices:
+        if never[i]:
+            result.append("Nunca estudiado")
+            continue
+        parts = []
+        if show_days[i]:
+            parts.append(f"Estudiado hace {int(days_since[i])} dias")
+        if low_performance[i]:
+            parts.append(f"Desempeno promedio: {round(float(performance[i]) * 100)}%")
+        result.append(", ".join(parts) if parts else "Listo para repasar")
+    return result
+
+
+def recommend(columns: TopicColumns, limit: int, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Recomendar los temas con mayor prioridad entre todos los cargados
+
+    Las etiquetas (nombre, último estudio) las completa quien llama, solo para
+    los temas devueltos.
+    """
+    priority, days_since = score(columns, naive_now_us(now))
+    # Ordenar por la puntuación redondeada, igual que la ruta escalar
+    indices = top_k(np.round(priority, 2), limit)
+    texts = reasons(columns, days_since, indices)
+
+    recommendations = []
+    for i, reason in zip(indices, texts):
+        avg = columns.avg_performance[i]
+        recommendations.append({
+            'topic_id': int(columns.topic_ids[i]),
+            'subject_id': int(columns.subject_ids[i]),
+            'priority_score': round(float(priority[i]), 2),
+            'times_studied': int(columns.session_count[i]),
+            'average_performance': round(float(avg) * 100, 1) if not np.isnan(avg) and avg else None,
+            'reason': reason
+        })
+    return recommendations
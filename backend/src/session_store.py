@@ -0,0 +1,48 @@
+"""
+Sesiones generadas guardadas para reanudarlas sin volver a llamar al LLM
+
+El contenido y el quiz se guardan como JSON comprimido con zlib: una sesión
+de 15 minutos ocupa unos 20 KB de texto y comprimida queda en un tercio.
+"""
+import hashlib
+import os
+import zlib
+from typing import Any, Dict, List
+from src import fast_json
+from src.models import SessionResponse
+from src.telemetry import REGISTRY
+
+STORED_SESSIONS = REGISTRY.counter(
+    "studysprint_stored_sessions_total",
+    "Sesiones generadas guardadas y servidas desde la base de datos",
+    ("operation",)
+)
+
+# Campos que dependen de cómo se sirve la sesión, no de su contenido
+_SERVING_FIELDS = {"session_id", "degraded"}
+
+
+def session_store_enabled() -> bool:
+    """Indicar si se guardan las sesiones generadas (SESSION_STORE_ENABLED, activado por defecto)"""
+    return os.getenv("SESSION_STORE_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+
+
+def prompt_hash(model: str, messages: List[Dict[str, Any]], max_tokens: int) -> str:
+    """Hash del prompt de una generación, para saber qué sesiones salieron del mismo prompt"""
+    digest = hashlib.sha1(model.encode("utf-8"))
+    for message in messages:
+        digest.update(b"\0" + message["role"].encode("utf-8") + b"\0" + message["content"].encode("utf-8"))
+    digest.update(f"\0{max_tokens}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def pack_session(session: SessionResponse) -> bytes:
+    """Serializar y comprimir el contenido de una sesión"""
+    payload = fast_json.dumps(session.model_dump(mode="json", exclude=_SERVING_FIELDS))
+    return zlib.compress(payload, int(os.getenv("SESSION_STORE_COMPRESSION", "6")))
+
+
+def unpack_session(row: Dict[str, Any]) -> SessionResponse:
+    """Reconstruir una sesión guardada a partir de su fila"""
+    data = fast_json.loads(zlib.decompress(row['payload']))
+    return SessionResponse(**data, session_id=row['id'])
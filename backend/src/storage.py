@@ -0,0 +1,223 @@
+"""
+Interfaz de almacenamiento común a los backends (SQLite y PostgreSQL)
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+
+class Storage(ABC):
+    """Operaciones de persistencia que usan la API, el agente y los servicios
+
+    Database (SQLite) es la implementación por defecto y PostgresDatabase la
+    alternativa para varios nodos de API con una sola base de datos.
+    """
+
+    # Esquema y mantenimiento
+
+    @abstractmethod
+    def initialize(self):
+        """Crear las tablas e índices, y migrar los datos existentes"""
+
+    @abstractmethod
+    def ping(self) -> bool:
+        """Comprobar que la base de datos responde"""
+
+    @abstractmethod
+    def checkpoint(self):
+        """Tarea periódica de mantenimiento del registro de escrituras"""
+
+    @abstractmethod
+    def optimize(self):
+        """Tarea periódica de actualización de estadísticas del planificador"""
+
+    def close(self):
+        """Liberar los recursos del backend (conexiones) al detener la aplicación"""
+
+    def invalidate_caches(self):
+        """Descartar lecturas en cache tras escribir por fuera de estos métodos (importaciones)"""
+
+    def sync_id_sequences(self, tables: List[str]):
+        """Ajustar los generadores de ids tras insertar filas con id explícito"""
+
+    # Materias y temas
+
+    @abstractmethod
+    def create_subject(self, name: str, description: Optional[str] = None) -> Dict[str, Any]:
+        """Crear una materia"""
+
+    @abstractmethod
+    def get_subject(self, subject_id: int) -> Optional[Dict[str, Any]]:
+        """Obtener una materia por ID"""
+
+    @abstractmethod
+    def get_subject_version(self, subject_id: int) -> int:
+        """Versión de una materia (0 = listado de materias)"""
+
+    @abstractmethod
+    def get_all_subjects(
+        self,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Listar materias por cursor (limit + 1 filas para detectar la página siguiente)"""
+
+    @abstractmethod
+    def create_topic(self, subject_id: int, name: str, description: Optional[str] = None) -> Dict[str, Any]:
+        """Crear un tema"""
+
+    @abstractmethod
+    def get_topic(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        """Obtener un tema por ID"""
+
+    @abstractmethod
+    def get_topics_by_subject(
+        self,
+        subject_id: int,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Listar los temas de una materia por cursor"""
+
+    @abstractmethod
+    def save_topic_content(self, topic_id: int, content: str, source_file: str):
+        """Guardar el texto extraído de un PDF"""
+
+    @abstractmethod
+    def save_topic_contents(self, items: List[Dict[str, Any]]):
+        """Guardar el texto de varios PDFs en una sola transacción"""
+
+    @abstractmethod
+    def get_topic_content(self, topic_id: int) -> Optional[str]:
+        """Obtener el contenido más reciente de un tema"""
+
+    @abstractmethod
+    def get_topic_digest(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        """Resumen y esquema del material de un tema, con el hash del contenido resumido"""
+
+    @abstractmethod
+    def save_topic_digest(self, topic_id: int, content_hash: str, digest: str, outline: str, model: str, chunks: int):
+        """Guardar el resumen del material de un tema"""
+
+    # Sesiones y repaso
+
+    @abstractmethod
+    def save_generated_session(
+        self,
+        topic_id: int,
+        subject_id: int,
+        duration: int,
+        model: Optional[str],
+        prompt_hash: Optional[str],
+        payload: bytes
+    ) -> int:
+        """Guardar una sesión generada; devuelve su id"""
+
+    @abstractmethod
+    def get_generated_session(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """Sesión generada por id"""
+
+    @abstractmethod
+    def get_latest_generated_session(self, topic_id: int) -> Optional[Dict[str, Any]]:
+        """Última sesión generada de un tema"""
+
+    @abstractmethod
+    def record_session_completion(
+        self,
+        topic_id: int,
+        duration: int,
+        score: int,
+        total_questions: int,
+        generated_session_id: Optional[int] = None
+    ):
+        """Registrar una sesión completada y reprogramar el repaso del tema"""
+
+    @abstractmethod
+    def record_session_completions(self, completions: List[Dict[str, Any]]) -> List[int]:
+        """Registrar un lote de sesiones completadas, ignorando claves ya registradas"""
+
+    @abstractmethod
+    def get_due_topics(self, subject_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Temas que vencen primero en la cola de repaso"""
+
+    @abstractmethod
+    def get_topic_stats_columns(self, subject_ids: Optional[List[int]] = None) -> List[tuple]:
+        """Estadísticas numéricas por tema para la puntuación columnar"""
+
+    @abstractmethod
+    def get_topic_labels(self, topic_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Nombre y último estudio de unos pocos temas"""
+
+    @abstractmethod
+    def get_study_history(
+        self,
+        subject_id: int,
+        limit: Optional[int] = None,
+        cursor_token: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Historial de sesiones de una materia por cursor"""
+
+    @abstractmethod
+    def rebuild_daily_stats(self, subject_ids: Optional[List[int]] = None):
+        """Recalcular las estadísticas diarias desde el historial"""
+
+    @abstractmethod
+    def get_daily_stats(
+        self,
+        subject_id: int,
+        since: str,
+        until: str,
+        topic_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Estadísticas diarias de una materia o de un tema en un rango de días"""
+
+    @abstractmethod
+    def get_topic_daily_totals(self, subject_id: int, since: str, until: str) -> List[Dict[str, Any]]:
+        """Estadísticas por tema sumadas en un rango de días"""
+
+    @abstractmethod
+    def get_topic_statistics(self, topic_id: int) -> Dict[str, Any]:
+        """Sesiones, último estudio y desempeño medio de un tema"""
+
+    # Uso del LLM
+
+    @abstractmethod
+    def record_llm_calls(self, calls: List[Dict[str, Any]]):
+        """Registrar un lote de llamadas al LLM"""
+
+    @abstractmethod
+    def get_llm_usage(
+        self,
+        group_by: str,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        subject_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Agregar el uso del LLM por materia, tema, duración, día o modelo"""
+
+    # Banco de preguntas
+
+    @abstractmethod
+    def add_quiz_questions(self, topic_id: int, questions: List[Dict[str, Any]], source: str) -> int:
+        """Agregar preguntas ignorando duplicados; devuelve cuántas se insertaron"""
+
+    @abstractmethod
+    def get_quiz_question_ids(self, topic_id: int, hashes: List[str]) -> Dict[str, int]:
+        """Ids del banco para unos hashes de preguntas"""
+
+    @abstractmethod
+    def count_quiz_questions(self, topic_id: int) -> int:
+        """Preguntas disponibles en el banco del tema"""
+
+    @abstractmethod
+    def sample_quiz_questions(self, topic_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Tomar preguntas del banco y marcarlas como servidas"""
+
+    @abstractmethod
+    def record_quiz_answers(self, topic_id: int, answers: List[Dict[str, Any]]):
+        """Actualizar aciertos y fallos de las preguntas del banco del tema (las de otros temas se ignoran)"""
@@ -0,0 +1,424 @@
+"""
+Instrumentación: trazas por petición, métricas Prometheus y logging estructurado
+"""
+import asyncio
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# Identificador de la petición en curso (se propaga a tareas hijas de asyncio)
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Lista de fases (nombre, segundos) acumuladas durante la petición en curso
+_phases_var: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("phases", default=None)
+
+# Perfil de la petición en curso, si se está perfilando (ver src/profiling.py)
+profile_var: ContextVar[Optional[Any]] = ContextVar("profile", default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Formatear etiquetas en sintaxis Prometheus"""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: Any) -> str:
+    """Escapar un valor de etiqueta"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """Formatear un valor numérico"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base común para métricas con etiquetas"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        """Convertir etiquetas a clave ordenada"""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Renderizar en formato de texto Prometheus"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contador monotónico"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Incrementar el contador"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        """Valor actual para un conjunto de etiquetas"""
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Medidor que puede subir y bajar, o calcularse al momento de exportar"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        """Fijar el valor del medidor"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Incrementar el medidor"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        """Decrementar el medidor"""
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            # El callback devuelve un número o un dict {tupla_etiquetas: valor}
+            result = self._callback()
+            if isinstance(result, dict):
+                items = list(result.items())
+            else:
+                items = [((), result)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # clave -> [conteos por bucket..., suma, total]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        """Registrar una observación"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            for i, bound in enumerate(self.buckets):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(state[i])}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro de métricas exportables en /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        """Obtener o crear un contador"""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        """Obtener o crear un medidor"""
+        return self._get_or_create(Gauge, name, documentation, labelnames, callback=callback)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Obtener o crear un histograma"""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Exportar todas las métricas en formato de texto Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "studysprint_http_requests_total",
+    "Peticiones HTTP atendidas",
+    ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "studysprint_http_request_duration_seconds",
+    "Latencia de peticiones HTTP",
+    ("method", "route")
+)
+SPAN_LATENCY = REGISTRY.histogram(
+    "studysprint_span_duration_seconds",
+    "Duración de cada fase instrumentada",
+    ("span",)
+)
+SPAN_ERRORS = REGISTRY.counter(
+    "studysprint_span_errors_total",
+    "Fases instrumentadas que terminaron con excepción",
+    ("span",)
+)
+
+logger = logging.getLogger("studysprint.trace")
+
+
+@contextmanager
+def span(name: str):
+    """Medir una fase y asociarla a la petición en curso"""
+    start = time.perf_counter()
+    profile = profile_var.get()
+    if profile is not None:
+        profile.enter_span(name)
+    try:
+        yield
+    except BaseException:
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if profile is not None:
+            profile.exit_span(name)
+        SPAN_LATENCY.observe(elapsed, span=name)
+        phases = _phases_var.get()
+        if phases is not None:
+            phases.append((name, elapsed))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span", extra={"fields": {"span": name, "duration_ms": round(elapsed * 1000, 2)}})
+
+
+def traced(name: str):
+    """Decorador que envuelve una función (síncrona o async) en un span"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_request(request_id: Optional[str] = None):
+    """Iniciar el contexto de trazas de una petición y devolver tokens para restaurarlo"""
+    request_id = request_id or uuid.uuid4().hex
+    return (
+        request_id_var.set(request_id),
+        _phases_var.set([])
+    )
+
+
+def finish_request(tokens) -> List[Tuple[str, float]]:
+    """Cerrar el contexto de trazas y devolver las fases registradas"""
+    phases = _phases_var.get() or []
+    request_token, phases_token = tokens
+    _phases_var.reset(phases_token)
+    request_id_var.reset(request_token)
+    return phases
+
+
+def summarize_phases(phases: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Agrupar fases por nombre en milisegundos totales"""
+    summary: Dict[str, float] = {}
+    for name, elapsed in phases:
+        summary[name] = summary.get(name, 0.0) + elapsed * 1000
+    return {name: round(ms, 2) for name, ms in summary.items()}
+
+
+def server_timing_header(summary: Dict[str, float]) -> str:
+    """Construir la cabecera Server-Timing a partir del resumen de fases"""
+    return ", ".join(
+        f"{name.replace(' ', '_')};dur={ms}" for name, ms in summary.items()
+    )
+
+
+class _RequestIdFilter(logging.Filter):
+    """Añadir el id de la petición a cada registro de log"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatear registros como una línea JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            payload["request_id"] = request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formatear registros como texto legible con campos clave=valor"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            line += f" request_id={request_id}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging():
+    """Configurar logging estructurado y asíncrono (escritura en un hilo aparte)
+
+    Se controla con LOG_LEVEL (por defecto INFO) y LOG_FORMAT (json o text).
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    formatter = StructuredFormatter() if os.getenv("LOG_FORMAT", "json") == "json" else TextFormatter()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    # El hilo de la petición solo encola el registro; el I/O ocurre en el listener
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+
+    root = logging.getLogger("studysprint")
+    root.setLevel(level)
+    root.handlers = [queue_handler]
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Vaciar la cola de logs y detener el hilo de escritura"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Obtener un logger dentro del espacio de nombres de la aplicación"""
+    return logging.getLogger(f"studysprint.{name}")
@@ -0,0 +1,254 @@
+"""
+Exportación e importación del conjunto de datos en JSONL
+
+Cada línea es un registro {"type": ..., columnas...}. La exportación recorre
+las tablas por id en páginas (memoria constante, sirve igual en SQLite y en
+PostgreSQL) y la importación inserta con executemany en transacciones
+grandes. Los ids se conservan o se reasignan; en ese caso solo se mantiene
+en memoria la correspondencia de materias y temas, nunca la de sesiones.
+"""
+import time
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple
+from src import fast_json
+from src.telemetry import get_logger
+
+logger = get_logger("transfer")
+
+# (tipo de registro, tabla, clave primaria, columnas) en orden de dependencias
+RECORD_TYPES: List[Tuple[str, str, str, Tuple[str, ...]]] = [
+    ("subject", "subjects", "id", ("id", "name", "description", "created_at")),
+    ("topic", "topics", "id", ("id", "subject_id", "name", "description", "created_at")),
+    ("content", "topic_content", "id", ("id", "topic_id", "content", "source_file", "created_at")),
+    ("session", "study_sessions", "id", (
+        "id", "topic_id", "subject_id", "duration", "score", "total_questions", "completed_at"
+    )),
+    ("schedule", "topic_schedule", "topic_id", (
+        "topic_id", "subject_id", "stability", "ease", "repetitions", "lapses", "due_at", "last_reviewed_at"
+    )),
+]
+_BY_TYPE = {record_type: (table, key, columns) for record_type, table, key, columns in RECORD_TYPES}
+
+# Filtro por materia de cada tabla (las sesiones y el repaso tienen la materia desnormalizada)
+_SUBJECT_FILTERS = {
+    "subjects": "id IN ({ids})",
+    "topics": "subject_id IN ({ids})",
+    "topic_content": "topic_id IN (SELECT id FROM topics WHERE subject_id IN ({ids}))",
+    "study_sessions": "subject_id IN ({ids})",
+    "topic_schedule": "subject_id IN ({ids})",
+}
+
+
+def export_records(database, out: IO[bytes], subject_ids: Optional[List[int]] = None, page_size: int = 5000) -> Dict[str, int]:
+    """Escribir todos los registros (o los de unas materias) en out; devuelve cuántos por tipo"""
+    counts: Dict[str, int] = {}
+    for record_type, table, key, columns in RECORD_TYPES:
+        counts[record_type] = 0
+        for rows in _pages(database, table, key, columns, subject_ids, page_size):
+            out.write(b"".join(
+                fast_json.dumps({"type": record_type, **dict(zip(columns, row))}) + b"\n"
+                for row in rows
+            ))
+            counts[record_type] += len(rows)
+        logger.info("exported", extra={"fields": {"type": record_type, "rows": counts[record_type]}})
+    return counts
+
+
+def _pages(database, table: str, key: str, columns: Tuple[str, ...], subject_ids: Optional[List[int]], page_size: int) -> Iterator[List[tuple]]:
+    """Recorrer una tabla por su clave primaria en páginas de page_size filas"""
+    conditions = [f"{key} > ?"]
+    if subject_ids:
+        conditions.append(_SUBJECT_FILTERS[table].format(ids=",".join(str(int(i)) for i in subject_ids)))
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE {' AND '.join(conditions)} ORDER BY {key} LIMIT ?"
+    key_index = columns.index(key)
+    width = range(len(columns))
+    last = -1
+    while True:
+        conn = database.get_connection()
+        try:
+            # Por posición: las filas de PostgreSQL son diccionarios y tuple() daría las claves
+            rows = [tuple(row[i] for i in width) for row in conn.cursor().execute(sql, (last, page_size)).fetchall()]
+        finally:
+            conn.close()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][key_index]
+        if len(rows) < page_size:
+            return
+
+
+class DatasetImporter:
+    """Carga un JSONL exportado en la base de datos
+
+    Con remap_ids=False se insertan los ids del archivo: las filas cuyo id ya
+    existe se omiten y, si es una materia o un tema, también todo lo que
+    cuelga de ella (si no, quedaría dentro de la materia que ya tenía ese id).
+    Para combinar con datos existentes hay que usar remap_ids=True, que crea
+    ids nuevos y traduce las referencias.
+    """
+
+    def __init__(
+        self,
+        database,
+        remap_ids: bool = False,
+        subject_ids: Optional[List[int]] = None,
+        batch_size: int = 5000,
+        commit_every: int = 100000
+    ):
+        self.db = database
+        self.remap_ids = remap_ids
+        self.subject_ids: Optional[Set[int]] = set(subject_ids) if subject_ids else None
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        # Correspondencia de ids del archivo -> ids nuevos (solo al reasignar)
+        self.subject_map: Dict[int, int] = {}
+        self.topic_map: Dict[int, int] = {}
+        # Temas aceptados por el filtro de materias, para filtrar su contenido
+        self._kept_topics: Set[int] = set()
+        # Materias y temas omitidos porque su id ya existía: sus filas hijas también se omiten
+        self._skipped_subjects: Set[int] = set()
+        self._skipped_topics: Set[int] = set()
+        self.touched_subjects: Set[int] = set()
+        self.counts: Dict[str, Dict[str, int]] = {
+            record_type: {"read": 0, "inserted": 0, "skipped": 0} for record_type, *_ in RECORD_TYPES
+        }
+
+    def run(self, lines: Iterable[bytes]) -> Dict[str, Dict[str, int]]:
+        """Importar las líneas y devolver las filas leídas, insertadas y omitidas por tipo"""
+        start = time.perf_counter()
+        self.db.initialize()
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            pending_type: Optional[str] = None
+            batch: List[Dict[str, Any]] = []
+            uncommitted = 0
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                record = fast_json.loads(line)
+                record_type = record.pop("type", None)
+                if record_type not in _BY_TYPE:
+                    raise ValueError(f"Unknown record type: {record_type!r}")
+                if record_type != pending_type or len(batch) >= self.batch_size:
+                    uncommitted += self._write(conn, cursor, pending_type, batch)
+                    batch = []
+                    pending_type = record_type
+                    if uncommitted >= self.commit_every:
+                        conn.commit()
+                        uncommitted = 0
+                self.counts[record_type]["read"] += 1
+                batch.append(record)
+            self._write(conn, cursor, pending_type, batch)
+
+            for subject_id in sorted(self.touched_subjects) + [0]:
+                self.db._bump_version(cursor, subject_id)
+            conn.commit()
+        finally:
+            conn.close()
+
+        # Los temas importados sin su estado de repaso lo reconstruyen desde el historial
+        self.db.initialize()
+        self.db.rebuild_daily_stats(sorted(self.touched_subjects))
+        if not self.remap_ids:
+            self.db.sync_id_sequences([table for _, table, _, _ in RECORD_TYPES])
+        self.db.invalidate_caches()
+        logger.info("import finished", extra={"fields": {
+            "seconds": round(time.perf_counter() - start, 2),
+            "rows": sum(count["inserted"] for count in self.counts.values())
+        }})
+        return self.counts
+
+    def _write(self, conn, cursor, record_type: Optional[str], batch: List[Dict[str, Any]]) -> int:
+        """Insertar un lote de registros del mismo tipo; devuelve cuántos se enviaron"""
+        if not batch:
+            return 0
+        table, key, columns = _BY_TYPE[record_type]
+        rows = [row for row in (self._prepare(record_type, record) for record in batch) if row is not None]
+        self.counts[record_type]["skipped"] += len(batch) - len(rows)
+        if not rows:
+            return 0
+
+        if self.remap_ids and record_type in ("subject", "topic"):
+            # Fila a fila para conocer el id nuevo; son pocas comparadas con las sesiones
+            insert_columns = columns[1:]
+            sql = f"INSERT INTO {table} ({', '.join(insert_columns)}) VALUES ({', '.join('?' for _ in insert_columns)})"
+            id_map = self.subject_map if record_type == "subject" else self.topic_map
+            for row in rows:
+                cursor.execute(sql, row[1:])
+                id_map[row[0]] = cursor.lastrowid
+                if record_type == "subject":
+                    self.touched_subjects.add(cursor.lastrowid)
+            self.counts[record_type]["inserted"] += len(rows)
+            return len(rows)
+
+        if not self.remap_ids and record_type in ("subject", "topic"):
+            existing = self._existing_ids(cursor, table, [row[0] for row in rows])
+            if existing:
+                (self._skipped_subjects if record_type == "subject" else self._skipped_topics).update(existing)
+                self.counts[record_type]["skipped"] += sum(1 for row in rows if row[0] in existing)
+                rows = [row for row in rows if row[0] not in existing]
+                if not rows:
+                    return 0
+
+        insert_columns = columns
+        if self.remap_ids and key == "id":
+            insert_columns = columns[1:]
+            rows = [row[1:] for row in rows]
+        sql = (
+            f"INSERT INTO {table} ({', '.join(insert_columns)}) VALUES ({', '.join('?' for _ in insert_columns)}) "
+            f"ON CONFLICT ({key}) DO NOTHING"
+        )
+        before = conn.total_changes
+        cursor.executemany(sql, rows)
+        inserted = conn.total_changes - before
+        self.counts[record_type]["inserted"] += inserted
+        self.counts[record_type]["skipped"] += len(rows) - inserted
+        return len(rows)
+
+    def _prepare(self, record_type: str, record: Dict[str, Any]) -> Optional[tuple]:
+        """Aplicar el filtro de materias y la traducción de ids; None si la fila se omite"""
+        _, _, columns = _BY_TYPE[record_type]
+        record = dict(record)
+        subject_id = record.get("id") if record_type == "subject" else record.get("subject_id")
+
+        if record_type == "content":
+            if self.subject_ids is not None and record["topic_id"] not in self._kept_topics:
+                return None
+        elif self.subject_ids is not None and subject_id not in self.subject_ids:
+            return None
+        if not self.remap_ids and (
+            (record_type != "subject" and subject_id in self._skipped_subjects)
+            or record.get("topic_id") in self._skipped_topics
+        ):
+            # Cuelga de una materia o un tema que ya existía con otro contenido
+            if record_type == "topic":
+                self._skipped_topics.add(record["id"])
+            return None
+        if record_type == "topic":
+            self._kept_topics.add(record["id"])
+
+        if self.remap_ids:
+            if record.get("subject_id") is not None:
+                if record["subject_id"] not in self.subject_map:
+                    return None
+                record["subject_id"] = self.subject_map[record["subject_id"]]
+            if "topic_id" in record:
+                if record["topic_id"] not in self.topic_map:
+                    return None
+                record["topic_id"] = self.topic_map[record["topic_id"]]
+        elif subject_id is not None:
+            self.touched_subjects.add(subject_id)
+        return tuple(record.get(column) for column in columns)
+
+    @staticmethod
+    def _existing_ids(cursor, table: str, ids: List[int]) -> Set[int]:
+        """Ids de la lista que ya existen en la tabla"""
+        existing: Set[int] = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" for _ in chunk)
+            cursor.execute(f"SELECT id FROM {table} WHERE id IN ({placeholders})", chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
@@ -0,0 +1,233 @@
+"""
+Contabilidad de tokens y coste por llamada al LLM
+"""
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from src.telemetry import REGISTRY, get_logger
+
+logger = get_logger("usage")
+
+# Precio en USD por millón de tokens: (entrada, salida, entrada en caché)
+DEFAULT_PRICING: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+}
+
+LLM_TOKENS = REGISTRY.counter(
+    "studysprint_llm_tokens_total",
+    "Tokens consumidos en llamadas al LLM",
+    ("model", "kind", "type")
+)
+LLM_CALLS = REGISTRY.counter(
+    "studysprint_llm_calls_total",
+    "Llamadas al LLM realizadas",
+    ("model", "kind")
+)
+
+# Atributos de la generación en curso (materia, tema, duración)
+_usage_context: ContextVar[Dict[str, Any]] = ContextVar("usage_context", default={})
+
+
+@contextmanager
+def usage_context(**attrs):
+    """Asociar las llamadas al LLM dentro del bloque a una materia/tema/duración"""
+    token = _usage_context.set({**_usage_context.get(), **attrs})
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+
+def current_usage_context() -> Dict[str, Any]:
+    """Atributos de uso asociados al contexto actual"""
+    return _usage_context.get()
+
+
+def load_pricing() -> Dict[str, Tuple[float, float, float]]:
+    """Cargar la tabla de precios, permitiendo sobrescribirla con LLM_PRICING (JSON)"""
+    pricing = dict(DEFAULT_PRICING)
+    override = os.getenv("LLM_PRICING")
+    if override:
+        for model, prices in json.loads(override).items():
+            input_price, output_price = prices[0], prices[1]
+            cached_price = prices[2] if len(prices) > 2 else input_price
+            pricing[model] = (input_price, output_price, cached_price)
+    return pricing
+
+
+def estimate_cost(
+    pricing: Dict[str, Tuple[float, float, float]],
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_tokens: int = 0
+) -> Optional[float]:
+    """Estimar el coste en USD de una llamada; None si el modelo no tiene precio"""
+    prices = pricing.get(model)
+    if prices is None:
+        # Los modelos versionados (gpt-4o-mini-2024-07-18) usan el precio de su familia
+        family = max((name for name in pricing if model.startswith(name)), key=len, default=None)
+        if family is None:
+            return None
+        prices = pricing[family]
+    input_price, output_price, cached_price = prices
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (
+        uncached * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1_000_000
+
+
+class UsageRecorder:
+    """Registra el uso de cada llamada al LLM y lo escribe en lotes desde un hilo aparte"""
+
+    def __init__(self, database, batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        """Configurar el tamaño de lote y el intervalo máximo entre escrituras"""
+        self.db = database
+        self.batch_size = batch_size or int(os.getenv("USAGE_BATCH_SIZE", "50"))
+        self.flush_interval = flush_interval or float(os.getenv("USAGE_FLUSH_SECONDS", "2"))
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Arrancar el hilo de escritura"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Escribir lo pendiente y detener el hilo"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def record(
+        self,
+        kind: str,
+        model: str,
+        usage: Any,
+        latency_ms: float
+    ):
+        """Encolar el uso de una llamada (no bloquea la petición)"""
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+        LLM_CALLS.inc(model=model, kind=kind)
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind=kind, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, model=model, kind=kind, type="completion")
+        LLM_TOKENS.inc(cached_tokens, model=model, kind=kind, type="cached")
+
+        context = current_usage_context()
+        self._queue.put({
+            "kind": kind,
+            "model": model,
+            "subject_id": context.get("subject_id"),
+            "topic_id": context.get("topic_id"),
+            "duration": context.get("duration"),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_ms": round(latency_ms, 1),
+        })
+
+        # Sin hilo de escritura (p. ej. scripts), escribir de inmediato
+        if self._thread is None:
+            self._drain(block=False)
+
+    def _run(self):
+        """Bucle del hilo: agrupar registros hasta llenar el lote o vencer el intervalo"""
+        while True:
+            if not self._drain(block=True):
+                return
+
+    def _drain(self, block: bool) -> bool:
+        """Escribir un lote; devuelve False cuando se recibió la señal de parada"""
+        batch: List[Dict[str, Any]] = []
+        running = True
+        try:
+            item = self._queue.get(timeout=self.flush_interval) if block else self._queue.get_nowait()
+            if item is None:
+                running = False
+            else:
+                batch.append(item)
+            while running and len(batch) < self.batch_size:
+                item = self._queue.get_nowait()
+                if item is None:
+                    running = False
+                else:
+                    batch.append(item)
+        except queue.Empty:
+            pass
+
+        if batch:
+            try:
+                self.db.record_llm_calls(batch)
+            except Exception:
+                logger.exception("Error writing LLM usage batch", extra={"fields": {"rows": len(batch)}})
+
+        if not running:
+            # Vaciar lo que quede antes de salir
+            remaining = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    remaining.append(item)
+            if remaining:
+                self.db.record_llm_calls(remaining)
+        return running
+
+
+def summarize_usage(rows: List[Dict[str, Any]], pricing: Dict[str, Tuple[float, float, float]]) -> List[Dict[str, Any]]:
+    """Combinar filas agrupadas por (clave, modelo) en totales por clave con coste estimado"""
+    totals: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        entry = totals.setdefault(row["key"], {
+            "key": row["key"],
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "latency_ms": 0.0,
+            "estimated_cost_usd": 0.0,
+            "unpriced_calls": 0,
+        })
+        entry["calls"] += row["calls"]
+        entry["prompt_tokens"] += row["prompt_tokens"] or 0
+        entry["completion_tokens"] += row["completion_tokens"] or 0
+        entry["cached_tokens"] += row["cached_tokens"] or 0
+        entry["latency_ms"] += row["latency_ms"] or 0.0
+        cost = estimate_cost(
+            pricing,
+            row["model"],
+            row["prompt_tokens"] or 0,
+            row["completion_tokens"] or 0,
+            row["cached_tokens"] or 0
+        )
+        if cost is None:
+            entry["unpriced_calls"] += row["calls"]
+        else:
+            entry["estimated_cost_usd"] += cost
+
+    result = []
+    for entry in totals.values():
+        latency_total = entry.pop("latency_ms")
+        entry["avg_latency_ms"] = round(latency_total / entry["calls"], 1) if entry["calls"] else None
+        entry["estimated_cost_usd"] = round(entry["estimated_cost_usd"], 6)
+        result.append(entry)
+    return result
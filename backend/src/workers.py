@@ -0,0 +1,195 @@
+"""
+Coordinación entre procesos cuando la API corre con varios workers
+
+- FileLock: cerrojo de archivo entre procesos (fcntl en POSIX, msvcrt en Windows)
+- SharedEpoch: contador compartido en un archivo mapeado en memoria; cada
+  escritura lo incrementa y los demás procesos vacían su cache al verlo cambiar
+- LeaderScheduler: ejecuta tareas periódicas solo en el worker que obtiene
+  el cerrojo de líder; si ese worker muere, otro lo toma
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+from src.telemetry import REGISTRY, get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = get_logger("workers")
+
+SCHEDULER_RUNS = REGISTRY.counter(
+    "studysprint_scheduler_runs_total",
+    "Ejecuciones de tareas periódicas en el worker líder",
+    ("job", "status")
+)
+
+_EPOCH_FORMAT = "<Q"
+_EPOCH_SIZE = struct.calcsize(_EPOCH_FORMAT)
+
+
+class FileLock:
+    """Cerrojo exclusivo entre procesos sobre un archivo"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Tomar el cerrojo; con blocking=False devuelve False si otro proceso lo tiene"""
+        if self._file is not None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handle = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(handle.fileno(), flags)
+            else:
+                handle.seek(0)
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                while True:
+                    try:
+                        msvcrt.locking(handle.fileno(), mode, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK solo reintenta unos segundos; seguir esperando
+                        if not blocking:
+                            raise
+        except OSError:
+            handle.close()
+            return False
+        self._file = handle
+        return True
+
+    def release(self):
+        """Soltar el cerrojo"""
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedEpoch:
+    """Contador de 64 bits compartido entre procesos mediante un archivo mapeado
+
+    Leerlo es una lectura de memoria, sin llamadas al sistema, así que se
+    puede consultar en cada acierto de cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = FileLock(path + ".lock")
+        self._thread_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            with open(path, "a+b") as handle:
+                if os.path.getsize(path) < _EPOCH_SIZE:
+                    handle.write(b"\0" * (_EPOCH_SIZE - os.path.getsize(path)))
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), _EPOCH_SIZE)
+
+    def value(self) -> int:
+        """Valor actual del contador"""
+        return struct.unpack_from(_EPOCH_FORMAT, self._map, 0)[0]
+
+    def bump(self) -> Tuple[int, int]:
+        """Incrementar el contador; devuelve (valor anterior, valor nuevo)"""
+        with self._thread_lock, self._lock:
+            previous = self.value()
+            struct.pack_into(_EPOCH_FORMAT, self._map, 0, previous + 1)
+        return previous, previous + 1
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class LeaderScheduler:
+    """Tareas periódicas que corren en un único worker
+
+    Cada worker intenta tomar el cerrojo de líder sin bloquear; el que lo
+    consigue ejecuta las tareas y los demás reintentan cada cierto tiempo por
+    si el líder termina.
+    """
+
+    def __init__(self, lock_path: str, poll_interval: Optional[float] = None):
+        self.lock = FileLock(lock_path)
+        self.poll_interval = poll_interval or float(os.getenv("SCHEDULER_POLL_SECONDS", "5"))
+        self._jobs: List[List] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_job(self, name: str, interval: float, func: Callable[[], None]):
+        """Registrar una tarea que se ejecuta cada interval segundos"""
+        self._jobs.append([name, interval, func, time.monotonic() + interval])
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lock.held
+
+    def start(self):
+        """Arrancar el hilo del planificador"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el hilo y ceder el liderazgo"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.lock.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.lock.held and self.lock.acquire(blocking=False):
+                logger.info("leader acquired", extra={"fields": {"pid": os.getpid()}})
+            if self.lock.held:
+                self._run_due_jobs()
+            self._stop.wait(self.poll_interval)
+
+    def _run_due_jobs(self):
+        now = time.monotonic()
+        for job in self._jobs:
+            name, interval, func, next_run = job
+            if now < next_run:
+                continue
+            try:
+                func()
+                SCHEDULER_RUNS.inc(job=name, status="ok")
+            except Exception:
+                SCHEDULER_RUNS.inc(job=name, status="error")
+                logger.exception("Scheduled job failed", extra={"fields": {"job": name}})
+            job[3] = time.monotonic() + interval
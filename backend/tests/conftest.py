@@ -0,0 +1,46 @@
+"""
+Fixtures comunes de las pruebas del backend
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.database import Database
+from src.postgres import PostgresDatabase, is_postgres_url
+
+# Esquema propio de las pruebas: se borra y se recrea en cada prueba, sin tocar el resto de la base
+TEST_SCHEMA = "studysprint_test"
+
+
+def _postgres_storage():
+    database_url = os.getenv("DATABASE_URL")
+    if not is_postgres_url(database_url):
+        pytest.skip("DATABASE_URL no apunta a PostgreSQL")
+    import psycopg
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {TEST_SCHEMA}")
+    separator = "&" if "?" in database_url else "?"
+    return PostgresDatabase(f"{database_url}{separator}options=-csearch_path%3D{TEST_SCHEMA}")
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def storage(request, tmp_path):
+    """Base de datos vacía e inicializada, en SQLite y en PostgreSQL (si DATABASE_URL lo indica)"""
+    if request.param == "postgres":
+        database = _postgres_storage()
+    else:
+        database = Database(str(tmp_path / "study_agent.db"))
+    database.initialize()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def topic(storage):
+    """Materia con un tema, para las pruebas que registran sesiones"""
+    subject = storage.create_subject("Matemáticas", "Álgebra y cálculo")
+    return storage.create_topic(subject["id"], "Conjuntos", "Operaciones con conjuntos")
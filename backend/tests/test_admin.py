@@ -0,0 +1,28 @@
+"""
+Acceso a los endpoints de operación
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+OPERATIONAL_PATHS = ["/usage", "/cache/stats", "/admin/profiles", "/admin/memory"]
+
+
+@pytest.fixture
+def client():
+    # Sin lifespan: el token se comprueba antes de tocar la base de datos
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("path", OPERATIONAL_PATHS)
+def test_hidden_without_admin_token_configured(client, monkeypatch, path):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.get(path).status_code == 404
+
+
+@pytest.mark.parametrize("path", OPERATIONAL_PATHS)
+def test_rejects_wrong_admin_token(client, monkeypatch, path):
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={"X-Admin-Token": "nope"}).status_code == 403
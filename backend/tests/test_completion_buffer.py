@@ -0,0 +1,46 @@
+"""
+Registro local de finalizaciones de sesión
+"""
+import asyncio
+import os
+import threading
+
+from src.completion_buffer import CompletionBuffer
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.completions = []
+
+    def record_session_completions(self, completions):
+        self.completions.extend(completions)
+
+
+def test_cancelled_submit_is_flushed_once(tmp_path):
+    database = RecordingDatabase()
+    buffer = CompletionBuffer(database, str(tmp_path))
+    release = threading.Event()
+    fsync_files = buffer._fsync_files
+
+    def slow_fsync(segments):
+        release.wait(5)
+        fsync_files(segments)
+
+    buffer._fsync_files = slow_fsync
+
+    async def scenario():
+        buffer.start()
+        submit = asyncio.ensure_future(buffer.submit({"topic_id": 1, "score": 1, "total_questions": 1}))
+        await asyncio.sleep(0.05)
+        # El cliente se va mientras se espera el fsync
+        submit.cancel()
+        await asyncio.gather(submit, return_exceptions=True)
+        release.set()
+        await buffer.drain()
+
+    asyncio.run(scenario())
+
+    assert len(database.completions) == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".log")]
+    # Otro worker que arranque no tiene nada que reproducir
+    assert CompletionBuffer(database, str(tmp_path)).recover() == 0
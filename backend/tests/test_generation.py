@@ -0,0 +1,102 @@
+"""
+Generación de sesiones: peticiones simultáneas y cancelación
+"""
+import asyncio
+import types
+
+import pytest
+
+from src.agent import StudyAgent
+from src.disconnect import GENERATIONS_ABANDONED
+
+CONTENT = """OBJETIVO:
+Entender los conjuntos.
+
+CONTENIDO:
+## Introducción
+Un conjunto es una colección de elementos.
+
+CONCEPTOS CLAVE:
+- Conjunto vacío
+- Pertenencia
+"""
+QUIZ = """PREGUNTA 1:
+¿Qué es un conjunto?
+A) Una colección
+B) Un número
+C) Una función
+D) Nada
+CORRECTA: A
+"""
+
+
+class FakeCompletions:
+    """Sustituto de client.chat.completions que tarda delay segundos en responder"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.started = 0
+        self.finished = 0
+
+    async def create(self, model, messages, temperature, max_tokens, **kwargs):
+        self.started += 1
+        await asyncio.sleep(self.delay)
+        self.finished += 1
+        text = QUIZ if "PREGUNTA" in messages[-1]["content"] else CONTENT
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))],
+            usage=None,
+            model=model
+        )
+
+
+def make_agent(storage, delay: float = 0.05, coalesce: bool = False):
+    agent = StudyAgent(storage)
+    if coalesce:
+        agent.coalesce = True
+    completions = FakeCompletions(delay)
+    agent.llm.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    return agent, completions
+
+
+async def generate_twice(agent, topic):
+    sessions = await asyncio.gather(
+        agent.generate_study_session(topic["subject_id"], topic["id"], 15),
+        agent.generate_study_session(topic["subject_id"], topic["id"], 15),
+    )
+    await agent.question_bank.drain()
+    return sessions
+
+
+def test_concurrent_requests_get_distinct_sessions(storage, topic, monkeypatch):
+    # Sin GENERATION_COALESCE cada petición genera su propia sesión
+    monkeypatch.delenv("GENERATION_COALESCE", raising=False)
+    agent, _ = make_agent(storage)
+    first, second = asyncio.run(generate_twice(agent, topic))
+    assert first.session_id is not None and second.session_id is not None
+    assert first.session_id != second.session_id
+
+
+def test_coalesced_requests_share_one_session(storage, topic):
+    agent, _ = make_agent(storage, coalesce=True)
+    first, second = asyncio.run(generate_twice(agent, topic))
+    assert first.session_id == second.session_id
+
+
+def test_cancelled_waiter_cancels_generation(storage, topic):
+    agent, completions = make_agent(storage, delay=1.0)
+    cancelled = GENERATIONS_ABANDONED.value(outcome="cancelled")
+
+    async def scenario():
+        waiter = asyncio.ensure_future(agent.generate_study_session(topic["subject_id"], topic["id"], 15))
+        await asyncio.sleep(0.1)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # Dar tiempo a que la cancelación llegue a la llamada al LLM
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert completions.started == 1
+    assert completions.finished == 0
+    assert GENERATIONS_ABANDONED.value(outcome="cancelled") == cancelled + 1
@@ -0,0 +1,54 @@
+"""
+Historial de sesiones de una materia
+"""
+import pytest
+
+
+def test_history_hides_internal_columns(storage, topic):
+    storage.record_session_completions([{
+        "completion_key": "internal-key",
+        "topic_id": topic["id"],
+        "duration": 15,
+        "score": 2,
+        "total_questions": 3,
+        "completed_at": 1_700_000_000,
+        "answers": [],
+    }])
+
+    (row,) = storage.get_study_history(topic["subject_id"], limit=10)
+    assert "completion_key" not in row
+    assert row["topic_name"] == "Conjuntos"
+    assert (row["score"], row["total_questions"], row["duration"]) == (2, 3, 15)
+
+
+def _completion(topic, key, completed_at):
+    return {
+        "completion_key": key,
+        "topic_id": topic["id"],
+        "duration": 15,
+        "score": 1,
+        "total_questions": 1,
+        "completed_at": completed_at,
+        "answers": [],
+    }
+
+
+def test_history_date_filters_accept_iso_8601(storage, topic):
+    # 2023-11-14 22:13:20 y 2023-11-15 22:13:20 UTC
+    storage.record_session_completions([
+        _completion(topic, "first", 1_700_000_000),
+        _completion(topic, "second", 1_700_086_400),
+    ])
+
+    for since in ("2023-11-15", "2023-11-15T00:00:00Z", "2023-11-15T01:00:00+01:00", "2023-11-15 00:00:00"):
+        rows = storage.get_study_history(topic["subject_id"], limit=10, since=since)
+        assert [row["completed_at"][:10] for row in rows] == ["2023-11-15"], since
+    rows = storage.get_study_history(topic["subject_id"], limit=10, until="2023-11-14T23:00:00Z")
+    assert len(rows) == 1
+
+
+def test_history_rejects_invalid_dates(storage, topic):
+    with pytest.raises(ValueError):
+        storage.get_study_history(topic["subject_id"], limit=10, since="yesterday")
+    with pytest.raises(ValueError):
+        storage.get_all_subjects(until="2023-13-01")
@@ -0,0 +1,80 @@
+"""
+Importación masiva a través del pool de procesos
+"""
+import asyncio
+import io
+import zipfile
+
+from starlette.datastructures import UploadFile
+
+from src.container import Container
+from src.importer import MaterialImporter
+
+
+def make_pdf(text: str) -> bytes:
+    """PDF mínimo de una página con el texto dado"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+def test_import_through_pool_after_startup(tmp_path, monkeypatch):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.setenv("IMPORT_WORKERS", "2")
+    container = Container(str(tmp_path / "study_agent.db"))
+    # Arrancar primero: el pool se crea con los hilos de fondo ya en marcha
+    container.startup()
+
+    async def scenario():
+        try:
+            subject = container.db.create_subject("Matemáticas", "")
+            uploads = [
+                UploadFile(io.BytesIO(make_pdf("Los conjuntos agrupan elementos")), filename="01_Conjuntos.pdf"),
+                UploadFile(io.BytesIO(make_pdf("Una funcion asigna valores")), filename="02_Funciones.pdf"),
+            ]
+            results = await asyncio.wait_for(container.importer.import_files(subject["id"], uploads), timeout=60)
+            topics = {topic["name"]: topic for topic in container.db.get_topics_by_subject(subject["id"])}
+            return results, container.db.get_topic_content(topics["Conjuntos"]["id"])
+        finally:
+            await container.shutdown()
+
+    results, content = asyncio.run(scenario())
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert "conjuntos" in content
+    assert container.import_executor._mp_context.get_start_method() == "spawn"
+
+
+def test_corrupt_zip_member_is_reported_and_skipped(storage):
+    first = make_pdf("Los conjuntos agrupan elementos")
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("01_Conjuntos.pdf", first)
+        archive.writestr("02_Funciones.pdf", make_pdf("Una funcion asigna valores"))
+    # Cambiar un byte del primer miembro: su CRC-32 deja de cuadrar
+    data = bytearray(buffer.getvalue())
+    offset = bytes(data).index(first) + 20
+    data[offset] ^= 0xFF
+
+    subject = storage.create_subject("Matemáticas", "")
+    upload = UploadFile(io.BytesIO(bytes(data)), filename="material.zip")
+    results = asyncio.run(MaterialImporter(storage).import_files(subject["id"], [upload]))
+
+    statuses = {result["filename"]: result["status"] for result in results}
+    assert statuses == {"01_Conjuntos.pdf": "error", "02_Funciones.pdf": "ok"}
+    assert "CRC" in next(result["error"] for result in results if result["status"] == "error")
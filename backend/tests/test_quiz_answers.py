@@ -0,0 +1,60 @@
+"""
+Estadísticas del banco de preguntas al registrar respuestas
+"""
+from src.question_bank import question_hash
+
+
+def add_question(storage, topic_id: int, text: str) -> int:
+    question = {
+        "question": text,
+        "options": ["Sí", "No", "Quizá", "Nunca"],
+        "correct_answer": 0,
+        "question_hash": question_hash(text),
+    }
+    storage.add_quiz_questions(topic_id, [question], source="test")
+    return storage.get_quiz_question_ids(topic_id, [question["question_hash"]])[question["question_hash"]]
+
+
+def answer_counts(storage, question_id: int):
+    conn = storage.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT times_correct, times_wrong FROM quiz_questions WHERE id = ?", (question_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row["times_correct"], row["times_wrong"]
+
+
+def test_answers_update_own_topic(storage, topic):
+    question_id = add_question(storage, topic["id"], "¿Qué es un conjunto?")
+    storage.record_quiz_answers(topic["id"], [
+        {"question_id": question_id, "correct": True},
+        {"question_id": question_id, "correct": False},
+    ])
+    assert answer_counts(storage, question_id) == (1, 1)
+
+
+def test_answers_to_foreign_questions_are_ignored(storage, topic):
+    other = storage.create_topic(topic["subject_id"], "Funciones", "")
+    foreign_id = add_question(storage, other["id"], "¿Qué es una función?")
+    storage.record_quiz_answers(topic["id"], [{"question_id": foreign_id, "correct": True}])
+    assert answer_counts(storage, foreign_id) == (0, 0)
+
+
+def test_batched_completions_ignore_foreign_questions(storage, topic):
+    own_id = add_question(storage, topic["id"], "¿Qué es un conjunto?")
+    other = storage.create_topic(topic["subject_id"], "Funciones", "")
+    foreign_id = add_question(storage, other["id"], "¿Qué es una función?")
+    storage.record_session_completions([{
+        "completion_key": "k1",
+        "topic_id": topic["id"],
+        "duration": 10,
+        "score": 1,
+        "total_questions": 2,
+        "completed_at": 1_700_000_000,
+        "answers": [
+            {"question_id": own_id, "correct": True},
+            {"question_id": foreign_id, "correct": False},
+        ],
+    }])
+    assert answer_counts(storage, own_id) == (1, 0)
+    assert answer_counts(storage, foreign_id) == (0, 0)
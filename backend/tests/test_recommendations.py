@@ -0,0 +1,43 @@
+"""
+Recomendaciones de una materia a partir de la cola de repaso
+"""
+import time
+
+import pytest
+
+from src.agent import StudyAgent
+
+
+def _complete(storage, topic, key, score, completed_at):
+    storage.record_session_completions([{
+        "completion_key": key,
+        "topic_id": topic["id"],
+        "duration": 15,
+        "score": score,
+        "total_questions": 5,
+        "completed_at": completed_at,
+        "answers": [],
+    }])
+
+
+def test_scores_follow_the_due_order(storage, topic, monkeypatch):
+    subject_id = topic["subject_id"]
+    forgotten = storage.create_topic(subject_id, "Funciones", "Dominio e imagen")
+    learned = storage.create_topic(subject_id, "Límites", "Límites laterales")
+    now = time.time()
+    _complete(storage, forgotten, "forgotten", 1, now - 10 * 86400)
+    _complete(storage, learned, "learned", 5, now - 3600)
+
+    agent = StudyAgent(storage)
+    monkeypatch.setattr(storage, "get_topic_statistics", lambda topic_id: pytest.fail("se consultaron estadísticas por tema"))
+    recommendations = agent.recommend_next_topics(subject_id, limit=3)
+
+    assert [r["topic_id"] for r in recommendations] == [forgotten["id"], topic["id"], learned["id"]]
+    scores = [r["priority_score"] for r in recommendations]
+    assert scores == sorted(scores, reverse=True)
+    assert recommendations[0]["lapses"] == 1
+    assert recommendations[0]["reason"] == "Repaso vencido hace 9 dias, Olvidado 1 veces"
+    assert recommendations[1]["reason"] == "Nunca estudiado"
+    assert recommendations[2]["reason"].startswith("Proximo repaso en ")
+    assert recommendations[2]["priority_score"] < 0
+
@@ -0,0 +1,22 @@
+"""
+Estadísticas por tema con sesiones sin preguntas
+"""
+
+
+def test_topic_statistics_skip_sessions_without_questions(storage, topic):
+    storage.record_session_completion(topic_id=topic["id"], duration=10, score=0, total_questions=0)
+    storage.record_session_completion(topic_id=topic["id"], duration=10, score=3, total_questions=4)
+
+    stats = storage.get_topic_statistics(topic["id"])
+    assert stats["session_count"] == 2
+    assert stats["avg_performance"] == 0.75
+
+
+def test_topic_stats_columns_with_only_empty_sessions(storage, topic):
+    storage.record_session_completion(topic_id=topic["id"], duration=10, score=0, total_questions=0)
+
+    (row,) = storage.get_topic_stats_columns([topic["subject_id"]])
+    assert row[0] == topic["id"]
+    assert row[3] == 1
+    # Sin ninguna sesión con preguntas el promedio queda sin datos (-1)
+    assert row[5] == -1.0
@@ -0,0 +1,59 @@
+"""
+Exportación e importación del conjunto de datos
+"""
+import io
+
+from src.database import Database
+from src.transfer import DatasetImporter, export_records
+
+
+def exported_dataset(tmp_path) -> bytes:
+    """JSONL con dos materias ({Math: Alg}, {Bio: Cell}) y una sesión por tema"""
+    source = Database(str(tmp_path / "source.db"))
+    source.initialize()
+    for subject_name, topic_name in (("Math", "Alg"), ("Bio", "Cell")):
+        subject = source.create_subject(subject_name, "")
+        topic = source.create_topic(subject["id"], topic_name, "")
+        source.save_topic_content(topic["id"], f"Material de {topic_name}", f"{topic_name}.pdf")
+        source.record_session_completion(topic_id=topic["id"], duration=10, score=2, total_questions=3)
+    out = io.BytesIO()
+    export_records(source, out)
+    source.close()
+    return out.getvalue()
+
+
+def subject_topics(storage):
+    conn = storage.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT s.name AS subject, t.name AS topic
+        FROM topics t JOIN subjects s ON s.id = t.subject_id
+        ORDER BY s.name, t.name
+    """)
+    rows = [(row["subject"], row["topic"]) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+def test_id_preserving_import_skips_children_of_existing_ids(storage, tmp_path):
+    data = exported_dataset(tmp_path)
+    existing = storage.create_subject("Existing", "")
+    assert existing["id"] == 1
+
+    counts = DatasetImporter(storage).run(data.splitlines())
+
+    # Math tenía el id 1: ni la materia ni sus temas, contenido o sesiones se importan
+    assert subject_topics(storage) == [("Bio", "Cell")]
+    assert counts["subject"]["skipped"] == 1
+    assert counts["topic"]["skipped"] == 1
+    assert counts["session"]["inserted"] == 1
+    assert storage.get_study_history(existing["id"]) == []
+
+
+def test_remapped_import_keeps_everything(storage, tmp_path):
+    data = exported_dataset(tmp_path)
+    storage.create_subject("Existing", "")
+
+    DatasetImporter(storage, remap_ids=True).run(data.splitlines())
+
+    assert subject_topics(storage) == [("Bio", "Cell"), ("Math", "Alg")]
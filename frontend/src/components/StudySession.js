@@ -187,7 +187,13 @@ function StudySession({ subject, selectedTopic, preferredDuration, onComplete, o
         topic_id: session.topic_id,
         duration: session.duration,
         score: correctCount,
-        total_questions: session.quiz.length
+        total_questions: session.quiz.length,
+        answers: session.quiz
+          .map((question, index) => ({
+            question_id: question.id,
+            correct: quizAnswers[index] === question.correct_answer
+          }))
+          .filter((answer) => answer.question_id != null)
       });
     } catch (error) {
       console.error('Error recording session:', error);
@@ -122,9 +122,9 @@ function TopicManager({ subject, onBack, onStartStudy }) {
                 <div className="recommendation-content">
                   <strong>{rec.topic_name}</strong>
                   <p>{rec.reason}</p>
-                  {rec.average_performance !== null && (
+                  {rec.stability_days > 0 && (
                     <span className="recommendation-badge">
-                      Desempeño: {rec.average_performance}%
+                      Intervalo: {rec.stability_days} días
                     </span>
                   )}
                 </div>